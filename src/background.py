@@ -0,0 +1,182 @@
+import contextvars
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FuturesTimeoutError
+
+from constants import *
+
+# The job that the running code belongs to. Threads started by JobThreadPoolExecutor inherit it.
+_job = contextvars.ContextVar("job", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def current_job():
+    """
+    Return the job running in the current thread, or None if the code is not run in the background.
+    """
+    return _job.get()
+
+
+def report_progress(done, total):
+    """
+    Update the progress of the job running in the current thread. Does nothing outside a job.
+    """
+    job = current_job()
+    if job is not None:
+        job.progress = (done, total)
+
+
+def check_cancelled():
+    """
+    Raise JobCancelled if the job running in the current thread has been cancelled. Long running
+    commands call this between steps, since threads can only be stopped cooperatively.
+    """
+    job = current_job()
+    if job is not None and job.cancel_event.is_set():
+        raise JobCancelled("job {} was cancelled".format(job.id))
+
+
+class ThreadOutput:
+    """
+    Replaces sys.stdout or sys.stderr so that the output of each job is kept with the job instead
+    of being printed over the prompt. Output from any other thread goes to the original stream.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        job = current_job()
+        return job.output.write(text) if job is not None else self.stream.write(text)
+
+    def flush(self):
+        if current_job() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class JobThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    A ThreadPoolExecutor whose tasks run in the context of the thread that submitted them, so that
+    the threads a background job starts belong to the job: their output is kept with the job and
+    check_cancelled stops them when the job is cancelled.
+    """
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class Job:
+    def __init__(self, job_id, command, func):
+        self.id = job_id
+        self.command = command
+        self.func = func
+        self.output = io.StringIO()
+        self.progress = None
+        self.cancel_event = threading.Event()
+        self.exception = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.reported = False
+
+    def run(self):
+        token = _job.set(self)
+        self.started = time.time()
+        try:
+            check_cancelled()
+            self.func()
+        except Exception as exception:
+            self.exception = exception
+        finally:
+            self.finished = time.time()
+            _job.reset(token)
+
+    @property
+    def status(self):
+        if self.finished is None:
+            if self.cancel_event.is_set():
+                return "cancelling"
+            return "running" if self.started is not None else "queued"
+        if isinstance(self.exception, JobCancelled):
+            return "cancelled"
+        return "failed" if self.exception is not None else "done"
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0
+        return (self.finished if self.finished is not None else time.time()) - self.started
+
+    def wait(self, timeout=None):
+        """
+        :return: True if the job has finished
+        """
+        try:
+            self.future.result(timeout)
+        except CancelledError:
+            pass
+        except FuturesTimeoutError:
+            return False
+        return True
+
+    def cancel(self):
+        self.cancel_event.set()
+        # Jobs that have not started are dropped from the queue right away
+        if self.future.cancel():
+            self.exception = JobCancelled("job {} was cancelled".format(self.id))
+            self.finished = time.time()
+
+
+class JobManager:
+    """
+    Runs commands in the background on a bounded pool of threads.
+    """
+    def __init__(self, max_workers=BACKGROUND_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = dict()
+        self.next_id = 1
+        self.output_captured = False
+
+    def capture_output(self):
+        if not self.output_captured:
+            sys.stdout = ThreadOutput(sys.stdout)
+            sys.stderr = ThreadOutput(sys.stderr)
+            self.output_captured = True
+
+    def submit(self, command, func):
+        self.capture_output()
+        job = Job(self.next_id, command, func)
+        self.next_id += 1
+        self.jobs[job.id] = job
+        job.future = self.executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def running(self):
+        return [job for job in self.jobs.values() if job.finished is None]
+
+    def unreported(self):
+        """
+        Return the jobs that have finished since the last call.
+        """
+        finished = [job for job in self.jobs.values() if job.finished is not None and not job.reported]
+        for job in finished:
+            job.reported = True
+        return finished
+
+    def remove(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    def shutdown(self):
+        for job in self.running():
+            job.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,149 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from background import JobThreadPoolExecutor
+from constants import *
+from fund import Fund
+from logger import logger
+
+prediction_history_columns = ["timestamp", "fund_code", "prediction", "confidence"]
+stock_score_history_columns = ["timestamp", "fund_code", "stock_code", "name", "sentiment_score",
+                               "position_ratio", "weighted_score", "coverage"]
+
+
+def append_to_csv(df, file_path):
+    df.to_csv(file_path, mode="a", header=not os.path.exists(file_path), index=False, encoding="utf-8")
+
+
+def record_prediction(fund_code, prediction, confidence, contributions, timestamp=None):
+    """
+    Append the overall prediction of a fund and the scores of its stocks to the
+    prediction history in data/predictions.csv and data/stock_scores.csv.
+    :param contributions: the prediction contribution of each stock, keyed by stock code
+    """
+    timestamp = datetime.now() if timestamp is None else timestamp
+    append_to_csv(pd.DataFrame([[timestamp, fund_code, prediction, confidence]],
+                               columns=prediction_history_columns), PREDICTION_HISTORY_FILE)
+    stock_scores = pd.DataFrame([dict(stock_code=code, **contribution) for code, contribution in contributions.items()])
+    stock_scores.insert(0, "fund_code", fund_code)
+    stock_scores.insert(0, "timestamp", timestamp)
+    append_to_csv(stock_scores[stock_score_history_columns], STOCK_SCORE_HISTORY_FILE)
+    logger.log("Saved prediction for {} to the prediction history".format(fund_code))
+
+
+def load_predictions(file_path=PREDICTION_HISTORY_FILE):
+    if not os.path.exists(file_path):
+        return pd.DataFrame(columns=prediction_history_columns)
+    return pd.read_csv(file_path, dtype={"fund_code": str}, parse_dates=["timestamp"], encoding="utf-8")
+
+
+def forward_yields(yields, horizon=1):
+    """
+    Compute for each fund and trading day the sum of the daily yields of that day
+    and the following horizon - 1 trading days.
+    :param yields: a dataframe with the columns fund_code, date and daily_yield
+    :return: the sorted dataframe with an extra column forward_yield
+    """
+    yields = yields.sort_values(by=["fund_code", "date"]).reset_index(drop=True)
+    grouped = yields.groupby("fund_code")["daily_yield"]
+    # Windows that run past the latest trading day stay NaN
+    total = sum(grouped.shift(-i) for i in range(horizon))
+    yields["forward_yield"] = total
+    return yields
+
+
+def backtest(predictions, yields, horizon=1):
+    """
+    Match each prediction with the realized yield of its fund over the trading days
+    after it was made and measure how well the predictions did.
+    :param predictions: a dataframe with the columns timestamp, fund_code and prediction
+    :param yields: a dataframe with the columns fund_code, date and daily_yield
+    :param horizon: number of trading days after the prediction the yields are summed over
+    :return: a tuple (dictionary of metrics, dataframe of matched predictions)
+    """
+    predictions = predictions.copy()
+    yields = yields.copy()
+    # merge_asof requires both sides to use the same datetime resolution
+    predictions["timestamp"] = pd.to_datetime(predictions["timestamp"]).astype("datetime64[ns]")
+    yields["date"] = pd.to_datetime(yields["date"]).astype("datetime64[ns]")
+    # Only the last prediction of a fund on any day counts
+    predictions["date"] = predictions["timestamp"].dt.normalize()
+    predictions = predictions.sort_values(by="timestamp").drop_duplicates(["fund_code", "date"], keep="last")
+    # The first trading day that counts is the day after the prediction
+    predictions["target_date"] = predictions["date"] + pd.Timedelta(days=1)
+    predictions = predictions.sort_values(by="target_date")
+
+    targets = forward_yields(yields, horizon).dropna(subset=["forward_yield"]).sort_values(by="date")
+    matched = pd.merge_asof(predictions, targets[["fund_code", "date", "forward_yield"]].rename(
+        columns={"date": "yield_date"}), left_on="target_date", right_on="yield_date", by="fund_code",
+        direction="forward", allow_exact_matches=True)
+    matched = matched.dropna(subset=["forward_yield"])
+    # A match that lies too far in the future belongs to a later prediction window
+    matched = matched[matched["yield_date"] - matched["target_date"] <= pd.Timedelta(days=7)]
+
+    predicted = matched["prediction"].to_numpy(dtype=float)
+    realized = matched["forward_yield"].to_numpy(dtype=float)
+    metrics = dict(samples=len(matched), funds=matched["fund_code"].nunique(), hit_rate=np.nan,
+                   correlation=np.nan, rank_ic=np.nan, ic=np.nan)
+    if len(matched) == 0:
+        return metrics, matched
+
+    directional = (predicted != 0) & (realized != 0)
+    if directional.any():
+        metrics["hit_rate"] = float(np.mean(np.sign(predicted[directional]) == np.sign(realized[directional])))
+    if len(matched) > 1 and predicted.std() > 0 and realized.std() > 0:
+        metrics["correlation"] = float(np.corrcoef(predicted, realized)[0, 1])
+        metrics["rank_ic"] = float(matched["prediction"].rank().corr(matched["forward_yield"].rank()))
+
+    # Information coefficient: rank correlation across funds on the same day, averaged over days
+    ranks = pd.DataFrame(dict(
+        date=matched["date"],
+        prediction=matched.groupby("date")["prediction"].rank(),
+        realized=matched.groupby("date")["forward_yield"].rank()
+    ))
+    grouped = ranks.groupby("date")
+    ranks["prediction"] -= grouped["prediction"].transform("mean")
+    ranks["realized"] -= grouped["realized"].transform("mean")
+    ranks["covariance"] = ranks["prediction"] * ranks["realized"]
+    ranks["prediction"] **= 2
+    ranks["realized"] **= 2
+    sums = ranks.groupby("date")[["covariance", "prediction", "realized"]].sum()
+    denominator = np.sqrt(sums["prediction"] * sums["realized"])
+    daily_ic = (sums["covariance"] / denominator)[denominator > 0]
+    if len(daily_ic) > 0:
+        metrics["ic"] = float(daily_ic.mean())
+    return metrics, matched
+
+
+def fetch_daily_yields(fund_codes, funds=None):
+    """
+    Collect the daily yields of the given funds into a single dataframe with the columns
+    fund_code, date and daily_yield.
+    :param funds: a dictionary of Fund objects that have already been created, keyed by fund code
+    :return: a tuple (dataframe, list of tuples (fund code, exception) of the funds that were skipped)
+    """
+    funds = dict() if funds is None else funds
+    failures = []
+
+    def fetch(code):
+        try:
+            fund = funds[code] if code in funds else Fund(code)
+            data = fund.historical_data
+            if data is None:
+                raise ConnectionError("historical data on {} is not available".format(code))
+        except Exception as exception:
+            logger.log("Failed to fetch daily yields of {}: {}".format(code, exception), "error")
+            failures.append((code, exception))
+            return None
+        data = data[["date", "daily_yield"]].copy()
+        data.insert(0, "fund_code", code)
+        return data
+
+    with JobThreadPoolExecutor(max_workers=4) as executor:
+        frames = [frame for frame in executor.map(fetch, fund_codes) if frame is not None]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=["fund_code", "date", "daily_yield"]), failures
+    return pd.concat(frames, ignore_index=True), failures
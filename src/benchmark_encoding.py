@@ -0,0 +1,88 @@
+import argparse
+import time
+
+import requests
+from requests.utils import get_encoding_from_headers
+
+from page_encoding import EncodingDetector
+from utils import get_page_encoding
+
+TEXT = "基金净值今日上涨，白酒板块领涨，多只股票创新高。分析人士认为市场情绪回暖，后市仍需关注业绩。"
+
+
+def make_page(encoding, size, meta=True):
+    head = "<html><head>{}<title>新闻</title></head><body>".format(
+        '<meta http-equiv="Content-Type" content="text/html; charset={}">'.format(encoding) if meta else "")
+    paragraph = "<p>{}</p>\n".format(TEXT)
+    body = paragraph * (size // len(paragraph.encode(encoding)) + 1)
+    return (head + body + "</body></html>").encode(encoding)
+
+
+def make_response(content, content_type, url):
+    response = requests.models.Response()
+    response._content = content
+    response.status_code = 200
+    response.url = url
+    if content_type is not None:
+        response.headers["Content-Type"] = content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    return response
+
+
+def synthetic_cases(size):
+    """
+    :return: a list of tuples (description, body, Content-Type header, url)
+    """
+    return [
+        ("GBK page with <meta>, no Content-Type", make_page("gbk", size), None, "http://a.example.com/1"),
+        ("GBK page without any charset", make_page("gbk", size, meta=False), None, "http://b.example.com/1"),
+        ("GBK page, charset in Content-Type", make_page("gbk", size), "text/html; charset=GBK", "http://c.example.com/1"),
+        ("UTF-8 page with <meta>, no Content-Type", make_page("utf-8", size), None, "http://d.example.com/1"),
+    ]
+
+
+def time_function(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def benchmark(cases, repeat):
+    print("{:<42} {:>8} {:>12} {:>12} {:>12} {:>8}".format("Case", "KB", "current ms", "cold ms", "cached ms",
+                                                           "same"))
+    for description, content, content_type, url in cases:
+        def current():
+            response = make_response(content, content_type, url)
+            return response.content.decode(get_page_encoding(response), errors="ignore")
+
+        def cold():
+            # A new detector every time, so that pages without a charset always go through chardet
+            return EncodingDetector().decode(content, content_type, url)
+
+        detector = EncodingDetector()
+        detector.decode(content, content_type, url)
+
+        def cached():
+            return detector.decode(content, content_type, url)
+
+        current_time, current_text = time_function(current, repeat)
+        cold_time, cold_text = time_function(cold, repeat)
+        cached_time, _ = time_function(cached, repeat)
+        print("{:<42} {:>8.0f} {:>12.2f} {:>12.2f} {:>12.2f} {:>8}".format(
+            description, len(content) / 1024, current_time * 1000, cold_time * 1000, cached_time * 1000,
+            str(current_text == cold_text)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares the time taken to decode news pages by get_page_encoding "
+                                                 "and by the EncodingDetector.")
+    parser.add_argument("urls", nargs="*", help="urls of pages to benchmark in addition to the synthetic pages")
+    parser.add_argument("--size", type=int, default=300 * 1024, help="size of the synthetic pages in bytes")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times each page is decoded")
+    args = parser.parse_args()
+    cases = synthetic_cases(args.size)
+    for url in args.urls:
+        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        cases.append((url[:42], response.content, response.headers.get("Content-Type"), url))
+    benchmark(cases, args.repeat)
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from background import JobThreadPoolExecutor, check_cancelled, report_progress, JobCancelled
+from fund import Fund
+from logger import logger
+from utils import *
+
+
+def get_chart_path(fund_code, selected_columns, months, file_format="png", directory=CHART_DIR):
+    return os.path.join(directory, "{}_{}_{}m.{}".format(fund_code, "_".join(selected_columns), months, file_format))
+
+
+def fetch_chart_data(fund_code, months):
+    """
+    Fetch the historical data of the given fund to be charted. Runs in a thread of the main
+    process, so that the requests go through its rate limits.
+    """
+    fund = Fund(fund_code)
+    if fund.historical_data is None:
+        raise ConnectionError("historical data on {} is not available".format(fund_code))
+    return fund.get_historical_data(list(shorthands.values()), months)
+
+
+def render_fund_charts(fund_codes, selected_columns, months, file_format="png", directory=CHART_DIR):
+    """
+    Render the charts of many funds. The data is fetched by threads of this process, which share
+    its request scheduler, and only the rendering is done in a pool of processes.
+    :return: a tuple (list of tuples (fund code, path of the chart),
+    list of tuples (fund code, exception))
+    """
+    charts = []
+    failures = []
+    if len(fund_codes) == 0:
+        return charts, failures
+    os.makedirs(directory, exist_ok=True)
+    workers = min(CHART_WORKERS, len(fund_codes))
+    with JobThreadPoolExecutor(max_workers=workers) as fetcher, ProcessPoolExecutor(max_workers=workers) as renderer:
+        fetches = {fetcher.submit(fetch_chart_data, code, months): code for code in fund_codes}
+        renders = dict()
+
+        def fail(code, exception):
+            logger.log("Failed to render chart of {}: {}".format(code, exception), "error")
+            failures.append((code, exception))
+
+        def check(futures):
+            report_progress(len(charts) + len(failures), len(fund_codes))
+            try:
+                check_cancelled()
+            except JobCancelled:
+                for pending in futures:
+                    pending.cancel()
+                raise
+
+        for future in as_completed(fetches):
+            code = fetches[future]
+            try:
+                data = future.result()
+            except Exception as exception:
+                fail(code, exception)
+                check(fetches)
+                continue
+            renders[renderer.submit(render_historical_data, data, selected_columns,
+                                    get_chart_path(code, selected_columns, months, file_format, directory))] = code
+            check(fetches)
+        for future in as_completed(renders):
+            code = renders[future]
+            try:
+                charts.append((code, future.result()))
+                logger.log("Rendered chart of {} to {}".format(code, charts[-1][1]))
+            except Exception as exception:
+                fail(code, exception)
+            check(renders)
+    return charts, failures
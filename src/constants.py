@@ -1,9 +1,120 @@
 FUND_DATA_URL = "http://fund.eastmoney.com/pingzhongdata/{}.js"
 STOCK_DATA_URL = "http://fund.eastmoney.com/{}.html"
 NET_VALUE_URL = "https://fundf10.eastmoney.com/F10DataApi.aspx?type=lsjz&per=49&code={}&page={}"
+FUND_LIST_URL = "http://fund.eastmoney.com/js/fundcode_search.js"
+NAV_ESTIMATE_URL = "http://fundgz.1234567.com.cn/js/{}.js"
 GOOGLE_LANGUAGE_API = "https://language.googleapis.com/v1/documents:analyzeSentiment?key={}"
 DATA_FILE = "./data/data.txt"
 REQUEST_FILE = "./data/request.json"
 LOG_FILE = "./logs/fund-assistant.log"
 ARTICLES_LOG_FILE = "./logs/articles.log.json"
 REQUEST_TEST_FILE = "./data/request-test.json"
+PREDICTION_CACHE_FILE = "./data/prediction_cache.json"
+PREDICTION_HISTORY_FILE = "./data/predictions.csv"
+STOCK_SCORE_HISTORY_FILE = "./data/stock_scores.csv"
+CHART_DIR = "./charts"
+FUND_INDEX_FILE = "./data/fund_index.npz"
+HOLDINGS_INDEX_FILE = "./data/holdings_index.json"
+NEGATIVE_CACHE_FILE = "./data/negative_cache.json"
+EXTRACTION_STATS_FILE = "./data/extraction_stats.json"
+FUND_STORE_DIR = "./data/store"
+WATCHLIST_FILE = "./data/watchlist.json"
+DAEMON_STATE_FILE = "./data/daemon_state.json"
+WORK_QUEUE_FILE = "./data/work_queue.db"
+SESSION_FILE = "./data/session.npz"
+# Maximum number of characters sent to the natural language API in a single document
+SENTIMENT_CHUNK_SIZE = 20000
+SENTIMENT_WORKERS = 4
+LOCAL_SENTIMENT_CHUNK_SIZE = 100000
+
+shorthands = dict(
+    nav="net_asset_value",
+    cnv="cumulative_value",
+    dy="daily_yield"
+)
+
+# Request rate limits per host given as (requests per second, burst size, maximum concurrent requests)
+HOST_RATE_LIMITS = {
+    "www.google.com": (0.5, 5, 5),
+    "language.googleapis.com": (10, 10, SENTIMENT_WORKERS),
+    "fund.eastmoney.com": (5, 5, 4),
+    "fundf10.eastmoney.com": (5, 5, 4)
+}
+DEFAULT_RATE_LIMIT = (2, 4, 4)
+# Seconds to wait after the first time a host throttles requests, doubled for every consecutive time
+RATE_LIMIT_BACKOFF = 2
+RATE_LIMIT_MAX_BACKOFF = 60
+# Number of consecutive successful requests after which one more concurrent request is allowed
+RATE_LIMIT_RECOVERY_STEPS = 5
+# Number of results on a page of Google search results, the pages needed for num_results are fetched concurrently
+SEARCH_RESULTS_PER_PAGE = 10
+# Number of news articles fetched concurrently and the time limit for fetching one of them
+ARTICLE_WORKERS = 8
+ARTICLE_TIMEOUT = 3
+# Content types of the news articles that are downloaded, other responses are closed after the headers
+DOWNLOAD_CONTENT_TYPES = {"text/html", "application/xhtml+xml", "application/xml", "text/xml"}
+# Maximum number of bytes downloaded from a news article, and the size of the chunks it is streamed in
+DOWNLOAD_MAX_BYTES = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 16 * 1024
+# Number of bytes of text, without markup and whitespace, that a top-level <article> element needs to hold
+# for the download to stop once it has closed, so that teasers and related news cards do not end it
+DOWNLOAD_ARTICLE_MIN_TEXT = 1500
+# Number of bytes at the start of a page searched for a <meta> charset, and the number of bytes
+# given to chardet for pages that do not declare their encoding
+ENCODING_SNIFF_BYTES = 4096
+ENCODING_SAMPLE_BYTES = 32768
+# Seconds between two refreshes of the intraday estimates by 'watch', the maximum number of connections
+# used to fetch them and the time limit for fetching the estimate of a fund
+WATCH_INTERVAL = 60
+WATCH_CONNECTIONS = 20
+WATCH_TIMEOUT = 10
+# Number of seconds a url that failed is skipped for, doubled for every consecutive failure
+NEGATIVE_CACHE_URL_TTL = 24 * 3600
+NEGATIVE_CACHE_MAX_URL_TTL = 30 * 24 * 3600
+# Number of seconds after which the failure statistics of a domain are forgotten
+NEGATIVE_CACHE_DOMAIN_TTL = 14 * 24 * 3600
+# Domains are skipped once this fraction of at least the given number of attempts has failed
+NEGATIVE_CACHE_MAX_FAILURE_RATE = 0.8
+NEGATIVE_CACHE_MIN_ATTEMPTS = 5
+# Minimum number of characters an extractor needs to extract from an article to count as a success
+EXTRACTION_MIN_CHARS = 50
+# Maximum number of points drawn for each series in a chart
+PLOT_MAX_POINTS = 1000
+CHART_WORKERS = 4
+# Number of seconds after which the local list of funds is downloaded again
+FUND_INDEX_MAX_AGE = 7 * 24 * 3600
+FUND_INDEX_RETRY_DELAY = 600
+# Number of seconds for which the data synced by the daemon is used instead of fetching it again
+FUND_STORE_MAX_AGE = 24 * 3600
+# Number of jobs the daemon runs at the same time and the number of seconds between two checks of the schedule
+DAEMON_WORKERS = 4
+DAEMON_POLL_INTERVAL = 30
+DAEMON_RETRY_DELAY = 600
+# Number of shards the tasks of the work queue are split into, so that workers can take a part of them
+WORK_QUEUE_SHARDS = 16
+# Number of tasks a worker takes at once, the number of seconds they are leased for before they are given
+# to another worker, and the number of times a task is attempted before it is failed
+WORK_QUEUE_LEASE_SIZE = 5
+WORK_QUEUE_LEASE_DURATION = 60
+WORK_QUEUE_MAX_ATTEMPTS = 3
+# Number of seconds after which a task that failed is retried
+WORK_QUEUE_RETRY_DELAY = 60
+# Number of seconds a worker waits before checking again for tasks when there are none to take
+WORK_QUEUE_POLL_INTERVAL = 1
+# Approximate memory used by the funds kept in the session and the number of seconds they are kept for
+FUND_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FUND_CACHE_TTL = 3600
+# Number of seconds between two snapshots of the session, and the maximum age of the fund pages,
+# historical data and predictions restored from it
+SESSION_SAVE_INTERVAL = 300
+SESSION_PAGES_MAX_AGE = 24 * 3600
+SESSION_NAV_MAX_AGE = 12 * 3600
+SESSION_PREDICTION_MAX_AGE = 24 * 3600
+# Number of commands that can run in the background at the same time
+BACKGROUND_WORKERS = 2
+# Maximum number of candidates offered when completing a command with <TAB>
+MAX_COMPLETIONS = 50
+# Maximum number of rows printed in a table before the rest is left out
+MAX_TABLE_ROWS = 20
+# Maximum number of rows written to an export file at a time
+EXPORT_CHUNK_SIZE = 10000
@@ -0,0 +1,249 @@
+import argparse
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from backtest import record_prediction
+from constants import *
+from fund import Fund
+from fund_store import fund_store
+from google_services import GoogleServices
+from holdings_index import holdings_index
+from logger import logger
+from predictor import Predictor, DateRange, default_analysis_config
+from relevance import RelevanceFilter
+from sentiment import create_sentiment_providers
+from text_extractor import HTMLTextExtractor
+from utils import read_json_file, dump_json_to_file, table_str
+
+tasks = ["sync", "predict"]
+
+
+def parse_time(text):
+    return datetime.strptime(text, "%H:%M").time()
+
+
+class ScheduledJob:
+    """
+    A task that is run for every fund in a list, either once a day at a given time ('at'), or
+    every given number of minutes ('every'), optionally only between two times of the day
+    ('between'). Times are in the local time of the machine.
+    """
+    def __init__(self, name, task, funds, at=None, every=None, between=None, days=None):
+        """
+        :param days: the days of the week on which the job runs, 0 being Monday. Runs every day if None.
+        """
+        if task not in tasks:
+            raise ValueError("task of job {} must be one of {}".format(name, tasks))
+        if (at is None) == (every is None):
+            raise ValueError("job {} needs exactly one of 'at' and 'every'".format(name))
+        self.name = name
+        self.task = task
+        self.funds = funds
+        self.at = parse_time(at) if at is not None else None
+        self.every = every * 60 if every is not None else None
+        self.between = (parse_time(between[0]), parse_time(between[1])) if between is not None else None
+        self.days = days
+
+    def is_due(self, now, last_run):
+        """
+        :param now: the current datetime
+        :param last_run: the datetime of the last successful run of the job, or None
+        """
+        if self.days is not None and now.weekday() not in self.days:
+            return False
+        if self.at is not None:
+            scheduled = datetime.combine(now.date(), self.at)
+            return now >= scheduled and (last_run is None or last_run < scheduled)
+        if self.between is not None and not self.between[0] <= now.time() <= self.between[1]:
+            return False
+        return last_run is None or (now - last_run).total_seconds() >= self.every
+
+
+def load_watchlist(path):
+    """
+    Read the watchlist, a json file in the following format:
+    {"funds": [fund_code],
+     "workers": maximum number of jobs running at the same time,
+     "analysis": parameters used by predict, e.g. {"num_results": 10, "date_range": "d", "sentiment": "local"},
+     "jobs": [{"name": name, "task": "sync" or "predict", "at": "HH:MM", "every": minutes,
+               "between": ["HH:MM", "HH:MM"], "days": [weekday], "funds": [fund_code]}]}
+    Jobs run for all the funds in the watchlist unless they list their own.
+    :return: a tuple (list of ScheduledJob, number of workers, analysis parameters)
+    """
+    watchlist = read_json_file(path)
+    jobs = []
+    for job in watchlist["jobs"]:
+        job = dict(job)
+        job.setdefault("funds", watchlist.get("funds", []))
+        jobs.append(ScheduledJob(**job))
+    analysis_config = default_analysis_config()
+    analysis_config.update(watchlist.get("analysis", dict()))
+    analysis_config["date_range"] = DateRange[analysis_config["date_range"]] \
+        if isinstance(analysis_config["date_range"], str) else analysis_config["date_range"]
+    analysis_config["verbose"] = False
+    return jobs, watchlist.get("workers", DAEMON_WORKERS), analysis_config
+
+
+class Daemon:
+    """
+    Runs the jobs of a watchlist on a shared pool of workers, so that the data of the funds in the
+    local store is always fresh. The time of the last successful run of every job on every fund is
+    kept in data/daemon_state.json, so that the schedule carries on after a restart:
+    {"job_name|fund_code": {"succeeded": time, "failed": time, "error": last error}}
+    """
+    def __init__(self, jobs, workers, analysis_config, state_path=DAEMON_STATE_FILE):
+        self.jobs = jobs
+        self.workers = workers
+        self.analysis_config = analysis_config
+        self.state_path = state_path
+        self.state = read_json_file(state_path) if os.path.exists(state_path) else dict()
+        self.state_lock = threading.Lock()
+        self.running = dict()
+        self.stopped = threading.Event()
+        self.google_service = GoogleServices()
+        self.text_extractor = HTMLTextExtractor()
+        self.relevance_filter = RelevanceFilter()
+        self.sentiment_providers = create_sentiment_providers(self.google_service, analysis_config["sentiment"])
+
+    # ==================== Tasks ====================
+    def sync(self, code):
+        fund = Fund(code)
+        # Raises an AttributeError if the fund does not exist
+        fund.data
+        holdings_index.update(fund)
+        if fund.historical_data is None:
+            raise ConnectionError("historical data on {} is not available".format(code))
+        fund_store.save(fund)
+
+    def predict(self, code):
+        provider = self.sentiment_providers[self.analysis_config["sentiment"]]
+        if not provider.available:
+            raise RuntimeError("sentiment backend '{}' is not available".format(provider.name))
+        fund = fund_store.load(code)
+        if fund is None:
+            fund = Fund(code)
+        predictor = Predictor(self.analysis_config, self.google_service, self.text_extractor, self.relevance_filter,
+                              self.sentiment_providers, interactive=False)
+        deadline = time.monotonic() + self.analysis_config["command_timeout"]
+        prediction, confidence, contribution = predictor.predict_fund(fund, True, deadline)
+        predictor.log_statistics(quiet=True)
+        record_prediction(code, prediction, confidence, contribution)
+        fund_store.save_prediction(code, prediction, confidence, contribution)
+        logger.log("Prediction for {}: {:.5f} (confidence: {:.0%})".format(code, prediction, confidence), quiet=False)
+
+    # ==================== Scheduling ====================
+    @staticmethod
+    def key(job, code):
+        return "{}|{}".format(job.name, code)
+
+    def last_run(self, job, code):
+        succeeded = self.state.get(self.key(job, code), dict()).get("succeeded")
+        return datetime.fromtimestamp(succeeded) if succeeded is not None else None
+
+    def _update_state(self, key, **values):
+        with self.state_lock:
+            self.state.setdefault(key, dict()).update(values)
+            dump_json_to_file(self.state, self.state_path)
+
+    def run_job(self, job, code):
+        key = self.key(job, code)
+        logger.log("Running {} on {}".format(job.name, code), quiet=False)
+        start = time.monotonic()
+        try:
+            getattr(self, job.task)(code)
+            self._update_state(key, succeeded=time.time())
+            logger.log("Finished {} on {} in {:.1f}s".format(job.name, code, time.monotonic() - start), quiet=False)
+        except Exception as exception:
+            self._update_state(key, failed=time.time(), error=str(exception))
+            logger.log("Failed to run {} on {}: {}".format(job.name, code, exception), "error", False)
+
+    def due_jobs(self, now):
+        """
+        :return: a list of tuples (job, fund code) that are due and not running. Jobs that failed are
+        retried after DAEMON_RETRY_DELAY seconds.
+        """
+        due = []
+        for job in self.jobs:
+            for code in job.funds:
+                key = self.key(job, code)
+                entry = self.state.get(key, dict())
+                retrying = entry.get("failed", 0) > entry.get("succeeded", 0) \
+                    and time.time() - entry["failed"] < DAEMON_RETRY_DELAY
+                if key in self.running or retrying:
+                    continue
+                if job.is_due(now, self.last_run(job, code)):
+                    due.append((job, code))
+        return due
+
+    def run_pending(self, executor):
+        """
+        Submit the jobs that are due to the pool of workers.
+        :return: the number of jobs submitted
+        """
+        for key in [key for key, future in self.running.items() if future.done()]:
+            del self.running[key]
+        due = self.due_jobs(datetime.now())
+        for job, code in due:
+            self.running[self.key(job, code)] = executor.submit(self.run_job, job, code)
+        return len(due)
+
+    def run(self, once=False):
+        """
+        Check the schedule every DAEMON_POLL_INTERVAL seconds until stop is called. If once is
+        True, run the jobs that are due and return when they have finished.
+        """
+        logger.log("Daemon started with {} jobs and {} workers".format(len(self.jobs), self.workers), quiet=False)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.run_pending(executor)
+            while not once and not self.stopped.wait(DAEMON_POLL_INTERVAL):
+                self.run_pending(executor)
+            if not once:
+                logger.log("Stopping, waiting for {} running jobs".format(
+                    sum(not future.done() for future in self.running.values())), quiet=False)
+                for future in self.running.values():
+                    future.cancel()
+        logger.log("Daemon stopped", quiet=False)
+
+    def stop(self, *_):
+        self.stopped.set()
+
+    def status(self):
+        """
+        :return: a list of dictionaries with the keys job, fund_code, last_success, last_failure and error
+        """
+        def format_time(timestamp):
+            return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp is not None else ""
+
+        rows = []
+        for job in self.jobs:
+            for code in job.funds:
+                entry = self.state.get(self.key(job, code), dict())
+                rows.append(dict(job=job.name, fund_code=code, last_success=format_time(entry.get("succeeded")),
+                                 last_failure=format_time(entry.get("failed")), error=entry.get("error", "")))
+        return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the jobs in a watchlist of funds on a schedule.")
+    parser.add_argument("watchlist", nargs="?", default=WATCHLIST_FILE, help="path to the watchlist")
+    parser.add_argument("--once", action="store_true", help="run the jobs that are due and exit")
+    parser.add_argument("--status", action="store_true", help="print the last runs of every job and exit")
+    args = parser.parse_args()
+    if not os.path.exists(args.watchlist):
+        print("Watchlist {} cannot be found! See README.md for its format.".format(args.watchlist))
+        exit()
+    try:
+        daemon = Daemon(*load_watchlist(args.watchlist))
+    except ValueError as exception:
+        print("Watchlist {} is not valid: {}".format(args.watchlist, exception))
+        exit()
+    if args.status:
+        print(table_str(daemon.status(), ["Job", "Fund code", "Last success", "Last failure", "Error"]))
+    else:
+        signal.signal(signal.SIGINT, daemon.stop)
+        signal.signal(signal.SIGTERM, daemon.stop)
+        daemon.run(args.once)
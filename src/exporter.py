@@ -0,0 +1,204 @@
+import importlib.util
+import os
+from collections import deque
+
+import pandas as pd
+
+from background import JobThreadPoolExecutor, check_cancelled, report_progress
+from constants import *
+from fund import Fund
+from logger import logger
+
+# Columns of each kind of export and their types, so that every chunk is written with the same
+# types even if a column is empty in the first one. Types are pyarrow aliases.
+export_columns = dict(
+    nav=[("fund_code", "string"), ("date", "timestamp[ns]"), ("net_asset_value", "float64"),
+         ("cumulative_value", "float64"), ("daily_yield", "float64")],
+    stocks=[("fund_code", "string"), ("disclosure_date", "string"), ("stock_code", "string"), ("name", "string"),
+            ("position_ratio", "float64")],
+    predictions=[("timestamp", "timestamp[ns]"), ("fund_code", "string"), ("stock_code", "string"),
+                 ("name", "string"), ("sentiment_score", "float64"), ("position_ratio", "float64"),
+                 ("weighted_score", "float64"), ("coverage", "float64")]
+)
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, df):
+        if len(df) > 0:
+            lines = df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+            self.file.write(lines if lines.endswith("\n") else lines + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Writes every chunk as a row group of a single parquet file with the schema given by the
+    columns of the export. Requires pyarrow.
+    """
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow needs to be installed to export to parquet ('pip install pyarrow')")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.type_for_alias(alias)) for name, alias in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, df):
+        self.writer.write_table(self.pyarrow.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+
+writers = dict(
+    csv=CsvWriter,
+    jsonl=JsonLinesWriter,
+    parquet=ParquetWriter
+)
+
+
+# Packages that are needed by some of the formats but not by the rest of the application
+format_dependencies = dict(
+    parquet="pyarrow"
+)
+
+
+def missing_dependency(file_format):
+    """
+    Return the name of the package that the export format needs but is not installed, or None.
+    """
+    package = format_dependencies.get(file_format)
+    return package if package is not None and importlib.util.find_spec(package) is None else None
+
+
+def get_export_format(path):
+    """
+    Return the export format given by the extension of the path, or None if it is not supported.
+    """
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in writers else None
+
+
+def iter_funds(fund_codes, funds=None, workers=4, prepare=None):
+    """
+    Create the Fund objects of the given codes in the background and yield them in order.
+    At most workers funds are fetched ahead of the one being consumed, which bounds the memory.
+    :param funds: a dictionary of Fund objects that have already been created, keyed by fund code
+    :param prepare: a function applied to each fund in the background, e.g. to fetch its historical
+    data, whose result is yielded instead of the fund
+    :return: a generator of tuples (fund code, Fund object or result of prepare, or the exception raised)
+    """
+    funds = dict() if funds is None else funds
+
+    def fetch(code):
+        try:
+            fund = funds[code] if code in funds else Fund(code)
+            return fund if prepare is None else prepare(fund)
+        except Exception as exception:
+            return exception
+
+    with JobThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        codes = iter(fund_codes)
+        for code in codes:
+            pending.append((code, executor.submit(fetch, code)))
+            if len(pending) >= workers:
+                break
+        while pending:
+            code, future = pending.popleft()
+            next_code = next(codes, None)
+            if next_code is not None:
+                pending.append((next_code, executor.submit(fetch, next_code)))
+            yield code, future.result()
+
+
+def nav_frame(fund, months=None):
+    data = fund.historical_data
+    if data is None:
+        raise ConnectionError("historical data on {} is not available".format(fund.code))
+    if months is not None:
+        data = fund.get_historical_data(list(shorthands.values()), months).iloc[::-1]
+    data = data.copy()
+    data.insert(0, "fund_code", fund.code)
+    return data
+
+
+def stock_frame(fund, months=None):
+    stocks = pd.DataFrame(fund.stocks, columns=["code", "name", "position_ratio"]) \
+        .rename(columns={"code": "stock_code"})
+    stocks.insert(0, "disclosure_date", fund.stocks_date)
+    stocks.insert(0, "fund_code", fund.code)
+    return stocks
+
+
+def export_funds(kind, fund_codes, path, file_format, months=None, funds=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the historical data ('nav') or the stock positions ('stocks') of the given funds to a
+    file, one fund and at most chunk_size rows at a time. The data of the next funds is fetched
+    in the background while a fund is written.
+    :return: a tuple (number of rows written, list of tuples (fund code, exception))
+    """
+    get_frame = dict(nav=nav_frame, stocks=stock_frame)[kind]
+    writer = writers[file_format](path, export_columns[kind])
+    rows = 0
+    failures = []
+    try:
+        for i, (code, frame) in enumerate(iter_funds(fund_codes, funds, prepare=lambda fund: get_frame(fund, months))):
+            check_cancelled()
+            report_progress(i, len(fund_codes))
+            try:
+                if isinstance(frame, Exception):
+                    raise frame
+                for start in range(0, len(frame), chunk_size):
+                    writer.write(frame.iloc[start:start + chunk_size])
+                rows += len(frame)
+                logger.log("Exported {} of {} to {}".format(kind, code, path))
+            except Exception as exception:
+                logger.log("Failed to export {} of {}: {}".format(kind, code, exception), "error")
+                failures.append((code, exception))
+    finally:
+        writer.close()
+    return rows, failures
+
+
+def export_predictions(fund_codes, path, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the saved per-stock prediction history of the given funds (or of all funds if
+    fund_codes is None) to a file, reading data/stock_scores.csv chunk by chunk.
+    :return: the number of rows written
+    """
+    if not os.path.exists(STOCK_SCORE_HISTORY_FILE):
+        return 0
+    writer = writers[file_format](path, export_columns["predictions"])
+    rows = 0
+    try:
+        for chunk in pd.read_csv(STOCK_SCORE_HISTORY_FILE, dtype={"fund_code": str, "stock_code": str},
+                                 parse_dates=["timestamp"], chunksize=chunk_size, encoding="utf-8"):
+            if fund_codes is not None:
+                chunk = chunk[chunk["fund_code"].isin(fund_codes)]
+            if len(chunk) > 0:
+                writer.write(chunk)
+                rows += len(chunk)
+    finally:
+        writer.close()
+    return rows
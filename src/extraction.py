@@ -0,0 +1,247 @@
+import os
+import re
+import threading
+import time
+from copy import deepcopy
+
+import lxml.html
+from goose3 import Goose
+from goose3.crawler import Crawler, CrawlCandidate
+from goose3.text import StopWordsChinese
+from newspaper import Article
+from newspaper.cleaners import DocumentCleaner
+from newspaper.outputformatters import OutputFormatter
+
+from constants import *
+from negative_cache import get_domain
+from utils import read_json_file, dump_json_to_file
+
+extractor_names = ["goose", "newspaper", "density"]
+# Extractors that clean up the document they are given in place
+mutating_extractors = {"goose", "newspaper"}
+xml_declaration_pattern = re.compile(r"^\s*<\?.*?\?>", re.DOTALL)
+# Elements that never hold the content of an article
+boilerplate_xpath = "//script|//style|//noscript|//iframe|//form|//nav|//header|//footer|//aside"
+
+
+def parse_html(html):
+    """
+    Parse the page into an lxml document, which is shared by all the extractors.
+    :return: the root element, or None if the page is empty
+    """
+    # lxml refuses unicode strings that start with an xml declaration giving an encoding
+    html = xml_declaration_pattern.sub("", html, count=1)
+    if html.strip() == "":
+        return None
+    try:
+        return lxml.html.fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+
+
+def page_title(doc):
+    title = doc.findtext(".//title")
+    return title.strip() if title is not None else ""
+
+
+class _ParsedCrawler(Crawler):
+    """
+    A Goose crawler that works on a document that has already been parsed instead of parsing the page again.
+    It relies on the steps of Crawler.crawl() in the version of goose3 pinned in requirements.txt, as does
+    extract_newspaper on newspaper3k.
+    """
+    def __init__(self, config, fetcher, doc):
+        super().__init__(config, fetcher)
+        self.doc = doc
+
+    def get_document(self, raw_html):
+        return self.doc
+
+
+class ExtractionStats:
+    """
+    Remembers how well each extractor works on each domain, in data/extraction_stats.json
+    with the following format:
+    {domain: {"articles": number of articles extracted, "extracted": number of articles with content,
+              "time": total number of seconds spent extracting,
+              "extractors": {extractor: {"attempts": attempts, "successes": successes, "time": seconds}},
+              "updated": time of the last extraction}}
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # The file is only created once there are statistics to save
+        self.data = read_json_file(path) if os.path.exists(path) else dict()
+
+    def order(self, domain):
+        """
+        Return the names of the extractors, the ones most likely to succeed on the domain first.
+        Extractors that have not been tried on the domain count as succeeding half of the time,
+        and ties are broken by the default order.
+        """
+        with self.lock:
+            extractors = self.data.get(domain, dict()).get("extractors", dict())
+
+            def success_rate(name):
+                stats = extractors.get(name, dict(attempts=0, successes=0))
+                return (stats["successes"] + 1) / (stats["attempts"] + 2)
+
+            return sorted(extractor_names, key=lambda name: (-success_rate(name), extractor_names.index(name)))
+
+    def record(self, domain, attempts, extracted, elapsed):
+        """
+        :param attempts: a list of tuples (extractor name, whether it succeeded, seconds taken)
+        :param extracted: whether any content was extracted from the article
+        :param elapsed: number of seconds taken by the whole extraction, including parsing
+        """
+        with self.lock:
+            stats = self.data.setdefault(domain, dict(articles=0, extracted=0, time=0, extractors=dict()))
+            stats["articles"] += 1
+            stats["extracted"] += int(extracted)
+            stats["time"] += elapsed
+            stats["updated"] = time.time()
+            for name, success, seconds in attempts:
+                extractor = stats["extractors"].setdefault(name, dict(attempts=0, successes=0, time=0))
+                extractor["attempts"] += 1
+                extractor["successes"] += int(success)
+                extractor["time"] += seconds
+
+    def domains(self):
+        """
+        Return the statistics of every domain, the ones with the most articles first, in a list of
+        dictionaries with the keys domain, articles, success_rate, ms_per_article, preferred and extractors.
+        """
+        with self.lock:
+            data = deepcopy(self.data)
+        domains = []
+        for domain, stats in data.items():
+            if stats["articles"] == 0:
+                continue
+            domains.append(dict(
+                domain=domain,
+                articles=stats["articles"],
+                success_rate=round(stats["extracted"] / stats["articles"], 3),
+                ms_per_article=round(stats["time"] / stats["articles"] * 1000, 1),
+                preferred=self.order(domain)[0],
+                extractors=", ".join("{} {}/{}".format(name, extractor["successes"], extractor["attempts"])
+                                     for name, extractor in stats["extractors"].items())
+            ))
+        return sorted(domains, key=lambda stats: stats["articles"], reverse=True)
+
+    def reset(self, domain=None):
+        with self.lock:
+            if domain is None:
+                self.data = dict()
+            else:
+                self.data.pop(domain, None)
+        self.save()
+
+    def save(self):
+        with self.lock:
+            dump_json_to_file(self.data, self.path)
+
+
+extraction_stats = ExtractionStats(EXTRACTION_STATS_FILE)
+
+
+class ExtractionEngine:
+    """
+    Extracts the content of an article with Goose, newspaper or a text density heuristic.
+    The page is parsed only once. Extractors that modify the parsed document work on a copy of it,
+    unless no other extractor is tried after them.
+    The extractors are tried in the order of their success rates on the domain of the article,
+    until one of them extracts at least EXTRACTION_MIN_CHARS characters.
+    """
+    def __init__(self, stats=extraction_stats):
+        self.stats = stats
+        self.goose = Goose({"stopwords_class": StopWordsChinese})
+        self.extractors = dict(
+            goose=self.extract_goose,
+            newspaper=self.extract_newspaper,
+            density=self.extract_density
+        )
+
+    def extract_goose(self, url, html, doc):
+        crawler = _ParsedCrawler(self.goose.config, self.goose.fetcher, doc)
+        parse_candidate = crawler.get_parse_candidate(CrawlCandidate(self.goose.config, url, html))
+        return crawler.process(html, parse_candidate.url, parse_candidate.link_hash).cleaned_text
+
+    @staticmethod
+    def extract_newspaper(url, html, doc):
+        # The steps of Article.parse() that lead to the text, without parsing the page again
+        article = Article(url, language="zh")
+        doc = DocumentCleaner(article.config).clean(doc)
+        top_node = article.extractor.calculate_best_node(doc)
+        if top_node is None:
+            return ""
+        top_node = article.extractor.post_cleanup(top_node)
+        text, _ = OutputFormatter(article.config).get_formatted(top_node)
+        return text
+
+    @staticmethod
+    def extract_density(url, html, doc):
+        """
+        Find the element whose paragraphs hold the most text that is not in links, and return its paragraphs.
+        Boilerplate elements are left out without modifying the document.
+        """
+        boilerplate = set(doc.xpath(boilerplate_xpath))
+
+        def is_boilerplate(element):
+            return element in boilerplate or any(ancestor in boilerplate for ancestor in element.iterancestors())
+
+        def paragraphs(node):
+            return [paragraph for paragraph in node.iter("p") if not is_boilerplate(paragraph)]
+
+        # Outermost boilerplate elements, whose text is subtracted from the text of the nodes holding them
+        outermost = [element for element in boilerplate
+                     if not any(ancestor in boilerplate for ancestor in element.iterancestors())]
+        paragraph_lengths = dict()
+        for paragraph in paragraphs(doc):
+            parent = paragraph.getparent()
+            if parent is not None:
+                paragraph_lengths[parent] = paragraph_lengths.get(parent, 0) + len(paragraph.text_content().strip())
+        best_node, best_score = None, 0
+        for node, length in paragraph_lengths.items():
+            total = len(node.text_content().strip()) - sum(len(element.text_content()) for element in outermost
+                                                           if node in element.iterancestors())
+            link_length = sum(len(link.text_content().strip()) for link in node.iter("a") if not is_boilerplate(link))
+            score = length * (1 - link_length / total) if total > 0 else 0
+            if score > best_score:
+                best_node, best_score = node, score
+        if best_node is None:
+            return ""
+        return "\n".join(paragraph.text_content().strip() for paragraph in paragraphs(best_node))
+
+    def extract(self, url, html):
+        """
+        :return: a tuple (content of the article, name of the extractor that extracted it or None)
+        If no extractor extracts enough text, the longest text extracted is returned,
+        or the title of the page if nothing at all could be extracted.
+        """
+        start = time.perf_counter()
+        domain = get_domain(url)
+        doc = parse_html(html)
+        attempts = []
+        text, extractor = "", None
+        if doc is not None:
+            title = page_title(doc)
+            order = self.stats.order(domain)
+            for i, name in enumerate(order):
+                attempt_start = time.perf_counter()
+                try:
+                    # The document is only copied if an extractor modifies it and others may run after it
+                    tree = deepcopy(doc) if name in mutating_extractors and i < len(order) - 1 else doc
+                    result = self.extractors[name](url, html, tree).strip()
+                except Exception:
+                    result = ""
+                success = len(result) >= EXTRACTION_MIN_CHARS
+                attempts.append((name, success, time.perf_counter() - attempt_start))
+                if len(result) > len(text):
+                    text, extractor = result, name
+                if success:
+                    break
+            if text == "":
+                text = title
+        self.stats.record(domain, attempts, any(success for _, success, _ in attempts),
+                          time.perf_counter() - start)
+        return text, extractor
@@ -1,3 +1,5 @@
+import sys
+import time
 import traceback
 from datetime import datetime
 
@@ -5,9 +7,11 @@ import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
 
+from background import report_progress
 from logger import logger
+from nav_estimates import parse_estimate
+from rate_limiter import scheduler
 from utils import *
-import requests
 import dateutil.relativedelta as date_diff
 
 var_names = dict(
@@ -23,14 +27,40 @@ nav_columns = ["date", "net_asset_value", "cumulative_value", "daily_yield"]
 
 
 class Fund:
-    def __init__(self, code):
+    def __init__(self, code, fund_data_html=None, stock_html=None, historical_data=None):
+        """
+        The pages of the fund are fetched unless they are given, e.g. when the fund is loaded
+        from the local store.
+        """
         self.code = code
-        self.fund_data_html = requests.get(FUND_DATA_URL.format(code)).text
-        self.stock_html = requests.get(STOCK_DATA_URL.format(code)).content
+        self.fund_data_html = fund_data_html if fund_data_html is not None \
+            else scheduler.get(FUND_DATA_URL.format(code)).text
+        self.stock_html = stock_html if stock_html is not None else scheduler.get(STOCK_DATA_URL.format(code)).content
         self._stocks = None
+        self._stocks_date = None
         self._fund_data = None
         self.overall_prediction = None
-        self._historical_data = None
+        self.overall_confidence = None
+        # Contribution of each stock to the overall prediction, keyed by stock code
+        self.prediction_contribution = dict()
+        self._historical_data = historical_data
+        # Times at which the pages and the historical data were fetched and the prediction was made
+        self.fetched = time.time()
+        self.historical_data_fetched = time.time() if historical_data is not None else None
+        self.predicted = None
+
+    @property
+    def historical_data_loaded(self):
+        return self._historical_data is not None
+
+    def memory_usage(self):
+        """
+        Return the approximate number of bytes used by the pages and the historical data of the fund
+        """
+        size = sys.getsizeof(self.fund_data_html) + sys.getsizeof(self.stock_html)
+        if self._historical_data is not None:
+            size += int(self._historical_data.memory_usage(deep=True).sum())
+        return size
 
     @property
     def data(self):
@@ -61,13 +91,14 @@ class Fund:
             logger.log("Retrieving historical data...", quiet=False)
             try:
                 # First obtain the total number of pages
-                net_value_html = requests.get(NET_VALUE_URL.format(self.code, None)).text
+                net_value_html = scheduler.get(NET_VALUE_URL.format(self.code, None)).text
                 pages = int(re.search(r"pages:(.*),", net_value_html).group(1))
 
                 all_records = []
 
                 for page in range(1, pages + 1):
-                    net_value_html = requests.get(NET_VALUE_URL.format(self.code, page)).text
+                    report_progress(page - 1, pages)
+                    net_value_html = scheduler.get(NET_VALUE_URL.format(self.code, page)).text
                     soup = BeautifulSoup(net_value_html, "html.parser")
 
                     for row in soup.findAll("tbody")[0].findAll("tr"):
@@ -91,6 +122,7 @@ class Fund:
                 historical_data["daily_yield"] = historical_data["daily_yield"].str.strip("%").astype(float)
                 historical_data = historical_data.sort_values(by="date", axis=0, ascending=True).reset_index(drop=True)
                 self._historical_data = historical_data
+                self.historical_data_fetched = time.time()
                 return historical_data
 
             except Exception as exception:
@@ -136,6 +168,16 @@ class Fund:
     def stock_names(self):
         return [info["name"] for info in self.stocks]
 
+    @property
+    def stocks_date(self):
+        """
+        Return the date on which the stock positions were disclosed in the format YYYY-MM-DD,
+        or None if it cannot be found.
+        """
+        if self._stocks is None:
+            self.stocks
+        return self._stocks_date
+
     @property
     def stocks(self):
         """
@@ -149,6 +191,8 @@ class Fund:
         else:
             soup = BeautifulSoup(self.stock_html, "html.parser")
             table = soup.find(id="quotationItem_DataTable")
+            date = re.search(r"截止[^\d]*(\d{4}-\d{2}-\d{2})", table.get_text())
+            self._stocks_date = date.group(1) if date is not None else None
             rows = table.find_all("table")[0].find_all("tr")[1:]  # Ignore the column names of the table
             stocks = []
             for row in rows:
@@ -164,3 +208,13 @@ class Fund:
                     ))
             self._stocks = stocks
             return stocks
+
+    def estimate(self):
+        """
+        Fetch the intraday estimate of the net asset value of the fund. To follow the estimates
+        of many funds, use nav_estimates.NavEstimateWatcher instead.
+        :return: a dictionary as returned by nav_estimates.parse_estimate, or None if the fund has no estimate
+        """
+        response = scheduler.get(NAV_ESTIMATE_URL.format(self.code), headers={"User-Agent": "Mozilla/5.0"},
+                                 timeout=WATCH_TIMEOUT)
+        return parse_estimate(response.content.decode("utf-8", errors="ignore"))
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from constants import *
+
+
+class FundCache:
+    """
+    Keeps the Fund objects used in the session, so that switching back to a fund does not fetch
+    and parse it again. Funds are dropped once they are older than ttl seconds, and the least
+    recently used ones are dropped when the approximate memory used by all funds exceeds
+    max_bytes. The most recently used fund is always kept.
+    """
+    def __init__(self, max_bytes=FUND_CACHE_MAX_BYTES, ttl=FUND_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # fund code -> (Fund object, time it was created)
+        self.entries = OrderedDict()
+        # fund code -> (approximate size of the fund in bytes, time its historical data was fetched when measured)
+        self.sizes = dict()
+
+    def get(self, code):
+        """
+        :return: the cached Fund object of the given code, or None if it is not cached or has expired
+        """
+        with self.lock:
+            entry = self.entries.get(code)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                del self.entries[code]
+                self.sizes.pop(code, None)
+                return None
+            self.entries.move_to_end(code)
+            self._evict()
+            return entry[0]
+
+    def put(self, fund, created=None):
+        with self.lock:
+            self.entries[fund.code] = (fund, time.time() if created is None else created)
+            self.entries.move_to_end(fund.code)
+            self.sizes.pop(fund.code, None)
+            self._evict()
+
+    def _size(self, code):
+        # The size of a fund grows once its historical data is loaded, so it is measured again when
+        # the historical data has been fetched since the last time
+        fund = self.entries[code][0]
+        size = self.sizes.get(code)
+        if size is None or size[1] != fund.historical_data_fetched:
+            size = (fund.memory_usage(), fund.historical_data_fetched)
+            self.sizes[code] = size
+        return size[0]
+
+    def _evict(self):
+        total = sum(self._size(code) for code in self.entries)
+        while total > self.max_bytes and len(self.entries) > 1:
+            code, _ = self.entries.popitem(last=False)
+            total -= self.sizes.pop(code)[0]
+
+    def memory_usage(self):
+        with self.lock:
+            return sum(self._size(code) for code in self.entries)
+
+    def funds(self):
+        """
+        :return: a dictionary of the Fund objects that have not expired, keyed by fund code
+        """
+        now = time.time()
+        with self.lock:
+            return {code: fund for code, (fund, created) in self.entries.items() if now - created <= self.ttl}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+
+
+fund_cache = FundCache()
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from constants import *
+from logger import logger
+from rate_limiter import scheduler
+from utils import get_variable_from_js
+
+index_columns = ["code", "abbreviation", "name", "type", "pinyin"]
+# Columns searched for funds that contain the text, and not only start with it
+substring_columns = ["code", "abbreviation", "name"]
+
+
+class NgramIndex:
+    """
+    An inverted index of the characters and the pairs of adjacent characters of an array of
+    strings, so that the strings that contain a text are found without scanning all of them.
+    Every n-gram is encoded as an integer: a pair (a, b) as a << 32 | b, a single character a as
+    a << 32. The encoded n-grams are kept sorted with the rows they occur in, so that the rows
+    of an n-gram are found by binary search. The candidates that have all the n-grams of the
+    text are then checked for the text itself.
+    """
+    def __init__(self, values):
+        self.values = values
+        n, width = len(values), values.dtype.itemsize // 4
+        codes = np.ascontiguousarray(values).view(np.uint32).reshape(n, width).astype(np.uint64) \
+            if n > 0 and width > 0 else np.zeros((n, 1), dtype=np.uint64)
+        rows = np.broadcast_to(np.arange(n)[:, np.newaxis], codes.shape)
+        pairs = codes[:, :-1] << np.uint64(32) | codes[:, 1:]
+        keys = np.concatenate([(codes << np.uint64(32))[codes > 0], pairs[codes[:, 1:] > 0]])
+        key_rows = np.concatenate([rows[codes > 0], rows[:, 1:][codes[:, 1:] > 0]])
+        # Sorted by n-gram and then by row, without repeating the rows of an n-gram
+        order = np.lexsort((key_rows, keys))
+        keys, key_rows = keys[order], key_rows[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (key_rows[1:] != key_rows[:-1])
+        self.keys = keys[distinct]
+        self.rows = key_rows[distinct]
+
+    @staticmethod
+    def ngrams(text):
+        codes = [ord(char) for char in text]
+        if len(codes) == 1:
+            return [codes[0] << 32]
+        return list(dict.fromkeys(a << 32 | b for a, b in zip(codes, codes[1:])))
+
+    def find(self, text):
+        """
+        Return the rows of the strings that contain text, in ascending order.
+        """
+        if not text:
+            return np.arange(len(self.values))
+        candidates = None
+        # Rarest n-grams first, so that the candidates shrink quickly
+        ranges = sorted(((np.searchsorted(self.keys, key, side="left"), np.searchsorted(self.keys, key, side="right"))
+                         for key in map(np.uint64, self.ngrams(text))), key=lambda bounds: bounds[1] - bounds[0])
+        for start, end in ranges:
+            rows = self.rows[start:end]
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+        if len(text) <= 2:
+            return candidates
+        return candidates[np.char.find(self.values[candidates], text) >= 0]
+
+
+class FundIndex:
+    """
+    A local index of all the funds listed on eastmoney, stored in data/fund_index.npz.
+    Every column is kept in a numpy array sorted by fund code, together with the orders
+    in which the abbreviations, names and pinyin are sorted, so that a prefix lookup
+    is a binary search. Lookups of funds that contain a text go through n-gram indexes of
+    the codes, abbreviations and names, which are built when the index is loaded.
+    """
+    def __init__(self, path, max_age=FUND_INDEX_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.columns = None
+        self.orders = None
+        self.sorted_columns = None
+        self.ngram_indexes = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.columns is not None
+
+    def load(self, refresh=False):
+        """
+        Load the index from disk, downloading it first if it does not exist, is older
+        than max_age or if refresh is True. A stale index is still used if the download fails.
+        """
+        with self.lock:
+            outdated = not os.path.exists(self.path) or time.time() - os.path.getmtime(self.path) > self.max_age
+            # Do not try again right after a failed download, every command would be delayed by it
+            recently_failed = self.failed_at is not None and time.time() - self.failed_at < FUND_INDEX_RETRY_DELAY
+            if refresh or (outdated and not recently_failed):
+                try:
+                    self.download()
+                    self.failed_at = None
+                except Exception as exception:
+                    self.failed_at = time.time()
+                    logger.log("Failed to download the list of funds: {}".format(exception), "error")
+            if self.columns is None and os.path.exists(self.path):
+                with np.load(self.path) as data:
+                    self.set_columns({column: data[column] for column in index_columns},
+                                     {column: data["order_" + column] for column in index_columns[1:]})
+        return self.loaded
+
+    def set_columns(self, columns, orders):
+        self.columns = columns
+        self.orders = orders
+        self.sorted_columns = {column: columns[column][order] for column, order in orders.items()}
+        self.sorted_columns["code"] = columns["code"]
+        self.ngram_indexes = {column: NgramIndex(columns[column]) for column in substring_columns}
+
+    def download(self):
+        text = scheduler.get(FUND_LIST_URL).content.decode("utf-8-sig")
+        self.build(get_variable_from_js(text, "r"))
+
+    def build(self, records):
+        """
+        Build the index from the given records and save it to disk.
+        :param records: a list of lists with the format [code, abbreviation, name, type, pinyin]
+        """
+        columns = {column: np.array([record[i] for record in records], dtype=str)
+                   for i, column in enumerate(index_columns)}
+        order = np.argsort(columns["code"], kind="stable")
+        columns = {column: values[order] for column, values in columns.items()}
+        orders = {column: np.argsort(columns[column], kind="stable") for column in index_columns[1:]}
+        np.savez(self.path, **columns, **{"order_" + column: order for column, order in orders.items()})
+        self.set_columns(columns, orders)
+        logger.log("Saved the list of {} funds to {}".format(len(records), self.path))
+
+    def _prefix_range(self, column, prefix):
+        """
+        Return the positions in the sorted order of the given column whose values start with prefix.
+        """
+        values = self.sorted_columns[column]
+        order = self.orders.get(column)
+        start = np.searchsorted(values, prefix, side="left")
+        end = np.searchsorted(values, prefix + "\uffff", side="left")
+        return np.arange(start, end) if order is None else order[start:end]
+
+    def prefix_search(self, text):
+        """
+        Return the row numbers of the funds whose code, abbreviation, pinyin or name start with text.
+        """
+        if not self.loaded or not text:
+            return np.array([], dtype=int)
+        if text.isdigit():
+            return self._prefix_range("code", text)
+        if text.isascii():
+            text = text.upper()
+            rows = np.concatenate([self._prefix_range("abbreviation", text), self._prefix_range("pinyin", text)])
+            return unique_in_order(rows)
+        return self._prefix_range("name", text)
+
+    def search(self, text, limit=20):
+        """
+        Return the funds that match text, either by prefix or by containing it, as a list
+        of dictionaries with the keys code, name and type. Prefix matches come first.
+        """
+        if not self.loaded or not text:
+            return []
+        rows = self.prefix_search(text)
+        if len(rows) < limit:
+            needle = text.upper() if text.isascii() else text
+            column = "name" if not text.isascii() else "abbreviation"
+            if text.isdigit():
+                column = "code"
+            contains = self.ngram_indexes[column].find(needle)
+            rows = unique_in_order(np.concatenate([rows, contains]))
+        return [self.get(row) for row in rows[:limit]]
+
+    def get(self, row):
+        return dict(code=str(self.columns["code"][row]), name=str(self.columns["name"][row]),
+                    type=str(self.columns["type"][row]))
+
+    def contains(self, code):
+        if not self.loaded:
+            return False
+        row = np.searchsorted(self.columns["code"], code)
+        return row < len(self.columns["code"]) and self.columns["code"][row] == code
+
+
+def unique_in_order(rows):
+    """
+    Remove duplicates from the array of row numbers while keeping the order of first occurrence.
+    """
+    _, first = np.unique(rows, return_index=True)
+    return rows[np.sort(first)]
+
+
+fund_index = FundIndex(FUND_INDEX_FILE)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from constants import *
+from fund import Fund
+from utils import read_json_file, dump_json_to_file
+
+
+class FundStore:
+    """
+    Keeps the data of the funds synced by the daemon in data/store, with one directory per fund:
+    fund_data.js and stocks.html: the pages of the fund as they were downloaded
+    nav.csv: the historical data of the fund
+    meta.json: {"synced": time of the last sync,
+                "prediction": {"timestamp": time of the prediction, "prediction": overall prediction,
+                               "confidence": confidence, "contribution": contribution of each stock}}
+    Files are replaced atomically so that a fund can be loaded while it is being synced.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def fund_dir(self, code):
+        return os.path.join(self.path, code)
+
+    @staticmethod
+    def _replace(path, write):
+        temp_path = path + ".tmp"
+        write(temp_path)
+        os.replace(temp_path, path)
+
+    def _update_meta(self, code, **values):
+        path = os.path.join(self.fund_dir(code), "meta.json")
+        with self.lock:
+            meta = read_json_file(path) if os.path.exists(path) else dict()
+            meta.update(values)
+            self._replace(path, lambda temp_path: dump_json_to_file(meta, temp_path))
+
+    def save(self, fund):
+        """
+        Save the pages and the historical data of the fund, which need to have been fetched.
+        """
+        directory = self.fund_dir(fund.code)
+        os.makedirs(directory, exist_ok=True)
+
+        def write_text(temp_path):
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(fund.fund_data_html)
+
+        def write_bytes(temp_path):
+            with open(temp_path, "wb") as file:
+                file.write(fund.stock_html)
+
+        self._replace(os.path.join(directory, "fund_data.js"), write_text)
+        self._replace(os.path.join(directory, "stocks.html"), write_bytes)
+        self._replace(os.path.join(directory, "nav.csv"),
+                      lambda temp_path: fund.historical_data.to_csv(temp_path, index=False, encoding="utf-8"))
+        self._update_meta(fund.code, synced=time.time())
+
+    def save_prediction(self, code, prediction, confidence, contribution):
+        os.makedirs(self.fund_dir(code), exist_ok=True)
+        self._update_meta(code, prediction=dict(
+            timestamp=time.time(),
+            prediction=prediction,
+            confidence=confidence,
+            contribution=contribution
+        ))
+
+    def meta(self, code):
+        path = os.path.join(self.fund_dir(code), "meta.json")
+        with self.lock:
+            return read_json_file(path) if os.path.exists(path) else dict()
+
+    def load(self, code, max_age=FUND_STORE_MAX_AGE):
+        """
+        Create the Fund object of the given code from the local store without fetching anything.
+        :return: the Fund object, or None if the fund has not been synced in the past max_age seconds
+        """
+        synced = self.meta(code).get("synced")
+        if synced is None or time.time() - synced > max_age:
+            return None
+        directory = self.fund_dir(code)
+        try:
+            with open(os.path.join(directory, "fund_data.js"), "r", encoding="utf-8") as file:
+                fund_data_html = file.read()
+            with open(os.path.join(directory, "stocks.html"), "rb") as file:
+                stock_html = file.read()
+            historical_data = pd.read_csv(os.path.join(directory, "nav.csv"), parse_dates=["date"], encoding="utf-8")
+        except (OSError, ValueError):
+            return None
+        fund = Fund(code, fund_data_html, stock_html, historical_data)
+        fund.fetched = synced
+        fund.historical_data_fetched = synced
+        return fund
+
+    def load_prediction(self, code):
+        """
+        :return: the last prediction saved for the fund as described in the class docstring, or None
+        """
+        return self.meta(code).get("prediction")
+
+
+fund_store = FundStore(FUND_STORE_DIR)
@@ -5,10 +5,10 @@ from html import unescape
 from html.parser import HTMLParser
 from urllib.parse import quote, unquote
 
-import requests
-
+from background import JobThreadPoolExecutor
 from constants import *
 from logger import logger
+from rate_limiter import scheduler
 
 
 class GoogleClient:
@@ -19,11 +19,24 @@ class GoogleClient:
         except KeyError:
             print("API_KEY for google services needs to be present!")
 
-    def analyze_sentiment(self):
-        payload = open(REQUEST_FILE, "rb")
+    def analyze_sentiment(self, text=None, timeout=None):
+        """
+        Send the given text to the natural language API for sentiment analysis.
+        If no text is given, the request in data/request.json is sent instead.
+        """
         headers = {'content-type': 'application/json'}
-        response = requests.post(GOOGLE_LANGUAGE_API.format(self.key), data=payload, headers=headers)
-        return response.json()
+        if text is None:
+            payload = open(REQUEST_FILE, "rb")
+            response = scheduler.post(GOOGLE_LANGUAGE_API.format(self.key), data=payload, headers=headers,
+                                      timeout=timeout)
+        else:
+            payload = dict(document=dict(type="PLAIN_TEXT", content=text))
+            response = scheduler.post(GOOGLE_LANGUAGE_API.format(self.key), json=payload, headers=headers,
+                                      timeout=timeout)
+        reply = response.json()
+        if "error" in reply:
+            raise ConnectionError(reply["error"].get("message"))
+        return reply
 
 
 class GoogleServices:
@@ -31,18 +44,35 @@ class GoogleServices:
         self.client = GoogleClient()
         logger.log("Google services initialized successfully")
 
-    def google_search(self, query, num_result, date_range):
+    def google_search(self, query, num_result, date_range, timeout=None):
         """
         Returns a list of search results given the query.
         Each element in the list includes both the title
         as well as the url of the result.
         """
-        return search(query, num_result, date_range)
+        return search(query, num_result, date_range, timeout)
 
-    def analyze_text(self):
-        reply = self.client.analyze_sentiment()
+    def analyze_text(self, text=None, timeout=None):
+        reply = self.client.analyze_sentiment(text, timeout)
         return reply
 
+    def analyze_texts(self, texts, timeout=None):
+        """
+        Analyze the sentiment of each of the given texts concurrently.
+        :return: a list of tuples (reply, exception) in the same order as the texts. Exactly
+        one of the two elements is None.
+        """
+        def analyze(text):
+            try:
+                return self.analyze_text(text, timeout), None
+            except Exception as exception:
+                return None, exception
+
+        if len(texts) <= 1:
+            return [analyze(text) for text in texts]
+        with JobThreadPoolExecutor(max_workers=min(SENTIMENT_WORKERS, len(texts))) as executor:
+            return list(executor.map(analyze, texts))
+
 
 """
 Search functionality comes from the following repo:
@@ -50,19 +80,28 @@ https://github.com/aviaryan/python-gsearch/blob/master/gsearch/googlesearch.py
 """
 
 
+# Patterns used to parse the search results, compiled once
+url_pattern = re.compile(r'((https?):((//)|(\\\\))+([\w\d:#@%/;$()~_?\+-=\\\.&](#!)?)*)')
+tag_pattern = re.compile(r'<.*?>')
+# A result is a link to /url followed by its title in an <h3>, without leaving the <div> of the link
+result_pattern = re.compile(r'<div class=\"\w+\"><a href=\"(/url?[^"]*)\">(?:(?!</div>).)*?'
+                            r'<h3 class=\"\w+\"><div class=\"[\w\s]+\">(.*?)</div>', re.IGNORECASE)
+url_prefix_pattern = re.compile(r'^.*?=')
+url_suffix_pattern = re.compile(r'\&amp.*$')
+
+
 def is_url(url):
     """
     checks if :url is a url
     """
-    regex = r'((https?):((//)|(\\\\))+([\w\d:#@%/;$()~_?\+-=\\\.&](#!)?)*)'
-    return re.match(regex, url) is not None
+    return url_pattern.match(url) is not None
 
 
 def prune_html(text):
     """
     https://stackoverflow.com/a/42461722/2295672
     """
-    text = re.sub(r'<.*?>', '', text)
+    text = tag_pattern.sub('', text)
     return text
 
 
@@ -79,20 +118,21 @@ def convert_unicode(text):
     return s
 
 
-def download(query, num_results, date_range):
+def download(query, start, date_range, timeout=None):
     """
-    downloads HTML after google search
+    downloads HTML of the page of google search results starting at :start
     """
     # https://stackoverflow.com/questions/11818362/how-to-deal-with-unicode-string-in-url-in-python3
     name = quote(query)
 
     name = name.replace(' ', '+')
     url = 'http://www.google.com/search?q={}&tbs=qdr:{}&tbm=nws'.format(name, date_range)
-    if num_results != 10:
-        url += '&num=' + str(num_results)  # adding this param might hint Google towards a bot
+    # Further pages are requested like a browser does, since &num= might hint Google towards a bot
+    if start > 0:
+        url += '&start=' + str(start)
     # req = request.get(url)
     try:
-        response = requests.get(url)
+        response = scheduler.get(url, timeout=timeout)
     except Exception:  # catch connection issues
         # may also catch 503 rate limit exceed
         print('[ERROR] Search failed!\n')
@@ -103,36 +143,53 @@ def download(query, num_results, date_range):
     return data
 
 
-def search(query, num_results=10, date_range="w"):
+def parse_results(data):
     """
-    searches google for :query and returns a list of tuples
+    parses a page of search results in a single pass and returns a list of tuples
     of the format (name, url)
     """
-    data = download(query, num_results, date_range)
-    results = re.findall(r'<div class=\"\w+\"><a href=\"/url?.*?\">.*?</div>', data, re.IGNORECASE)
-    if results is None or len(results) == 0:
-        print('No results where found. Did the rate limit exceed?')
-        return []
-    # search has results
     links = []
-    for r in results:
-        url_match = re.search(r'<a\s*href=\"(.*?)\">', r, flags=re.IGNORECASE)
-        if url_match is None:
-            continue
+    for match in result_pattern.finditer(data):
         # parse url
-        url = url_match.group(1)
+        url = match.group(1)
         # clean url https://github.com/aviaryan/pythons/blob/master/Others/GoogleSearchLinks.py
-        url = re.sub(r'^.*?=', '', url, count=1)  # prefixed over urls \url=q?
-        url = re.sub(r'\&amp.*$', '', url, count=1)  # suffixed google things
+        url = url_prefix_pattern.sub('', url, count=1)  # prefixed over urls \url=q?
+        url = url_suffix_pattern.sub('', url, count=1)  # suffixed google things
         url = unquote(url)
         # url = re.sub(r'\%.*$', '', url) # NOT SAFE, causes issues with Youtube watch url
         # parse name
-        title_match = re.search(r'<h3 class=\"\w+\"><div class=\"[\w\s]+\">(.*?)<\/div>', r, flags=re.IGNORECASE)
-        if title_match is None:
-            continue
-        name = prune_html(title_match.group(1))
+        name = prune_html(match.group(2))
         name = convert_unicode(name).strip(" ...")
         # append to links
         if is_url(url):  # can be google images result
             links.append((name, url))
     return links
+
+
+def search(query, num_results=10, date_range="w", timeout=None):
+    """
+    searches google for :query and returns a list of tuples
+    of the format (name, url)
+    The pages of results needed for :num_results are downloaded concurrently, within the
+    rate limit of Google, and merged in order without duplicate urls.
+    """
+    starts = range(0, max(1, num_results), SEARCH_RESULTS_PER_PAGE)
+    if len(starts) == 1:
+        pages = [download(query, 0, date_range, timeout)]
+    else:
+        with JobThreadPoolExecutor(max_workers=len(starts)) as executor:
+            pages = list(executor.map(lambda start: download(query, start, date_range, timeout), starts))
+    links = []
+    seen = set()
+    for data in pages:
+        for name, url in parse_results(data):
+            if url not in seen:
+                seen.add(url)
+                links.append((name, url))
+    if len(links) == 0:
+        print('No results where found. Did the rate limit exceed?')
+        # Google returns an empty page instead of an error when it suspects a bot
+        if any(data != '' for data in pages):
+            scheduler.report_throttled('http://www.google.com/search')
+        return []
+    return links[:num_results]
@@ -0,0 +1,116 @@
+import os
+import threading
+from datetime import datetime
+
+from background import JobThreadPoolExecutor
+from constants import *
+from fund import Fund
+from logger import logger
+from utils import read_json_file, dump_json_to_file
+
+
+class HoldingsIndex:
+    """
+    An inverted index from stocks to the funds that hold them, kept in data/holdings_index.json
+    in the following format:
+    {"stocks": {stock_code: {fund_code: {"position_ratio": position_ratio, "date": disclosure date}}},
+     "funds": {fund_code: {"name": fund_name, "stocks": [stock_code], "date": disclosure date,
+                           "updated": time of the last update}},
+     "names": {stock_code: stock_name}}
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # The file is only created once the first fund is indexed
+        self.data = read_json_file(path) if os.path.exists(path) else dict(stocks=dict(), funds=dict(), names=dict())
+        self.codes_by_name = {"".join(name.split()): code for code, name in self.data["names"].items()}
+        # Stocks left without holders by an earlier version are dropped
+        for stock_code in [code for code, holders in self.data["stocks"].items() if len(holders) == 0]:
+            self._remove_stock(stock_code)
+
+    def _remove_stock(self, stock_code):
+        """
+        Remove a stock that no fund holds anymore, so that it is neither found nor completed.
+        """
+        self.data["stocks"].pop(stock_code, None)
+        name = self.data["names"].pop(stock_code, None)
+        if name is not None and self.codes_by_name.get("".join(name.split())) == stock_code:
+            del self.codes_by_name["".join(name.split())]
+
+    def update(self, fund, save=True):
+        """
+        Replace the entries of the given fund with its current stock positions.
+        """
+        stocks = fund.stocks
+        date = fund.stocks_date
+        with self.lock:
+            previous = self.data["funds"].get(fund.code)
+            if previous is not None:
+                for stock_code in previous["stocks"]:
+                    holders = self.data["stocks"].get(stock_code, dict())
+                    holders.pop(fund.code, None)
+                    if len(holders) == 0:
+                        self._remove_stock(stock_code)
+            for stock in stocks:
+                self.data["stocks"].setdefault(stock["code"], dict())[fund.code] = dict(
+                    position_ratio=stock["position_ratio"],
+                    date=date
+                )
+                self.data["names"][stock["code"]] = stock["name"]
+                self.codes_by_name["".join(stock["name"].split())] = stock["code"]
+            self.data["funds"][fund.code] = dict(
+                name=fund.data["name"],
+                stocks=[stock["code"] for stock in stocks],
+                date=date,
+                updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+            if save:
+                self.save()
+
+    def refresh(self, fund_codes, workers=4):
+        """
+        Fetch the stock positions of the given funds concurrently and add them to the index.
+        :return: a list of tuples (fund code, exception) of the funds that could not be updated
+        """
+        failures = []
+
+        def refresh_fund(code):
+            try:
+                self.update(Fund(code), save=False)
+            except Exception as exception:
+                logger.log("Failed to update holdings of {}: {}".format(code, exception), "error")
+                failures.append((code, exception))
+
+        with JobThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(refresh_fund, fund_codes))
+        with self.lock:
+            self.save()
+        return failures
+
+    def save(self):
+        dump_json_to_file(self.data, self.path)
+
+    def find_stock_code(self, text):
+        """
+        Return the code of the stock given by its code or name, or None if it is not in the index.
+        """
+        if text in self.data["stocks"]:
+            return text
+        return self.codes_by_name.get("".join(text.split()))
+
+    def holders(self, stock_code):
+        """
+        Return the funds that hold the given stock, with the largest positions first, in a
+        list of dictionaries with the keys fund_code, name, position_ratio and date.
+        """
+        holders = [dict(fund_code=fund_code, name=self.data["funds"][fund_code]["name"],
+                        position_ratio=holding["position_ratio"], date=holding["date"])
+                   for fund_code, holding in self.data["stocks"].get(stock_code, dict()).items()]
+        return sorted(holders, key=lambda holder: holder["position_ratio"], reverse=True)
+
+    @property
+    def stock_names(self):
+        return list(self.data["names"].values())
+
+
+holdings_index = HoldingsIndex(HOLDINGS_INDEX_FILE)
@@ -1,4 +1,5 @@
 import logging
+import threading
 
 from utils import read_json_file, dump_json_to_file
 
@@ -17,6 +18,8 @@ class InfoLogger:
     def __init__(self, log_path, article_log_path):
         self.log_path = log_path
         self.article_log = article_log_path
+        # Articles are logged from several threads during an analysis
+        self.article_lock = threading.Lock()
         logging.basicConfig(format='[%(levelname)s] %(asctime)s: %(message)s',
                            datefmt='%m/%d/%Y %I:%M:%S %p',
                            level=logging.INFO,
@@ -41,14 +44,15 @@ class InfoLogger:
         :param content: the text content of the article
         """
         title, url = search_result
-        data = read_json_file(self.article_log)
-        if data.get(stock_name) is None:
-            data[stock_name] = dict()
-        data[stock_name][url] = dict(
-            title=title,
-            content=content
-        )
-        dump_json_to_file(data, self.article_log)
+        with self.article_lock:
+            data = read_json_file(self.article_log)
+            if data.get(stock_name) is None:
+                data[stock_name] = dict()
+            data[stock_name][url] = dict(
+                title=title,
+                content=content
+            )
+            dump_json_to_file(data, self.article_log)
         self.log("Saved content of article {} to article.log.json. ({})".format(title, stock_name))
 
     def get_all_articles(self):
@@ -1,12 +1,30 @@
+import asyncio
 import cmd
-from enum import Enum
+import copy
+import time
+from datetime import datetime
 from functools import wraps
 
-from tqdm import tqdm
-
+from backtest import record_prediction, load_predictions, fetch_daily_yields, backtest
+from background import JobManager, current_job
+from charts import get_chart_path, render_fund_charts
+from exporter import get_export_format, missing_dependency, export_funds, export_predictions
+from extraction import extraction_stats
 from fund import Fund
+from fund_cache import fund_cache
+from fund_index import fund_index
+from fund_store import fund_store
 from google_services import GoogleServices
+from holdings_index import holdings_index
+from nav_estimates import NavEstimateWatcher, is_trading_time
+from negative_cache import negative_cache
 from network_test import network_test
+from portfolio import compare_funds
+from prediction_cache import prediction_cache
+from predictor import Predictor, DateRange, default_analysis_config
+from relevance import RelevanceFilter
+from sentiment import create_sentiment_providers
+from session import SessionSnapshot
 from text_extractor import HTMLTextExtractor
 from utils import *
 try:
@@ -16,19 +34,11 @@ except FileNotFoundError:
     exit()
 from cmd import Cmd
 
-shorthands = dict(
-    nav="net_asset_value",
-    cnv="cumulative_value",
-    dy="daily_yield"
-)
-
-
-class DateRange(Enum):
-    h = 'Past hour'
-    d = 'Past day'
-    w = 'Past week'
-    m = 'Past month'
-    y = 'Past year'
+prediction_columns = ["Name", "Sentiment score", "Position Ratio", "Weighted Score", "Coverage"]
+estimate_columns = ["Code", "Name", "NAV", "NAV date", "Estimate", "Change (%)", "Time"]
+# Commands that change the state of the shell, such as its current fund or the analysis parameters, or control
+# the background jobs, and cannot be run in the background themselves
+foreground_commands = {"set", "param", "jobs", "wait", "cancel", "clear", "exit", "EOF"}
 
 
 class FundAssistant(Cmd):
@@ -43,14 +53,15 @@ class FundAssistant(Cmd):
         self.fund_obj = None
         self.google_service = GoogleServices()
         self.text_extractor = HTMLTextExtractor()
+        self.relevance_filter = RelevanceFilter()
+        self.sentiment_providers = create_sentiment_providers(self.google_service)
         self.analysis_statistics = None
-        self.prediction_contribution = None
+        self.jobs = JobManager()
         # Parameters used for stock analysis
-        self.analysis_config = dict(
-            num_results=10,
-            date_range=DateRange.w,
-            verbose=True
-        )
+        self.analysis_config = default_analysis_config()
+        self.session = SessionSnapshot(SESSION_FILE)
+        self.session_saved = time.time()
+        self._restore_session()
 
     # ==================== Custom decorators ====================
     def _requires_fund_obj(func):
@@ -65,8 +76,9 @@ class FundAssistant(Cmd):
     def _requires_google_api_key(func):
         @wraps(func)
         def inner(self, *args, **kwargs):
-            if self.google_service.client.key is None:
-                logger.log("'predict' command cannot be executed until an API_KEY is present", "warning", False)
+            if self.google_service.client.key is None and self.analysis_config["sentiment"] == "google":
+                logger.log("'predict' command cannot be executed until an API_KEY is present.\n"
+                           "Use 'param s local' to analyze sentiment without the API_KEY.", "warning", False)
             else:
                 return func(self, *args, **kwargs)
         return inner
@@ -76,6 +88,55 @@ class FundAssistant(Cmd):
         logger.log("num_results: {}".format(self.analysis_config["num_results"]), quiet=False)
         logger.log("date_range : {}".format(self.analysis_config["date_range"].value), quiet=False)
         logger.log("verbose    : {}".format(self.analysis_config["verbose"]), quiet=False)
+        logger.log("relevance  : {}".format(self.analysis_config["relevance_filter"]), quiet=False)
+        logger.log("stock time : {}s".format(self.analysis_config["stock_timeout"]), quiet=False)
+        logger.log("total time : {}s".format(self.analysis_config["command_timeout"]), quiet=False)
+        logger.log("incremental: {}".format(self.analysis_config["incremental"]), quiet=False)
+        logger.log("sentiment  : {}".format(self.analysis_config["sentiment"]), quiet=False)
+
+    def _create_predictor(self):
+        # Progress bars and the payload file are left out when predicting in the background
+        return Predictor(self.analysis_config, self.google_service, self.text_extractor, self.relevance_filter,
+                         self.sentiment_providers, interactive=current_job() is None)
+
+    def _restore_session(self):
+        """
+        Restore the analysis parameters and the current fund from the snapshot of the last session.
+        The other funds of the snapshot are restored when they are set. A snapshot that cannot be
+        restored, e.g. because it was saved by an older version, is discarded.
+        """
+        try:
+            analysis_config = default_analysis_config()
+            config = self.session.meta.get("analysis_config")
+            if config is not None:
+                analysis_config.update(config)
+                analysis_config["date_range"] = DateRange[config["date_range"]]
+            current = self.session.meta.get("current")
+            fund = self.session.restore_fund(current) if current is not None else None
+            name = fund.data["name"] if fund is not None else None
+        except Exception as exception:
+            logger.log("Failed to restore the session from {}, starting with an empty session: {}"
+                       .format(SESSION_FILE, exception), "error", False)
+            self.session.reset()
+            return
+        self.analysis_config = analysis_config
+        if fund is not None:
+            fund_cache.put(fund)
+            self.fund_obj = fund
+            self.prompt = "fund-assistant ({})> ".format(fund.code)
+            logger.log("Session restored, current fund set to {} ({})".format(name, fund.code), quiet=False)
+
+    def _save_session(self):
+        funds = list(fund_cache.funds().values())
+        if self.fund_obj is not None and self.fund_obj not in funds:
+            funds.append(self.fund_obj)
+        config = dict(self.analysis_config, date_range=self.analysis_config["date_range"].name)
+        try:
+            self.session.save(funds, self.fund_obj.code if self.fund_obj is not None else None, config)
+            logger.log("Saved a snapshot of the session with {} funds to {}".format(len(funds), SESSION_FILE))
+        except OSError as exception:
+            logger.log("Failed to save the snapshot of the session: {}".format(exception), "error", False)
+        self.session_saved = time.time()
 
     # ==================== Base class methods overrides ====================
     def parseline(self, line):
@@ -87,20 +148,75 @@ class FundAssistant(Cmd):
     def emptyline(self):
         pass
 
+    def _bound_shell(self):
+        """
+        Return a copy of the shell for a background job that keeps the current fund and analysis parameters,
+        so that the job is not affected by 'set' or 'param' commands entered while it runs.
+        """
+        shell = copy.copy(self)
+        shell.analysis_config = dict(self.analysis_config)
+        return shell
+
+    def onecmd(self, line):
+        """
+        Run commands that end with '&' in the background, on the fund and analysis parameters
+        of the shell at the time they are entered.
+        """
+        line = line.strip()
+        if not line.endswith("&"):
+            return cmd.Cmd.onecmd(self, line)
+        command = line[:-1].strip()
+        name = command.split()[0] if command else ""
+        if name == "" or name in foreground_commands:
+            logger.log("Command '{}' cannot be run in the background".format(command), "error", False)
+            return False
+        shell = self._bound_shell()
+        job = self.jobs.submit(command, lambda: cmd.Cmd.onecmd(shell, command))
+        logger.log("[{}] {}".format(job.id, command), quiet=False)
+        return False
+
+    def postcmd(self, stop, line):
+        for job in self.jobs.unreported():
+            logger.log("[{}] {} {} ({:.1f}s), use 'wait {}' to see its output"
+                       .format(job.id, job.status, job.command, job.elapsed, job.id), quiet=False)
+        if not stop and time.time() - self.session_saved > SESSION_SAVE_INTERVAL:
+            self._save_session()
+        return stop
+
     # ==================== Interactive commands ====================
-    def do_set(self, fund_code):
+    def do_set(self, arg):
         """Sets the fund to analyze to be the one specified by the parameter fund code.
-Usage: fund <fund_code>"""
+If the fund code is not listed in the local index of funds, the parameter is looked up as the name,
+abbreviation or pinyin of a fund instead, and the fund is set if there is exactly one match.
+Funds set in the past hour are taken from the current session, as long as they fit in its memory budget.
+Funds used in the last session and funds synced by the daemon in the past day are loaded from disk
+without fetching them.
+Press <TAB> to complete the fund code.
+Usage: set <fund_code>"""
+        fund_code = self._resolve_fund_code(arg.strip())
+        if fund_code is None:
+            return
 
         # Change the command prompt style
         logger.log("Retrieving data on fund with code {}".format(fund_code))
         try:
-            self.fund_obj = Fund(fund_code)
+            fund = fund_cache.get(fund_code)
+            if fund is not None:
+                logger.log("Data on {} taken from the current session".format(fund_code))
+            else:
+                fund = self._load_fund(fund_code)
+                # Parse the fund before caching it so that funds that do not exist are left out
+                fund.data["name"]
+                fund_cache.put(fund, fund.fetched)
+            self.fund_obj = fund
             fund_name = self.fund_obj.data["name"]
-            self.prediction_contribution = dict()
             logger.log("Data retrieval successful", quiet=False)
             logger.log("Current fund set to {} ({})".format(fund_name, fund_code), quiet=False)
             self.prompt = "fund-assistant ({})> ".format(fund_code)
+            try:
+                holdings_index.update(self.fund_obj)
+            except Exception as exception:
+                logger.log("Failed to add the holdings of {} to the index: {}".format(fund_code, exception), "error")
         except AttributeError:
             logger.log("Failed to retrieve data on fund with code {}\n"
                        "Make sure there is a stable Internet connection and the fund exists.".format(fund_code),
@@ -108,6 +224,115 @@ Usage: fund <fund_code>"""
         except Exception as exception:
             logger.log(exception, "error", quiet=False)
 
+    def _load_fund(self, fund_code):
+        """
+        Create the Fund object of the given code from the snapshot of the last session or from the
+        local store if the daemon has synced it recently, together with its prediction, or fetch it otherwise.
+        """
+        fund = self.session.restore_fund(fund_code)
+        if fund is not None:
+            logger.log("Data on {} restored from the last session".format(fund_code), quiet=False)
+            return fund
+        fund = fund_store.load(fund_code)
+        if fund is None:
+            return Fund(fund_code)
+        logger.log("Data on {} loaded from the local store, synced at {}"
+                   .format(fund_code, datetime.fromtimestamp(fund.fetched).strftime("%Y-%m-%d %H:%M")), quiet=False)
+        stored_prediction = fund_store.load_prediction(fund_code)
+        if stored_prediction is not None and time.time() - stored_prediction["timestamp"] < FUND_STORE_MAX_AGE:
+            fund.overall_prediction = stored_prediction["prediction"]
+            fund.overall_confidence = stored_prediction["confidence"]
+            fund.prediction_contribution = stored_prediction["contribution"]
+            fund.predicted = stored_prediction["timestamp"]
+        return fund
+
+    def _resolve_fund_code(self, text):
+        """
+        Look up the code of the fund given by text in the local index of funds.
+        :return: the fund code, or None if there is no unique match. If the index is not
+        available, text is returned unchanged.
+        """
+        if not fund_index.load() or fund_index.contains(text):
+            return text
+        matches = fund_index.search(text, limit=10)
+        if len(matches) == 1:
+            return matches[0]["code"]
+        if len(matches) == 0:
+            logger.log("There is no fund that matches '{}'. Use 'search <text>' to look for funds.".format(text),
+                       "error", False)
+        else:
+            logger.log("'{}' matches more than one fund:".format(text), "error", False)
+            logger.log(table_str(matches, ["Code", "Name", "Type"]), quiet=False)
+        return None
+
+    def complete_set(self, text, line, begidx, endidx):
+        if not fund_index.load():
+            return []
+        rows = fund_index.prefix_search(text)[:MAX_COMPLETIONS]
+        return [str(code) for code in fund_index.columns["code"][rows]]
+
+    def do_search(self, arg):
+        """Searches the local index of all funds by code, name, abbreviation or pinyin. Funds whose
+code, name, abbreviation or pinyin start with the text are listed first, followed by funds that contain it.
+The index is downloaded from eastmoney when it is used for the first time and refreshed every week.
+Performs actions based on the arguments given:
+> search <text> : lists the funds that match <text>, e.g. 'search 白酒', 'search zszz', 'search 1617'
+> search refresh: downloads the list of funds again"""
+        text = arg.strip()
+        if text == "refresh":
+            if fund_index.load(refresh=True):
+                logger.log("Index of {} funds refreshed".format(len(fund_index.columns["code"])), quiet=False)
+            return
+        if text == "":
+            logger.log("Please enter the text to search for", "error", False)
+            return
+        if not fund_index.load():
+            logger.log("The index of funds is not available. Make sure there is a stable Internet connection.",
+                       "error", False)
+            return
+        start = time.perf_counter()
+        matches = fund_index.search(text)
+        logger.log("Search for '{}' took {:.3f}ms".format(text, (time.perf_counter() - start) * 1000))
+        if len(matches) == 0:
+            logger.log("No fund matches '{}'".format(text), quiet=False)
+        else:
+            logger.log(table_str(matches, ["Code", "Name", "Type"]), quiet=False)
+
+    def do_holders(self, arg):
+        """Lists the funds that hold a stock, based on the stock positions of every fund that has been set
+with 'set' or added with 'holders refresh'.
+Performs actions based on the arguments given:
+> holders <stock_code>        : lists the funds that hold the stock given by <stock_code> and their position ratios
+> holders <stock_name>        : lists the funds that hold the stock given by <stock_name>
+> holders refresh <fund_codes>: fetches the stock positions of the funds given by <fund_codes>, separated by
+                                commas, and adds them to the index"""
+        args = arg.split()
+        if len(args) == 0:
+            logger.log("Please enter the code or the name of a stock", "error", False)
+            return
+        if args[0] == "refresh":
+            if len(args) < 2:
+                logger.log("Please enter the codes of the funds separated by commas", "error", False)
+                return
+            fund_codes = [code for code in args[1].split(",") if code]
+            failures = holdings_index.refresh(fund_codes)
+            logger.log("Holdings of {} of {} funds updated".format(len(fund_codes) - len(failures), len(fund_codes)),
+                       quiet=False)
+            for code, exception in failures:
+                logger.log("{}: {}".format(code, exception), "error", False)
+            return
+
+        stock_code = holdings_index.find_stock_code(" ".join(args))
+        if stock_code is None:
+            logger.log("None of the indexed funds hold {}".format(" ".join(args)), "error", False)
+            return
+        holders = holdings_index.holders(stock_code)
+        logger.log("Funds holding {} ({}):".format(holdings_index.data["names"][stock_code], stock_code), quiet=False)
+        logger.log(table_str(holders, ["Fund code", "Fund name", "Ratio", "Disclosure date"]), quiet=False)
+
+    def complete_holders(self, text, line, begidx, endidx):
+        return get_autocomplete_terms(text, holdings_index.stock_names)
+
     @_requires_fund_obj
     def do_fund(self, arg):
         """Performs actions based on the arguments given:
@@ -122,7 +347,8 @@ Usage: fund <fund_code>"""
 > fund dy <int>  : prints the daily yield value of the fund in the past <int> months
 > fund stocks    : prints the stock positions of the current fund
 > fund yields    : prints the yields of the fund in 1 year, 6 months, 3 months and 1 month
-> fund prediction: prints the contribution of each stock to the overall prediction of the fund"""
+> fund prediction: prints the contribution of each stock to the overall prediction of the fund
+> fund estimate  : prints the intraday estimate of the net asset value of the fund"""
         args = arg.split()
 
         def print_fund_code():
@@ -143,13 +369,24 @@ Usage: fund <fund_code>"""
 
         def print_prediction():
             if self.fund_obj.overall_prediction is not None:
-                table = table_str(list(self.prediction_contribution.values()),
-                                  ["Name", "Sentiment score", "Position Ratio", "Weighted Score"])
+                table = table_str(list(self.fund_obj.prediction_contribution.values()), prediction_columns)
                 logger.log(table, quiet=False)
             else:
                 logger.log("You need to run 'predict all' command first to obtain the predictions of each stock",
                            "error", False)
 
+        def print_estimate():
+            try:
+                estimate = self.fund_obj.estimate()
+            except Exception as exception:
+                logger.log("Failed to fetch the estimate of {}: {}".format(self.fund_obj.code, exception), "error",
+                           False)
+                return
+            if estimate is None:
+                logger.log("There is no intraday estimate for {}".format(self.fund_obj.code), "warning", False)
+                return
+            logger.log(table_str([estimate], estimate_columns), quiet=False)
+
         def print_historical_data():
             column_name = args[0]
             months = 1
@@ -178,7 +415,8 @@ Usage: fund <fund_code>"""
             nav=print_historical_data,
             cnv=print_historical_data,
             dy=print_historical_data,
-            prediction=print_prediction
+            prediction=print_prediction,
+            estimate=print_estimate
         )
 
         try:
@@ -187,39 +425,99 @@ Usage: fund <fund_code>"""
         except KeyError:
             logger.log("Command 'fund {}' not supported".format(arg), "error", False)
 
-    @_requires_fund_obj
     def do_plot(self, arg):
         """Performs actions based on the arguments given:
 > plot <options>      : plots the any combination of the three metrics nav, cnv, and dy for the current fund
                         in the past month. Note that metrics must be separated with spaces.
                         i.e. 'plot nav', 'plot nav cnv', 'plot nav cnv dy'
 > plot <options> <int>: performs the same plotting action as 'plot <options>'. The only difference is
-                        <int> specifies that data will be selected from the previous <int> months."""
+                        <int> specifies that data will be selected from the previous <int> months.
+> plot save <options> [int]: renders the chart to a file in ./charts instead of showing it. 'png' or 'svg'
+                        can be added to the options to choose the format [Default: png].
+                        i.e. 'plot save nav cnv 12', 'plot save svg dy'
+> plot batch <fund_codes> [options] [int]: renders the charts of all the funds given by <fund_codes>, separated
+                        by commas, to files in ./charts. All three metrics are plotted if none is given.
+                        i.e. 'plot batch 161725,110011 nav 12'
+Long histories are downsampled before plotting. Without a display or in the background, charts are always saved
+to files."""
+        input_args = arg.split()
+        if len(input_args) > 0 and input_args[0] == "batch":
+            self._plot_batch(input_args[1:])
+        elif len(input_args) > 0 and input_args[0] == "save":
+            self._plot_fund(input_args[1:], True)
+        else:
+            # Windows can only be shown from the main thread, so charts plotted in the background are saved
+            self._plot_fund(input_args, not has_display() or current_job() is not None)
 
+    @staticmethod
+    def _parse_plot_args(input_args):
+        """
+        Parse the options of the 'plot' command.
+        :return: a tuple (list of metrics, number of months, file format) or None if the options are invalid
+        """
         possible_metrics = {"nav", "cnv", "dy"}
+        possible_formats = {"png", "svg"}
         metrics_to_plot = []
-        input_args = arg.split()
         months = 1
+        file_format = "png"
         for i, metric in enumerate(input_args):
-            if i > 3:
+            if len(metrics_to_plot) > 3:
                 logger.log("The number of arguments cannot be greater than 4", "error", False)
-                return
+                return None
             if metric.isdigit():
                 if i != len(input_args) - 1:  # if the integer argument is not the last argument
                     logger.log("The integer must be the last argument", "error", False)
-                    return
+                    return None
                 months = int(metric)
+            elif metric in possible_formats:
+                file_format = metric
             else:
                 if metric not in possible_metrics:
                     logger.log("Argument {} is not a possible metric to plot".format(metric), "error", False)
-                    return
+                    return None
                 else:
                     metrics_to_plot.append(metric)
+        return metrics_to_plot, months, file_format
 
+    @_requires_fund_obj
+    def _plot_fund(self, input_args, save):
+        parsed_args = self._parse_plot_args(input_args)
+        if parsed_args is None:
+            return
+        metrics_to_plot, months, file_format = parsed_args
+        fund = self.fund_obj
         if len(metrics_to_plot) == 0:
             logger.log("There has to be at least one metric", "error", False)
+        elif save:
+            os.makedirs(CHART_DIR, exist_ok=True)
+            file_path = render_historical_data(
+                fund.get_historical_data(list(shorthands.values()), months), metrics_to_plot,
+                get_chart_path(fund.code, metrics_to_plot, months, file_format)
+            )
+            logger.log("Chart saved to {}".format(file_path), quiet=False)
         else:
-            graph_historical_data(self.fund_obj.get_historical_data(list(shorthands.values()), months), metrics_to_plot)
+            graph_historical_data(fund.get_historical_data(list(shorthands.values()), months), metrics_to_plot)
+
+    def _plot_batch(self, input_args):
+        if len(input_args) == 0:
+            logger.log("Please enter the codes of the funds separated by commas", "error", False)
+            return
+        fund_codes = [code for code in input_args[0].split(",") if code]
+        if len(fund_codes) == 0:
+            logger.log("Please enter the codes of the funds separated by commas", "error", False)
+            return
+        parsed_args = self._parse_plot_args(input_args[1:])
+        if parsed_args is None:
+            return
+        metrics_to_plot, months, file_format = parsed_args
+        if len(metrics_to_plot) == 0:
+            metrics_to_plot = list(shorthands.keys())
+        logger.log("Rendering charts of {} funds...".format(len(fund_codes)), quiet=False)
+        charts, failures = render_fund_charts(fund_codes, metrics_to_plot, months, file_format)
+        for code, file_path in charts:
+            logger.log("{}: {}".format(code, file_path), quiet=False)
+        for code, exception in failures:
+            logger.log("Failed to render chart of {}: {}".format(code, exception), "error", False)
 
     def do_param(self, arg):
         """Modifies the parameters used for predicting the value of stock. The parameters are as follows:
@@ -232,6 +530,19 @@ date_range : date range of the Google query, has the the following options [Defa
              y: past year
 verbose    : if set set to True, detailed messages will be printed out during news article retrieval. If
              it is False, a progress bar will be displayed instead. [Default: True]
+relevance  : if set to True, articles that are not about the stock are dropped and paragraphs that
+             are irrelevant are trimmed before the content is sent for sentiment analysis. [Default: True]
+stock time : time budget in seconds for analyzing a single stock. Articles that have not been fetched
+             by then are left out. [Default: 60]
+total time : time budget in seconds for a whole 'predict' command. Stocks that have not been analyzed
+             by then are given a score of 0 and a coverage of 0. [Default: 600]
+incremental: if set to True, only news articles that were not part of the previous analysis of a stock
+             are crawled and scored, and stocks without new articles reuse their previous score. [Default: True]
+sentiment  : backend used to analyze the sentiment of news articles [Default: 'google']:
+             google: Google natural language API, requires an API_KEY,
+             local : a financial sentiment lexicon scored on this machine, which is much faster, needs no
+                     API_KEY and suits screening many stocks before a final pass with Google. The news
+                     articles are still searched on Google and crawled, so it does not work offline
 
 Performs actions based on the arguments given:
 > param show          : displays the values of the parameters in use
@@ -239,7 +550,13 @@ Performs actions based on the arguments given:
 > param d <date_range>: sets the date_range parameter to be <date_range>. <date_range> can only be one of
                         letters in the list ['h', 'd', 'w', 'm', 'y']
 > param v             : toggles the value of the verbose parameter. If verbose is True, it will set to
-                        False after this command is executed, and vice versa."""
+                        False after this command is executed, and vice versa.
+> param r             : toggles the value of the relevance parameter.
+> param t <int>       : sets the stock time parameter to <int> seconds
+> param T <int>       : sets the total time parameter to <int> seconds
+> param i             : toggles the value of the incremental parameter
+> param s <backend>   : sets the sentiment parameter to <backend>, which can be 'google' or 'local'
+> param reset         : forgets the results of previous analyses"""
         args = arg.split()
 
         def show_params():
@@ -270,16 +587,62 @@ Performs actions based on the arguments given:
                     [date_range.name for date_range in DateRange]
                 ), "error", False)
 
+        def set_timeout(name, key):
+            try:
+                new_timeout = int(args[1])
+                if new_timeout <= 0:
+                    raise ValueError
+                self.analysis_config[key] = new_timeout
+                logger.log("Parameter {} successfully set to '{}s'".format(name, new_timeout), quiet=False)
+            except IndexError:
+                logger.log("There must another argument following '{}'".format(args[0]), "error", False)
+            except ValueError:
+                logger.log("The second argument given must be an integer greater than 0.", "error", False)
+
         def toggle_verbose():
             self.analysis_config["verbose"] = not self.analysis_config["verbose"]
             logger.log("Parameter {} successfully set to '{}'".format("verbose", self.analysis_config["verbose"]),
                        quiet=False)
 
+        def toggle_relevance_filter():
+            self.analysis_config["relevance_filter"] = not self.analysis_config["relevance_filter"]
+            logger.log("Parameter {} successfully set to '{}'".format("relevance",
+                                                                      self.analysis_config["relevance_filter"]),
+                       quiet=False)
+
+        def toggle_incremental():
+            self.analysis_config["incremental"] = not self.analysis_config["incremental"]
+            logger.log("Parameter {} successfully set to '{}'".format("incremental",
+                                                                      self.analysis_config["incremental"]),
+                       quiet=False)
+
+        def set_sentiment_provider():
+            try:
+                if args[1] not in self.sentiment_providers:
+                    raise KeyError
+                self.analysis_config["sentiment"] = args[1]
+                logger.log("Parameter {} successfully set to '{}'".format("sentiment", args[1]), quiet=False)
+            except IndexError:
+                logger.log("There must another argument following 's'", "error", False)
+            except KeyError:
+                logger.log("The second argument can only be one of {}".format(list(self.sentiment_providers.keys())),
+                           "error", False)
+
+        def reset_previous_analyses():
+            prediction_cache.clear()
+            logger.log("Results of previous analyses cleared", quiet=False)
+
         actions = dict(
             show=show_params,
             n=set_num_results,
             d=set_date_range,
-            v=toggle_verbose
+            v=toggle_verbose,
+            r=toggle_relevance_filter,
+            t=lambda: set_timeout("stock time", "stock_timeout"),
+            T=lambda: set_timeout("total time", "command_timeout"),
+            i=toggle_incremental,
+            s=set_sentiment_provider,
+            reset=reset_previous_analyses
         )
         try:
             parameter = args[0]
@@ -294,105 +657,47 @@ Performs actions based on the arguments given:
 sentiment analysis of the content of the articles. For the aggregate analysis, a number between
 -1 and 1 will be given. The greater the value, the more likely for the net asset value of the
 fund to increase. If the number is less than 0, the net asset value of the fund is likely to
-drop based on the prediction.
+drop based on the prediction. The sentiment is analyzed by Google natural language API or by a local
+model, depending on the sentiment parameter (see 'help param').
 Performs actions based on the argument given:
 > predict all         : performs an aggregate analysis to predict the trend of the net asset value of the fund
 > predict <stock_code>: predicts the trend of the value of the stock given by <stock_code>
 > predict <stock_name>: predicts the trend of the value of the stock given by <stock_name>"""
-        self.analysis_statistics = dict(
-            crawled_links=0,
-            failed_links=[]
-        )
+        predictor = self._create_predictor()
+        self.analysis_statistics = predictor.statistics
         logger.log("Analysis will be run with the following parameters:", quiet=False)
         self._show_analysis_params()
         quiet = not self.analysis_config["verbose"]
+        deadline = time.monotonic() + self.analysis_config["command_timeout"]
+        # The fund may be changed with 'set' while the prediction runs in the background
+        fund = self.fund_obj
         if arg == "all":
-            prediction = 0
-            for stock in self.fund_obj.stocks:
-                sentiment_score = self._run_analysis(stock["name"], quiet)
-                weighted_score = sentiment_score * stock["position_ratio"]
-                self.prediction_contribution[stock["code"]] = dict(
-                    name=stock["name"],
-                    sentiment_score=sentiment_score,
-                    position_ratio=stock["position_ratio"],
-                    weighted_score=weighted_score
-                )
-                logger.log("Weighted sentiment score of {:.3f} added to the current prediction".format(weighted_score),
-                           quiet=quiet)
-                prediction += weighted_score
-            self.fund_obj.overall_prediction = prediction / 100
-            logger.log("Prediction for {} ({}): {:.5f}"
-                       .format(self.fund_obj.data["name"], self.fund_obj.code, prediction / 100), quiet=False)
-            table = table_str(list(self.prediction_contribution.values()),
-                              ["Name", "Sentiment score", "Position Ratio", "Weighted Score"])
+            prediction, confidence, contribution = predictor.predict_fund(fund, quiet, deadline)
+            fund.overall_prediction = prediction
+            fund.overall_confidence = confidence
+            fund.prediction_contribution = contribution
+            fund.predicted = time.time()
+            logger.log("Prediction for {} ({}): {:.5f} (confidence: {:.0%})"
+                       .format(fund.data["name"], fund.code, prediction, confidence), quiet=False)
+            table = table_str(list(contribution.values()), prediction_columns)
             logger.log(table, quiet=False)
+            try:
+                record_prediction(fund.code, prediction, confidence, contribution)
+                fund_store.save_prediction(fund.code, prediction, confidence, contribution)
+            except OSError as exception:
+                logger.log("Failed to save the prediction to the history: {}".format(exception), "error", False)
         else:
             # Only supports stocks held in the fund
-            name = None
-            for stock in self.fund_obj.stocks:
+            target = None
+            for stock in fund.stocks:
                 if stock["name"] == arg or stock["code"] == arg:
-                    name = stock["name"]
-            if name is not None:
-                self._run_analysis(name, quiet)
+                    target = stock
+            if target is not None:
+                predictor.analyze_stock(target, quiet, deadline)
             else:
                 logger.log("Stock {} is not held in the current fund.\n"
-                           "Use 'fund stocks' to see stocks that can be analyzed.".format(name), "error", False)
-        logger.log("Statistics:")
-        logger.log("Total number links crawled: {}".format(self.analysis_statistics["crawled_links"]), quiet=False)
-        failed_links_num = len(self.analysis_statistics["failed_links"])
-        logger.log("Number of failed links: {}".format(failed_links_num), quiet=False)
-        for url, exception in self.analysis_statistics["failed_links"]:
-            logger.log("{}: {}".format(url, exception), quiet=False)
-
-    def _run_analysis(self, stock_name, quiet):
-        """
-        Performs the operation of gathering news links from Google, extracting
-        text from news articles, then sending it to Google natural language API.
-        :param stock_name: name of the stock to be analyzed
-        :return: the sentiment score returned by Google API
-        """
-        score = 0
-        logger.log("Searching news articles on Google on {}".format(stock_name), quiet=quiet)
-        clear_payload()
-        try:
-            results = self.google_service.google_search(
-                stock_name,
-                self.analysis_config["num_results"],
-                self.analysis_config["date_range"].name
-            )
-            logger.log("Search results retrieved successfully")
-
-            iterator = tqdm(enumerate(results), total=len(results), desc=stock_name, ncols=100) \
-                if quiet else enumerate(results)
-
-            for i, result in iterator:
-                logger.log("{}. {}: {}".format(i + 1, *result), quiet=quiet)
-                title, url = result
-                try:
-                    content_lines = self.text_extractor.extract_essential_text(url)
-                    content_lines = [title] + content_lines
-                    logger.log_article(stock_name, result, "\n".join(content_lines))
-                    add_to_payload("".join(content_lines) + "\n")
-                except Exception as exception:
-                    logger.log("Failed to extract text from url {}: {}".format(url, exception), "error")
-                    self.analysis_statistics["failed_links"].append((url, exception))
-                finally:
-                    self.analysis_statistics["crawled_links"] += 1
-            try:
-                prepare_payload()
-                reply = self.google_service.analyze_text()
-                logger.log("Obtained sentiment analysis for information gathered on {}: (score: {}, magnitude: {})".
-                           format(stock_name, reply["documentSentiment"]["score"],
-                                  reply["documentSentiment"]["magnitude"]), quiet=False),
-                score = reply["documentSentiment"]["score"]
-            except Exception as exception:
-                logger.log("Failed to analyze sentiment for information gathered on {}: {}"
-                           .format(stock_name, exception), "error", False)
-        except Exception as exception:
-            logger.log("Failed to fetch news articles on {} from Google due to: {}".format(stock_name, exception),
-                       "error", quiet)
-        finally:
-            return score
+                           "Use 'fund stocks' to see stocks that can be analyzed.".format(arg), "error", False)
+        predictor.log_statistics()
 
     def complete_predict(self, text, line, begidx, endidx):
         if self.fund_obj is not None:
@@ -408,6 +713,194 @@ Performs actions based on the argument given:
             return completions
         return ""
 
+    def do_backtest(self, arg):
+        """Evaluates the predictions made by 'predict all' in the past against the daily yields of the funds
+on the trading days that followed. Every 'predict all' command is saved to data/predictions.csv.
+Reports the number of predictions that could be evaluated, the hit rate (fraction of predictions with
+the correct sign), the correlation and rank correlation between predictions and realized yields, and
+the information coefficient (rank correlation across funds on the same day, averaged over days).
+Performs actions based on the arguments given:
+> backtest                        : evaluates all predictions against the yield of the next trading day
+> backtest -h <int>               : evaluates all predictions against the sum of the yields of the next <int>
+                                    trading days
+> backtest <fund_codes> [-h <int>]: only evaluates the predictions on the funds given by <fund_codes>,
+                                    separated by commas"""
+        args = arg.split()
+        horizon = 1
+        if "-h" in args:
+            position = args.index("-h")
+            try:
+                horizon = int(args[position + 1])
+                if horizon <= 0:
+                    raise ValueError
+            except (IndexError, ValueError):
+                logger.log("The number of trading days after -h must be an integer greater than 0", "error", False)
+                return
+            del args[position:position + 2]
+        if len(args) > 1:
+            logger.log("Usage: backtest [fund_codes] [-h <int>]", "error", False)
+            return
+        predictions = load_predictions()
+        if len(args) > 0:
+            predictions = predictions[predictions["fund_code"].isin(args[0].split(","))]
+        if len(predictions) == 0:
+            logger.log("There are no saved predictions to evaluate. Run 'predict all' first.", "error", False)
+            return
+
+        fund_codes = list(predictions["fund_code"].unique())
+        logger.log("Fetching daily yields of {} funds...".format(len(fund_codes)), quiet=False)
+        funds = fund_cache.funds()
+        yields, failures = fetch_daily_yields(fund_codes, funds)
+        for code, exception in failures:
+            logger.log("Failed to fetch daily yields of {}: {}".format(code, exception), "error", False)
+        metrics, matched = backtest(predictions, yields, horizon)
+        logger.log("Backtest over the next {} trading day(s):".format(horizon), quiet=False)
+        logger.log("Predictions evaluated: {} of {} ({} funds)"
+                   .format(metrics["samples"], len(predictions), metrics["funds"]), quiet=False)
+        for name, label in [("hit_rate", "Hit rate"), ("correlation", "Correlation"), ("rank_ic", "Rank IC"),
+                            ("ic", "Cross-sectional IC")]:
+            logger.log("{}: {:.3f}".format(label, metrics[name]), quiet=False)
+
+    def do_overlap(self, arg):
+        """Measures how redundant a group of funds is. For every pair of funds, the holdings overlap (sum of the
+smaller of the two position ratios over the stocks both funds hold, between 0 and 1) and the correlation
+of their daily yields are computed.
+Performs actions based on the arguments given:
+> overlap <fund_codes>              : compares the funds given by <fund_codes>, separated by commas, using the
+                                      daily yields of the past 12 months, and prints the most similar pairs
+> overlap <fund_codes> <int>        : uses the daily yields of the past <int> months instead
+> overlap <fund_codes> [int] <path> : writes every pair to the CSV file given by <path> instead of printing"""
+        args = arg.split()
+        if len(args) == 0:
+            logger.log("Please enter the codes of the funds separated by commas", "error", False)
+            return
+        fund_codes = list(dict.fromkeys(code for code in args[0].split(",") if code))
+        months = 12
+        path = None
+        for extra_arg in args[1:]:
+            if extra_arg.isdigit() and int(extra_arg) > 0:
+                months = int(extra_arg)
+            else:
+                path = extra_arg
+        if len(fund_codes) < 2:
+            logger.log("At least two funds are needed for a comparison", "error", False)
+            return
+
+        logger.log("Fetching data on {} funds...".format(len(fund_codes)), quiet=False)
+        funds = fund_cache.funds()
+        pairs, failures = compare_funds(fund_codes, months, funds)
+        for code, exception in failures:
+            logger.log("Failed to fetch data on {}: {}".format(code, exception), "error", False)
+        if path is not None:
+            pairs.to_csv(path, index=False, encoding="utf-8")
+            logger.log("Comparison of {} pairs of funds saved to {}".format(len(pairs), path), quiet=False)
+            return
+        pairs = pairs.sort_values(by=["holdings_overlap", "return_correlation"], ascending=False)
+        rows = pairs.head(MAX_TABLE_ROWS).round(3).to_dict("records")
+        logger.log(table_str(rows, ["Fund A", "Name A", "Fund B", "Name B", "Holdings overlap",
+                                    "Return correlation"]), quiet=False)
+        if len(pairs) > MAX_TABLE_ROWS:
+            logger.log("{} more pairs not shown. Add a path to save all of them to a CSV file."
+                       .format(len(pairs) - MAX_TABLE_ROWS), quiet=False)
+
+    def do_export(self, arg):
+        """Exports data to a file that can be read by other tools. The format of the file is given by its
+extension, which can be .csv, .jsonl or .parquet (requires pyarrow). Data is written one fund and one chunk
+at a time, so that many funds can be exported at once.
+Performs actions based on the arguments given:
+> export nav <fund_codes> <path> [int]  : exports the historical net asset values and daily yields of the funds
+                                          given by <fund_codes>, separated by commas, optionally only of the past
+                                          <int> months. Use 'current' as <fund_codes> for the current fund.
+> export stocks <fund_codes> <path>     : exports the stock positions of the funds
+> export predictions <fund_codes> <path>: exports the saved sentiment scores of the stocks of the funds from
+                                          every 'predict all' command. Use 'all' as <fund_codes> for all funds."""
+        args = arg.split()
+        if len(args) < 3 or args[0] not in {"nav", "stocks", "predictions"}:
+            logger.log("Command 'export {}' not supported".format(arg), "error", False)
+            return
+        kind, codes, path = args[:3]
+        file_format = get_export_format(path)
+        if file_format is None:
+            logger.log("The file to export to must end with .csv, .jsonl or .parquet", "error", False)
+            return
+        package = missing_dependency(file_format)
+        if package is not None:
+            logger.log("Exporting to .{} requires {} ('pip install {}')".format(file_format, package, package),
+                       "error", False)
+            return
+        months = None
+        if len(args) > 3:
+            if not args[3].isdigit() or int(args[3]) == 0:
+                logger.log("The number of months must be an integer greater than 0", "error", False)
+                return
+            months = int(args[3])
+        if codes == "current":
+            if self.fund_obj is None:
+                logger.log("Fund has not been set yet. Use 'set <fund_code>' to specify the fund.", "warning", False)
+                return
+            fund_codes = [self.fund_obj.code]
+        elif codes == "all" and kind == "predictions":
+            fund_codes = None
+        else:
+            fund_codes = list(dict.fromkeys(code for code in codes.split(",") if code))
+
+        try:
+            if kind == "predictions":
+                rows = export_predictions(fund_codes, path, file_format)
+                failures = []
+            else:
+                funds = fund_cache.funds()
+                rows, failures = export_funds(kind, fund_codes, path, file_format, months, funds)
+        except (ImportError, OSError) as exception:
+            logger.log("Failed to export to {}: {}".format(path, exception), "error", False)
+            return
+        for code, exception in failures:
+            logger.log("Failed to export {} of {}: {}".format(kind, code, exception), "error", False)
+        logger.log("Exported {} rows to {}".format(rows, path), quiet=False)
+
+    def do_watch(self, arg):
+        """Polls the intraday estimates of the net asset values of funds every minute during the trading sessions,
+and prints the estimates that have changed. Stops when the trading session is over, or with Ctrl-C.
+Outside of the trading sessions, the last estimates are printed once.
+Performs actions based on the arguments given:
+> watch                    : watches the funds of the watchlist in data/watchlist.json and the funds used in
+                             this session
+> watch <fund_codes>       : watches the funds given by <fund_codes>, separated by spaces or commas
+> watch [fund_codes] once  : prints the estimates once"""
+        args = arg.replace(",", " ").split()
+        once = "once" in args
+        codes = [code for code in args if code != "once"]
+        if len(codes) == 0:
+            if os.path.exists(WATCHLIST_FILE):
+                codes += read_json_file(WATCHLIST_FILE).get("funds", [])
+            codes += list(fund_cache.funds().keys())
+            if self.fund_obj is not None:
+                codes.append(self.fund_obj.code)
+        if len(codes) == 0:
+            logger.log("There are no funds to watch. Give their codes or add them to {}".format(WATCHLIST_FILE),
+                       "error", False)
+            return
+        watcher = NavEstimateWatcher(codes)
+        if not once and not is_trading_time():
+            logger.log("The market is closed, printing the last estimates", quiet=False)
+
+        def print_changes(changed, elapsed):
+            if len(changed) > 0:
+                logger.log(table_str([watcher.estimate(code) for code in changed], estimate_columns), quiet=False)
+            logger.log("{} {} of {} estimates changed in {:.2f}s{}".format(
+                datetime.now().strftime("%H:%M:%S"), len(changed), len(watcher.codes), elapsed,
+                ", {} failed".format(len(watcher.failures)) if watcher.failures else ""), quiet=False)
+
+        try:
+            asyncio.run(watcher.run(print_changes, rounds=1 if once else None))
+        except KeyboardInterrupt:
+            logger.log("Stopped watching", quiet=False)
+        for code, exception in watcher.failures.items():
+            logger.log("Failed to fetch the estimate of {}: {}".format(code, exception), "error", False)
+        missing = [code for code in watcher.codes if watcher.estimate(code) is None and code not in watcher.failures]
+        if len(missing) > 0:
+            logger.log("There is no intraday estimate for {}".format(", ".join(missing)), "warning", False)
+
     def do_article(self, arg):
         """In order for a news articles to be cached, 'predict' command needs to be run first.
 Performs actions based on the arguments given:
@@ -464,6 +957,86 @@ Performs actions based on the arguments given:
         else:
             return get_autocomplete_terms(text, logger.get_cached_stock_names())
 
+    def do_links(self, arg):
+        """Urls of news articles that could not be fetched or extracted during 'predict' are skipped for a while,
+and so are domains on which most of the attempts failed.
+Performs actions based on the arguments given:
+> links failed        : lists the urls that are skipped because they failed recently
+> links domains       : lists the failure rates of the domains articles were fetched from
+> links reset         : forgets all the failed urls and the statistics of all domains
+> links reset <domain>: forgets the failed urls and the statistics of the domain given by <domain>"""
+        args = arg.split()
+
+        def list_failed():
+            urls = negative_cache.urls()
+            rows = [dict(url=entry["url"], failures=entry["failures"], reason=entry["reason"],
+                         expires=datetime.fromtimestamp(entry["expires"]).strftime("%Y-%m-%d %H:%M"))
+                    for entry in sorted(urls, key=lambda entry: entry["expires"], reverse=True)]
+            logger.log("{} urls are skipped:".format(len(rows)), quiet=False)
+            logger.log(table_str(rows[:MAX_TABLE_ROWS], ["Url", "Failures", "Last error", "Skipped until"]),
+                       quiet=False)
+
+        def list_domains():
+            domains = negative_cache.domains()
+            logger.log(table_str(domains[:MAX_TABLE_ROWS],
+                                 ["Domain", "Attempts", "Failures", "Failure rate", "Skipped"]), quiet=False)
+
+        def reset():
+            domain = args[1].lower() if len(args) > 1 else None
+            negative_cache.reset(domain)
+            logger.log("Failed links {}forgotten".format("on {} ".format(domain) if domain else ""), quiet=False)
+
+        actions = dict(
+            failed=list_failed,
+            domains=list_domains,
+            reset=reset
+        )
+        try:
+            actions[args[0]]()
+        except (KeyError, IndexError):
+            logger.log("Command 'links {}' not supported".format(arg), "error", False)
+
+    def complete_links(self, text, line, begidx, endidx):
+        args = line.split()
+        if len(args) > 1 and args[1] == "reset":
+            return get_autocomplete_terms(text, [stats["domain"] for stats in negative_cache.domains()])
+        return get_autocomplete_terms(text, ["failed", "domains", "reset"])
+
+    def do_extraction(self, arg):
+        """The content of news articles is extracted with Goose, newspaper or a text density heuristic,
+starting with the one that succeeds most often on the domain of the article.
+Performs actions based on the arguments given:
+> extraction report        : lists the success rate, time per article and preferred extractor of each domain
+> extraction reset         : forgets the statistics of all domains
+> extraction reset <domain>: forgets the statistics of the domain given by <domain>"""
+        args = arg.split()
+
+        def report():
+            domains = extraction_stats.domains()
+            logger.log(table_str(domains[:MAX_TABLE_ROWS], ["Domain", "Articles", "Success rate", "ms/article",
+                                                            "Preferred", "Successes/attempts"]), quiet=False)
+
+        def reset():
+            domain = args[1].lower() if len(args) > 1 else None
+            extraction_stats.reset(domain)
+            logger.log("Extraction statistics {}forgotten".format("of {} ".format(domain) if domain else ""),
+                       quiet=False)
+
+        actions = dict(
+            report=report,
+            reset=reset
+        )
+        try:
+            actions[args[0]]()
+        except (KeyError, IndexError):
+            logger.log("Command 'extraction {}' not supported".format(arg), "error", False)
+
+    def complete_extraction(self, text, line, begidx, endidx):
+        args = line.split()
+        if len(args) > 1 and args[1] == "reset":
+            return get_autocomplete_terms(text, [stats["domain"] for stats in extraction_stats.domains()])
+        return get_autocomplete_terms(text, ["report", "reset"])
+
     def do_log(self, arg):
         """Performs actions based on the arguments given:
 > log clear      : clears all the log entries
@@ -491,6 +1064,69 @@ Performs actions based on the arguments given:
         except KeyError:
             logger.log("Command 'log {}' not supported".format(arg), "error", False)
 
+    def do_jobs(self, _):
+        """Lists the commands running in the background. A command is run in the background by adding '&' at the
+end of it, e.g. 'predict all &', while the prompt can be used for other commands in the meantime.
+Usage: jobs"""
+        if len(self.jobs.jobs) == 0:
+            logger.log("There are no background jobs", quiet=False)
+            return
+        rows = [dict(id=job.id, command=job.command, status=job.status,
+                     progress="{}/{}".format(*job.progress) if job.progress is not None else "",
+                     elapsed="{:.1f}s".format(job.elapsed)) for job in self.jobs.jobs.values()]
+        logger.log(table_str(rows, ["Id", "Command", "Status", "Progress", "Elapsed"]), quiet=False)
+
+    def _get_jobs(self, arg):
+        """
+        Return the jobs given by their ids, or all the jobs if arg is empty. Returns None if an id is invalid.
+        """
+        if arg.strip() == "":
+            return list(self.jobs.jobs.values())
+        jobs = []
+        for job_id in arg.split():
+            job = self.jobs.get(int(job_id)) if job_id.isdigit() else None
+            if job is None:
+                logger.log("There is no background job with id {}".format(job_id), "error", False)
+                return None
+            jobs.append(job)
+        return jobs
+
+    def do_wait(self, arg):
+        """Waits for background jobs to finish, then prints their output and removes them from the list of jobs.
+Press Ctrl-C to stop waiting, which leaves the jobs running.
+> wait       : waits for all the background jobs
+> wait <ids> : waits for the jobs given by <ids>, separated by spaces"""
+        jobs = self._get_jobs(arg)
+        if jobs is None:
+            return
+        for job in jobs:
+            try:
+                job.wait()
+            except KeyboardInterrupt:
+                logger.log("Stopped waiting, job {} is still {}".format(job.id, job.status), quiet=False)
+                return
+            logger.log("[{}] {} {} ({:.1f}s)".format(job.id, job.status, job.command, job.elapsed), quiet=False)
+            output = job.output.getvalue()
+            if output:
+                print(output, end="" if output.endswith("\n") else "\n")
+            if job.exception is not None and job.status == "failed":
+                logger.log("Job {} failed: {}".format(job.id, job.exception), "error", False)
+            job.reported = True
+            self.jobs.remove(job.id)
+
+    def do_cancel(self, arg):
+        """Cancels background jobs. Jobs that are running stop at the next step they check for it,
+e.g. after the stock being analyzed by 'predict all'.
+> cancel       : cancels all the background jobs
+> cancel <ids> : cancels the jobs given by <ids>, separated by spaces"""
+        jobs = self._get_jobs(arg)
+        if jobs is None:
+            return
+        for job in jobs:
+            if job.finished is None:
+                job.cancel()
+                logger.log("[{}] {} {}".format(job.id, job.status, job.command), quiet=False)
+
     def do_clear(self, _):
         """Clears the console"""
         logger.log("Console cleared")
@@ -502,6 +1138,11 @@ Performs actions based on the arguments given:
         return True
 
     def do_EOF(self, _):
+        running = self.jobs.running()
+        if len(running) > 0:
+            logger.log("Cancelling {} background jobs...".format(len(running)), quiet=False)
+        self.jobs.shutdown()
+        self._save_session()
         return True
 
     _requires_fund_obj = staticmethod(_requires_fund_obj)
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import numpy as np
+
+from background import check_cancelled
+from constants import *
+
+estimate_pattern = re.compile(r"jsonpgz\((.*)\)", re.DOTALL)
+# Latest estimate of each fund: the last published net asset value and its date, the estimated
+# net asset value, its change from the last net asset value in percent and the time of the estimate
+estimate_dtype = np.dtype([
+    ("nav", "f8"),
+    ("nav_date", "datetime64[D]"),
+    ("estimate", "f8"),
+    ("change", "f4"),
+    ("time", "datetime64[m]")
+])
+# Funds are traded in Beijing time, which has no daylight saving time
+china_timezone = timezone(timedelta(hours=8))
+trading_sessions = [((9, 30), (11, 30)), ((13, 0), (15, 0))]
+
+
+def is_trading_time(now=None):
+    """
+    Return whether the estimates are updated at the given time, i.e. during a trading session on a weekday.
+    """
+    now = datetime.now(china_timezone) if now is None else now.astimezone(china_timezone)
+    if now.weekday() >= 5:
+        return False
+    return any(start <= (now.hour, now.minute) < end for start, end in trading_sessions)
+
+
+def parse_estimate(text):
+    """
+    Parse the reply of the estimate endpoint, e.g.
+    jsonpgz({"fundcode":"161725","name":"...","jzrq":"2021-02-05","dwjz":"1.2345","gsz":"1.2400",
+             "gszzl":"0.45","gztime":"2021-02-08 15:00"});
+    :return: a dictionary with the keys code, name, nav, nav_date, estimate, change and time, or None
+    for funds without an estimate, e.g. money market funds
+    """
+    match = estimate_pattern.search(text)
+    if match is None or match.group(1).strip() == "":
+        return None
+    reply = json.loads(match.group(1))
+    return dict(
+        code=reply["fundcode"],
+        name=reply["name"],
+        nav=float(reply["dwjz"]),
+        nav_date=reply["jzrq"],
+        estimate=float(reply["gsz"]),
+        change=float(reply["gszzl"]) if reply["gszzl"] != "" else float("nan"),
+        time=reply["gztime"]
+    )
+
+
+class NavEstimateWatcher:
+    """
+    Polls the intraday estimates of the net asset values of many funds. Requests are sent
+    concurrently on a pool of keep-alive connections, and they are conditional, so that the
+    server only sends estimates that have changed. Only the latest estimate of each fund is
+    kept, in a numpy array with one row per fund.
+    """
+    def __init__(self, codes, url=NAV_ESTIMATE_URL, connections=WATCH_CONNECTIONS, timeout=WATCH_TIMEOUT):
+        self.codes = list(dict.fromkeys(codes))
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.url = url
+        self.connections = connections
+        self.timeout = timeout
+        self.values = np.zeros(len(self.codes), dtype=estimate_dtype)
+        self.values["nav"] = np.nan
+        self.values["estimate"] = np.nan
+        self.values["change"] = np.nan
+        self.values["nav_date"] = np.datetime64("NaT")
+        self.values["time"] = np.datetime64("NaT")
+        self.names = [""] * len(self.codes)
+        # fund code -> headers of the last reply used for conditional requests
+        self.validators = dict()
+        self.failures = dict()
+
+    def estimate(self, code):
+        """
+        :return: the latest estimate of the fund as returned by parse_estimate, or None if there is none yet
+        """
+        row = self.values[self.index[code]]
+        if np.isnat(row["time"]):
+            return None
+        return dict(code=code, name=self.names[self.index[code]], nav=float(row["nav"]),
+                    nav_date=str(row["nav_date"]), estimate=float(row["estimate"]),
+                    change=round(float(row["change"]), 2), time=str(row["time"]).replace("T", " "))
+
+    def update(self, estimate):
+        """
+        Store the estimate if it is newer than the one that is kept.
+        :return: whether the estimate of the fund has changed
+        """
+        i = self.index[estimate["code"]]
+        row = self.values[i]
+        estimate_time = np.datetime64(estimate["time"].replace(" ", "T"), "m")
+        if row["time"] == estimate_time and row["estimate"] == estimate["estimate"]:
+            return False
+        self.values[i] = (estimate["nav"], np.datetime64(estimate["nav_date"], "D"), estimate["estimate"],
+                          estimate["change"], estimate_time)
+        self.names[i] = estimate["name"]
+        return True
+
+    async def fetch(self, session, code):
+        """
+        :return: the estimate of the fund, or None if it has not changed since the last request
+        """
+        headers = {"User-Agent": "Mozilla/5.0", "Referer": "http://fund.eastmoney.com/"}
+        validators = self.validators.get(code, dict())
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+        async with session.get(self.url.format(code), headers=headers) as response:
+            if response.status == 304:
+                return None
+            response.raise_for_status()
+            self.validators[code] = {name: response.headers[name] for name in ("ETag", "Last-Modified")
+                                     if name in response.headers}
+            return parse_estimate((await response.read()).decode("utf-8", errors="ignore"))
+
+    async def refresh(self, session):
+        """
+        Fetch the estimates of all the funds once.
+        :return: the list of the codes of the funds whose estimate has changed
+        """
+        async def fetch(code):
+            try:
+                estimate = await self.fetch(session, code)
+                self.failures.pop(code, None)
+                return estimate
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as exception:
+                self.failures[code] = exception
+                return None
+
+        changed = []
+        for estimate in await asyncio.gather(*[fetch(code) for code in self.codes]):
+            if estimate is not None and estimate["code"] in self.index and self.update(estimate):
+                changed.append(estimate["code"])
+        return changed
+
+    def create_session(self):
+        # The time limit leaves out the time spent waiting for a free connection of the pool
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections),
+                                     timeout=aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout))
+
+    async def run(self, on_change, interval=WATCH_INTERVAL, rounds=None, trading_hours_only=True):
+        """
+        Refresh the estimates every interval seconds, on a single session, until the given number of
+        rounds is reached or, if trading_hours_only is set, the trading session is over. The first
+        refresh always happens.
+        :param on_change: function called after every refresh with the list of the codes that changed
+        and the number of seconds taken by the refresh
+        """
+        async with self.create_session() as session:
+            done = 0
+            while True:
+                start = time.monotonic()
+                changed = await self.refresh(session)
+                on_change(changed, time.monotonic() - start)
+                done += 1
+                if (rounds is not None and done >= rounds) or (trading_hours_only and not is_trading_time()):
+                    return
+                # Sleep in short steps so that cancelled jobs stop quickly
+                while time.monotonic() - start < interval:
+                    check_cancelled()
+                    await asyncio.sleep(min(1, interval - (time.monotonic() - start)))
+
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from constants import *
+from utils import read_json_file, dump_json_to_file
+
+
+def get_domain(url):
+    return urlparse(url).netloc.lower()
+
+
+class NegativeCache:
+    """
+    Remembers the urls that could not be fetched or extracted and how often fetching from
+    each domain fails, in data/negative_cache.json with the following format:
+    {"urls": {url: {"failures": number of consecutive failures, "reason": last error,
+                    "expires": time after which the url is tried again}},
+     "domains": {domain: {"attempts": attempts, "failures": failures, "updated": time of the last attempt}}}
+    A failing url is skipped until its entry expires, and the expiry doubles with every
+    consecutive failure. Domains that fail too often are skipped altogether.
+    """
+    def __init__(self, path, url_ttl=NEGATIVE_CACHE_URL_TTL, domain_ttl=NEGATIVE_CACHE_DOMAIN_TTL,
+                 max_failure_rate=NEGATIVE_CACHE_MAX_FAILURE_RATE, min_attempts=NEGATIVE_CACHE_MIN_ATTEMPTS):
+        self.path = path
+        self.url_ttl = url_ttl
+        self.domain_ttl = domain_ttl
+        self.max_failure_rate = max_failure_rate
+        self.min_attempts = min_attempts
+        self.lock = threading.RLock()
+        # The file is only created once the first failure is saved
+        self.data = read_json_file(path) if os.path.exists(path) else dict(urls=dict(), domains=dict())
+
+    def domain_stats(self, domain):
+        """
+        Return the statistics of the domain, which are forgotten once they are older than domain_ttl
+        so that a domain that has been fixed gets another chance.
+        """
+        stats = self.data["domains"].get(domain)
+        if stats is None or time.time() - stats["updated"] > self.domain_ttl:
+            return dict(attempts=0, failures=0, updated=time.time())
+        return stats
+
+    def failure_rate(self, domain):
+        stats = self.domain_stats(domain)
+        return stats["failures"] / stats["attempts"] if stats["attempts"] > 0 else 0
+
+    def skip_reason(self, url):
+        """
+        Return the reason why the url should not be fetched, or None if it should be fetched.
+        """
+        with self.lock:
+            entry = self.data["urls"].get(url)
+            if entry is not None and entry["expires"] > time.time():
+                return "failed {} time(s) before: {}".format(entry["failures"], entry["reason"])
+            domain = get_domain(url)
+            stats = self.domain_stats(domain)
+            if stats["attempts"] >= self.min_attempts and \
+                    stats["failures"] / stats["attempts"] >= self.max_failure_rate:
+                return "{:.0%} of {} attempts on {} failed".format(stats["failures"] / stats["attempts"],
+                                                                   stats["attempts"], domain)
+            return None
+
+    def order(self, results):
+        """
+        Sort search results so that the ones from domains that fail more often come last.
+        :param results: a list of tuples (title, url)
+        """
+        return sorted(results, key=lambda result: self.failure_rate(get_domain(result[1])))
+
+    def _record_attempt(self, url, failed):
+        domain = get_domain(url)
+        stats = self.domain_stats(domain)
+        stats["attempts"] += 1
+        stats["failures"] += int(failed)
+        stats["updated"] = time.time()
+        self.data["domains"][domain] = stats
+
+    def record_failure(self, url, reason):
+        with self.lock:
+            entry = self.data["urls"].get(url, dict(failures=0))
+            entry["failures"] += 1
+            entry["reason"] = str(reason)[:200]
+            entry["expires"] = time.time() + min(self.url_ttl * 2 ** (entry["failures"] - 1),
+                                                 NEGATIVE_CACHE_MAX_URL_TTL)
+            self.data["urls"][url] = entry
+            self._record_attempt(url, True)
+
+    def record_success(self, url):
+        with self.lock:
+            self.data["urls"].pop(url, None)
+            self._record_attempt(url, False)
+
+    def urls(self):
+        """
+        Return the cached failing urls that have not expired in a list of dictionaries
+        with the keys url, failures, reason and expires.
+        """
+        now = time.time()
+        with self.lock:
+            return [dict(url=url, **entry) for url, entry in self.data["urls"].items() if entry["expires"] > now]
+
+    def domains(self):
+        """
+        Return the statistics of every domain, the ones that fail most often first, in a list
+        of dictionaries with the keys domain, attempts, failures, failure_rate and skipped.
+        """
+        domains = []
+        with self.lock:
+            names = list(self.data["domains"].keys())
+        for domain in names:
+            stats = self.domain_stats(domain)
+            if stats["attempts"] == 0:
+                continue
+            rate = stats["failures"] / stats["attempts"]
+            domains.append(dict(domain=domain, attempts=stats["attempts"], failures=stats["failures"],
+                                failure_rate=round(rate, 3),
+                                skipped=stats["attempts"] >= self.min_attempts and rate >= self.max_failure_rate))
+        return sorted(domains, key=lambda stats: stats["failure_rate"], reverse=True)
+
+    def reset(self, domain=None):
+        """
+        Forget everything, or only the given domain and its urls.
+        """
+        with self.lock:
+            if domain is None:
+                self.data = dict(urls=dict(), domains=dict())
+            else:
+                self.data["domains"].pop(domain, None)
+                self.data["urls"] = {url: entry for url, entry in self.data["urls"].items()
+                                     if get_domain(url) != domain}
+            self.save()
+
+    def save(self):
+        # Expired urls are dropped so that the file does not grow forever
+        with self.lock:
+            now = time.time()
+            self.data["urls"] = {url: entry for url, entry in self.data["urls"].items()
+                                 if entry["expires"] > now - self.domain_ttl}
+            dump_json_to_file(self.data, self.path)
+
+
+negative_cache = NegativeCache(NEGATIVE_CACHE_FILE)
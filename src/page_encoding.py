@@ -0,0 +1,107 @@
+import codecs
+import re
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import chardet
+
+from constants import *
+
+boms = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16")
+]
+# Chinese pages labelled as GB2312 or GBK often contain characters that only GB18030, a superset of both, can decode
+superset_encodings = dict(gb2312="gb18030", gbk="gb18030", ascii="utf-8")
+
+# Charsets that servers send by default whatever the page is encoded in, so the page itself is checked first
+default_header_encodings = {"iso8859-1", "cp1252"}
+
+header_charset_pattern = re.compile(r"charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+meta_charset_pattern = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+
+def normalize_encoding(name):
+    """
+    Return the canonical name of the given encoding, or None if Python does not support it.
+    """
+    try:
+        name = codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+    return superset_encodings.get(name, name)
+
+
+class EncodingDetector:
+    """
+    Finds the encoding of a web page from, in order, its byte order mark, the charset in the
+    Content-Type header, and a <meta> charset in the first sniff_bytes of the page. Only pages
+    that declare none of them are run through chardet, on their first sample_bytes, and the
+    result is remembered for the domain of the page so that other pages of the domain skip it.
+    """
+    def __init__(self, sniff_bytes=ENCODING_SNIFF_BYTES, sample_bytes=ENCODING_SAMPLE_BYTES):
+        self.sniff_bytes = sniff_bytes
+        self.sample_bytes = sample_bytes
+        self.lock = threading.Lock()
+        self.domain_encodings = dict()
+        # Number of pages whose encoding was found by each of the methods
+        self.statistics = Counter()
+
+    def detect(self, content, content_type=None, url=None):
+        """
+        :param content: the body of the response in bytes
+        :param content_type: the Content-Type header of the response
+        :param url: the url of the page, used to cache the encoding detected for its domain
+        :return: a tuple (encoding, method by which it was found: 'bom', 'header', 'meta', 'domain' or 'detected')
+        """
+        encoding, source = self._detect(content, content_type, url)
+        with self.lock:
+            self.statistics[source] += 1
+        return encoding, source
+
+    def _detect(self, content, content_type, url):
+        for bom, encoding in boms:
+            if content.startswith(bom):
+                return encoding, "bom"
+        header_encoding = None
+        if content_type is not None:
+            match = header_charset_pattern.search(content_type)
+            header_encoding = normalize_encoding(match.group(1)) if match is not None else None
+            if header_encoding is not None and header_encoding not in default_header_encodings:
+                return header_encoding, "header"
+        match = meta_charset_pattern.search(content, 0, self.sniff_bytes)
+        encoding = normalize_encoding(match.group(1)) if match is not None else None
+        if encoding is not None:
+            return encoding, "meta"
+        if header_encoding is not None:
+            return header_encoding, "header"
+
+        domain = urlparse(url).netloc.lower() if url is not None else None
+        with self.lock:
+            encoding = self.domain_encodings.get(domain)
+        if encoding is not None:
+            return encoding, "domain"
+        encoding = normalize_encoding(chardet.detect(content[:self.sample_bytes]).get("encoding") or "utf-8") \
+            or "utf-8"
+        if domain is not None:
+            with self.lock:
+                self.domain_encodings[domain] = encoding
+        return encoding, "detected"
+
+    def decode(self, content, content_type=None, url=None):
+        """
+        Decode the body of a response without going through response.text of requests, which
+        runs chardet over the whole body when the headers do not declare a charset.
+        :param content: the body of the response in bytes
+        :param content_type: the Content-Type header of the response
+        :param url: the url of the page
+        """
+        encoding, _ = self.detect(content, content_type, url)
+        return content.decode(encoding, errors="ignore")
+
+
+encoding_detector = EncodingDetector()
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import dateutil.relativedelta as date_diff
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from background import JobThreadPoolExecutor
+from fund import Fund
+from logger import logger
+
+
+def holdings_matrix(fund_codes, stocks):
+    """
+    Build a sparse matrix of the position ratios of the given funds.
+    :param fund_codes: a list of N fund codes
+    :param stocks: a dictionary that maps each fund code to its stock positions, as given by Fund.stocks
+    :return: a tuple (N x M csr matrix with the position ratios as fractions, list of the M stock codes)
+    """
+    records = pd.DataFrame([(i, stock["code"], stock["position_ratio"] / 100)
+                            for i, code in enumerate(fund_codes) for stock in stocks.get(code, [])],
+                           columns=["fund", "stock", "weight"])
+    stock_codes, columns = np.unique(records["stock"].to_numpy(dtype=str), return_inverse=True)
+    matrix = sparse.csr_matrix((records["weight"].to_numpy(dtype=float), (records["fund"].to_numpy(), columns)),
+                               shape=(len(fund_codes), len(stock_codes)))
+    return matrix, list(stock_codes)
+
+
+def holdings_overlap(matrix):
+    """
+    Compute the holdings overlap of every pair of funds, i.e. the sum over all stocks of the
+    smaller of the two position ratios. Only pairs of funds that share a stock are visited.
+    :param matrix: an N x M sparse matrix of position ratios
+    :return: an N x N sparse matrix of overlaps
+    """
+    coo = sparse.coo_matrix(matrix)
+    entries = pd.DataFrame(dict(fund=coo.row, stock=coo.col, weight=coo.data))
+    pairs = entries.merge(entries, on="stock", suffixes=("_a", "_b"))
+    pairs["overlap"] = np.minimum(pairs["weight_a"].to_numpy(), pairs["weight_b"].to_numpy())
+    overlap = pairs.groupby(["fund_a", "fund_b"])["overlap"].sum()
+    return sparse.coo_matrix((overlap.to_numpy(), (overlap.index.get_level_values(0),
+                                                   overlap.index.get_level_values(1))),
+                             shape=(matrix.shape[0], matrix.shape[0])).tocsr()
+
+
+def return_matrix(fund_codes, historical_data, months):
+    """
+    Align the daily yields of the given funds in the past months by date.
+    :param historical_data: a dictionary that maps each fund code to its historical data
+    :return: a dataframe with one row per date and one column per fund, NaN where a fund has no data
+    """
+    start = datetime.today() - date_diff.relativedelta(months=months)
+    frames = {code: historical_data[code].set_index("date")["daily_yield"] for code in fund_codes
+              if historical_data.get(code) is not None}
+    returns = pd.DataFrame(frames).reindex(columns=fund_codes)
+    return returns[returns.index >= start].sort_index()
+
+
+def return_correlation(returns, min_periods=20):
+    """
+    Compute the correlation of the daily yields of every pair of funds over the dates on which
+    both have data.
+    :return: an N x N numpy array, NaN for pairs with fewer than min_periods common dates
+    """
+    values = returns.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    mask = valid.astype(float)
+    # Pairwise sums over the dates on which both funds have data, as matrix products
+    counts = mask.T @ mask
+    sums = filled.T @ mask
+    squares = (filled ** 2).T @ mask
+    products = filled.T @ filled
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = products - sums * sums.T / counts
+        variance_a = squares - sums ** 2 / counts
+        correlation = covariance / np.sqrt(variance_a * variance_a.T)
+    correlation[counts < min_periods] = np.nan
+    return correlation
+
+
+def pairwise_table(fund_codes, names, overlap, correlation):
+    """
+    Flatten the matrices into a dataframe with one row for each pair of different funds.
+    """
+    first, second = np.triu_indices(len(fund_codes), k=1)
+    return pd.DataFrame(dict(
+        fund_a=np.array(fund_codes)[first],
+        name_a=np.array(names)[first],
+        fund_b=np.array(fund_codes)[second],
+        name_b=np.array(names)[second],
+        holdings_overlap=np.asarray(overlap[first, second]).ravel(),
+        return_correlation=correlation[first, second]
+    ))
+
+
+def compare_funds(fund_codes, months=12, funds=None, workers=4):
+    """
+    Fetch the stock positions and historical data of the given funds and compare every pair.
+    :param funds: a dictionary of Fund objects that have already been created, keyed by fund code
+    :return: a tuple (dataframe as given by pairwise_table, list of tuples (fund code, exception))
+    """
+    funds = dict() if funds is None else funds
+    failures = []
+
+    def fetch(code):
+        try:
+            fund = funds[code] if code in funds else Fund(code)
+            return code, fund.data["name"], fund.stocks, fund.historical_data
+        except Exception as exception:
+            logger.log("Failed to fetch data on {}: {}".format(code, exception), "error")
+            failures.append((code, exception))
+            return None
+
+    with JobThreadPoolExecutor(max_workers=workers) as executor:
+        results = [result for result in executor.map(fetch, fund_codes) if result is not None]
+    codes = [code for code, _, _, _ in results]
+    names = [name for _, name, _, _ in results]
+    matrix, _ = holdings_matrix(codes, {code: stocks for code, _, stocks, _ in results})
+    returns = return_matrix(codes, {code: data for code, _, _, data in results}, months)
+    return pairwise_table(codes, names, holdings_overlap(matrix), return_correlation(returns)), failures
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import threading
+
+from constants import PREDICTION_CACHE_FILE
+from utils import read_json_file, dump_json_to_file
+
+
+def fingerprint(urls):
+    """
+    Return a fingerprint of a set of urls that does not depend on their order.
+    """
+    return hashlib.sha1("\n".join(sorted(set(urls))).encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """
+    Keeps the result of the last analysis of each stock in data/prediction_cache.json
+    in the following format:
+    {stock_code: {"params": parameters used for the analysis,
+                  "fingerprint": fingerprint of the urls in the search results,
+                  "urls": urls of the articles that have been scored or found irrelevant,
+                  "chunks": [{"urls": urls of the articles in the chunk,
+                              "score": score, "magnitude": magnitude, "length": length}],
+                  "score": aggregated score, "coverage": coverage}}
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # The file is only created once the first analysis is cached
+        self.data = read_json_file(path) if os.path.exists(path) else {}
+
+    def get(self, stock_code, params):
+        """
+        Return the cached analysis of the given stock if it was run with the same parameters.
+        """
+        entry = self.data.get(stock_code)
+        if entry is None or entry["params"] != params:
+            return None
+        return entry
+
+    def update(self, stock_code, entry):
+        with self.lock:
+            self.data[stock_code] = entry
+            dump_json_to_file(self.data, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.data = dict()
+            dump_json_to_file(self.data, self.path)
+
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_FILE)
@@ -0,0 +1,343 @@
+import time
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeoutError
+from enum import Enum
+
+from tqdm import tqdm
+
+from background import JobThreadPoolExecutor, check_cancelled, report_progress
+from constants import *
+from extraction import extraction_stats
+from logger import logger
+from negative_cache import negative_cache
+from page_encoding import encoding_detector
+from prediction_cache import prediction_cache, fingerprint
+from text_extractor import DownloadRejected
+from utils import *
+
+
+class DateRange(Enum):
+    h = 'Past hour'
+    d = 'Past day'
+    w = 'Past week'
+    m = 'Past month'
+    y = 'Past year'
+
+
+def default_analysis_config():
+    """
+    Return the parameters used for stock analysis when they have not been changed
+    """
+    return dict(
+        num_results=10,
+        date_range=DateRange.w,
+        verbose=True,
+        relevance_filter=True,
+        stock_timeout=60,
+        command_timeout=600,
+        incremental=True,
+        sentiment="google"
+    )
+
+
+class Predictor:
+    """
+    Runs the prediction pipeline: searching news articles on Google, extracting their text,
+    dropping irrelevant articles and scoring their sentiment. A Predictor collects the
+    statistics of a single run, so a new one is created for every prediction, while the
+    services it uses are shared.
+    """
+    def __init__(self, analysis_config, google_service, text_extractor, relevance_filter, sentiment_providers,
+                 interactive=True):
+        """
+        :param interactive: whether progress bars are shown and the analyzed text is written to
+        data/data.txt, which are left out when several predictions run at the same time
+        """
+        self.analysis_config = analysis_config
+        self.google_service = google_service
+        self.text_extractor = text_extractor
+        self.relevance_filter = relevance_filter
+        self.sentiment_providers = sentiment_providers
+        self.interactive = interactive
+        self.statistics = dict(
+            crawled_links=0,
+            filtered_articles=0,
+            filtered_chars=0,
+            timed_out_links=0,
+            skipped_links=0,
+            rejected_links=0,
+            truncated_links=0,
+            saved_bytes=0,
+            failed_links=[]
+        )
+
+    def predict_fund(self, fund, quiet, deadline=None):
+        """
+        Analyze every stock held by the fund and weigh the scores by the position ratios.
+        Stocks that are reached after the deadline get a score of 0.
+        :return: a tuple (overall prediction, confidence, prediction contribution of each stock keyed by stock code)
+        """
+        prediction = 0
+        contribution = dict()
+        stocks = fund.stocks
+        for i, stock in enumerate(stocks):
+            check_cancelled()
+            report_progress(i, len(stocks))
+            if deadline is None or time.monotonic() < deadline:
+                sentiment_score, coverage = self.analyze_stock(stock, quiet, deadline)
+            else:
+                logger.log("Time budget of the command used up, skipping {}".format(stock["name"]),
+                           "warning", quiet)
+                sentiment_score, coverage = 0, 0
+            weighted_score = sentiment_score * stock["position_ratio"]
+            contribution[stock["code"]] = dict(
+                name=stock["name"],
+                sentiment_score=sentiment_score,
+                position_ratio=stock["position_ratio"],
+                weighted_score=weighted_score,
+                coverage=coverage
+            )
+            logger.log("Weighted sentiment score of {:.3f} added to the current prediction".format(weighted_score),
+                       quiet=quiet)
+            prediction += weighted_score
+        report_progress(len(stocks), len(stocks))
+        return prediction / 100, weighted_coverage(contribution.values()), contribution
+
+    def fetch_articles(self, stock_name, results, deadline, quiet):
+        """
+        Extract the content of the given search results concurrently. Extractions that
+        have not finished by the deadline are cancelled and left out, and downloads that are
+        still running stop at their next chunk. Urls that failed recently and domains that
+        fail too often are skipped, and the remaining results are fetched from the most
+        reliable domains first.
+        :return: a tuple (list of tuples (url, content of the article as a list of lines with the title
+        first), list of the urls that were skipped)
+        """
+        executor = JobThreadPoolExecutor(max_workers=ARTICLE_WORKERS)
+        futures = dict()
+        kept = []
+        skipped = []
+        for title, url in results:
+            reason = negative_cache.skip_reason(url)
+            if reason is None:
+                kept.append((title, url))
+            else:
+                skipped.append(url)
+                logger.log("Skipping {}: {}".format(url, reason), quiet=quiet)
+                self.statistics["skipped_links"] += 1
+        results = negative_cache.order(kept)
+        for i, result in enumerate(results):
+            logger.log("{}. {}: {}".format(i + 1, *result), quiet=quiet)
+            timeout = max(0.1, min(ARTICLE_TIMEOUT, deadline - time.monotonic()))
+            futures[executor.submit(self.text_extractor.extract_article, result[1], timeout, deadline)] = result
+
+        progress = tqdm(total=len(results), desc=stock_name, ncols=100) if quiet and self.interactive else None
+        articles = []
+        try:
+            for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+                title, url = futures[future]
+                try:
+                    lines, download = future.result()
+                    if download.aborted is not None:
+                        self.statistics["truncated_links"] += 1
+                        self.statistics["saved_bytes"] += download.bytes_saved
+                    if len(lines) > 0:
+                        negative_cache.record_success(url)
+                    else:
+                        negative_cache.record_failure(url, "no text could be extracted")
+                    content_lines = [title] + lines
+                    logger.log_article(stock_name, futures[future], "\n".join(content_lines))
+                    articles.append((url, content_lines))
+                except DownloadRejected as exception:
+                    logger.log("Skipping {}: {}".format(url, exception), quiet=quiet)
+                    negative_cache.record_failure(url, exception)
+                    self.statistics["rejected_links"] += 1
+                    self.statistics["saved_bytes"] += exception.bytes_saved
+                except Exception as exception:
+                    logger.log("Failed to extract text from url {}: {}".format(url, exception), "error")
+                    negative_cache.record_failure(url, exception)
+                    self.statistics["failed_links"].append((url, exception))
+                finally:
+                    self.statistics["crawled_links"] += 1
+                    if progress is not None:
+                        progress.update()
+        except FuturesTimeoutError:
+            unfinished = [future for future in futures if not future.done()]
+            for future in unfinished:
+                future.cancel()
+            self.statistics["timed_out_links"] += len(unfinished)
+            logger.log("Deadline reached for {}, continuing with {} of {} articles"
+                       .format(stock_name, len(articles), len(results)), "warning", quiet)
+        finally:
+            if progress is not None:
+                progress.close()
+            executor.shutdown(wait=False)
+        return articles, skipped
+
+    def score_texts(self, stock_name, texts, timeout):
+        """
+        Send the given texts to the sentiment backend in bounded chunks concurrently, so that
+        large payloads neither hit the document size limit nor take as long as the sum of
+        their parts.
+        :return: a tuple (list of dictionaries with the indices of the texts in each successfully
+        analyzed chunk, its score, magnitude and length, number of chunks that failed)
+        """
+        provider = self.sentiment_providers[self.analysis_config["sentiment"]]
+        chunks = split_into_chunks(texts, provider.max_chunk_size)
+        results = []
+        failures = 0
+        for (chunk, indices), (sentiment, exception) in zip(chunks, provider.analyze_texts(
+                [chunk for chunk, _ in chunks], timeout)):
+            if exception is not None:
+                logger.log("Failed to analyze a chunk of {} characters on {}: {}"
+                           .format(len(chunk), stock_name, exception), "error", False)
+                failures += 1
+                continue
+            results.append(dict(
+                indices=indices,
+                score=sentiment[0],
+                magnitude=sentiment[1],
+                length=len(chunk)
+            ))
+        return results, failures
+
+    def analyze_stock(self, stock, quiet, deadline=None):
+        """
+        Performs the operation of gathering news links from Google, extracting
+        text from news articles, then sending it to the sentiment backend.
+        If incremental analysis is enabled, only articles that were not part of the
+        previous analysis of the stock are crawled and scored.
+        :param stock: the stock to be analyzed, as given by Fund.stocks
+        :param deadline: time.monotonic() value by which the whole command needs to finish
+        :return: a tuple (sentiment score returned by the sentiment backend, coverage), where coverage
+        is the fraction of the requested articles that were scored
+        """
+        score = 0
+        coverage = 0
+        stock_name = stock["name"]
+        stock_deadline = time.monotonic() + self.analysis_config["stock_timeout"]
+        if deadline is not None:
+            stock_deadline = min(stock_deadline, deadline)
+        params = "{}|{}|{}|{}".format(self.analysis_config["num_results"], self.analysis_config["date_range"].name,
+                                      self.analysis_config["relevance_filter"], self.analysis_config["sentiment"])
+        logger.log("Searching news articles on Google on {}".format(stock_name), quiet=quiet)
+        if self.interactive:
+            clear_payload()
+        try:
+            results = self.google_service.google_search(
+                stock_name,
+                self.analysis_config["num_results"],
+                self.analysis_config["date_range"].name,
+                timeout=max(0.1, stock_deadline - time.monotonic())
+            )
+            logger.log("Search results retrieved successfully")
+            # The fingerprint is taken from the search results before the urls that keep failing are
+            # skipped, so that it only changes with the news and not with the negative cache
+            urls = [url for _, url in results]
+
+            previous = prediction_cache.get(stock["code"], params) \
+                if self.analysis_config["incremental"] else None
+            if previous is not None and previous["fingerprint"] == fingerprint(urls):
+                logger.log("News on {} has not changed since the last analysis, reusing its score of {:.3f}"
+                           .format(stock_name, previous["score"]), quiet=False)
+                score, coverage = previous["score"], previous["coverage"]
+                return
+            # Urls that are not fetched again: the articles that were scored or found irrelevant before.
+            # The scores of chunks with articles that are still among the search results are kept.
+            done_urls = set(previous["urls"]).intersection(urls) if previous is not None else set()
+            chunks = [chunk for chunk in previous["chunks"] if done_urls.intersection(chunk["urls"])] \
+                if previous is not None else []
+            new_results = [result for result in results if result[1] not in done_urls]
+            if previous is not None:
+                logger.log("{} of {} articles on {} are new since the last analysis"
+                           .format(len(new_results), len(results), stock_name), quiet=quiet)
+
+            fetched, skipped_urls = self.fetch_articles(stock_name, new_results, stock_deadline, quiet)
+            article_urls = [url for url, _ in fetched]
+            articles = [content_lines for _, content_lines in fetched]
+            num_articles = len(articles)
+
+            if self.analysis_config["relevance_filter"]:
+                total_chars = sum(len(line) for article in articles for line in article)
+                filtered = self.relevance_filter.filter_articles(articles, stock_name, stock["code"])
+                self.statistics["filtered_articles"] += len(articles) - len(filtered)
+                # Irrelevant articles are not fetched again, but they do not count towards the coverage
+                kept = {i for i, _ in filtered}
+                done_urls.update(url for i, url in enumerate(article_urls) if i not in kept)
+                article_urls = [article_urls[i] for i, _ in filtered]
+                articles = [lines for _, lines in filtered]
+                kept_chars = sum(len(line) for article in articles for line in article)
+                logger.log("{} of the extracted articles on {} are relevant, {} characters trimmed"
+                           .format(len(articles), stock_name, total_chars - kept_chars), quiet=quiet)
+                self.statistics["filtered_chars"] += total_chars - kept_chars
+
+            texts = ["".join(content_lines) + "\n" for content_lines in articles]
+            if self.interactive:
+                for text in texts:
+                    add_to_payload(text)
+            try:
+                new_chunks, failures = self.score_texts(stock_name, texts,
+                                                        max(0.1, stock_deadline - time.monotonic()))
+                if len(texts) > 0 and len(new_chunks) == 0 and len(chunks) == 0:
+                    raise ConnectionError("none of the {} chunks could be analyzed".format(failures))
+                for chunk in new_chunks:
+                    chunk["urls"] = [article_urls[i] for i in chunk.pop("indices")]
+                    done_urls.update(chunk["urls"])
+                # Articles in chunks that failed are left out so that they are scored next time
+                failed_urls = set(article_urls).difference(*[chunk["urls"] for chunk in new_chunks])
+                chunks += new_chunks
+                score, magnitude = aggregate_sentiments([(chunk["score"], chunk["magnitude"], chunk["length"])
+                                                         for chunk in chunks])
+                # Only the articles of the search results that went into a chunk count as covered
+                scored_urls = set(urls).intersection(url for chunk in chunks for url in chunk["urls"])
+                coverage = min(1, len(scored_urls) / self.analysis_config["num_results"])
+                # The score can be reused as long as the search results stay the same if every new result
+                # was scored, or skipped by the negative cache, which would skip it again
+                complete = len(failed_urls) == 0 and num_articles + len(skipped_urls) == len(new_results)
+                prediction_cache.update(stock["code"], dict(
+                    params=params,
+                    fingerprint=fingerprint(urls) if complete else None,
+                    urls=sorted(done_urls),
+                    chunks=chunks,
+                    score=score,
+                    coverage=coverage
+                ))
+                logger.log("Obtained sentiment analysis for information gathered on {}: (score: {:.3f}, "
+                           "magnitude: {:.3f}, new chunks: {}/{}, coverage: {:.0%})"
+                           .format(stock_name, score, magnitude, len(new_chunks), len(new_chunks) + failures,
+                                   coverage), quiet=False)
+            except Exception as exception:
+                logger.log("Failed to analyze sentiment for information gathered on {}: {}"
+                           .format(stock_name, exception), "error", False)
+        except Exception as exception:
+            logger.log("Failed to fetch news articles on {} from Google due to: {}".format(stock_name, exception),
+                       "error", quiet)
+        finally:
+            return score, coverage
+
+    def log_statistics(self, quiet=False):
+        logger.log("Statistics:")
+        logger.log("Total number links crawled: {}".format(self.statistics["crawled_links"]), quiet=quiet)
+        logger.log("Number of failed links: {}".format(len(self.statistics["failed_links"])), quiet=quiet)
+        logger.log("Number of links cancelled after the deadline: {}".format(
+            self.statistics["timed_out_links"]), quiet=quiet)
+        logger.log("Number of links skipped after failing before: {}".format(
+            self.statistics["skipped_links"]), quiet=quiet)
+        logger.log("Number of links that are not web pages: {}".format(self.statistics["rejected_links"]), quiet=quiet)
+        logger.log("Number of downloads stopped at the size cap or the end of the article: {}".format(
+            self.statistics["truncated_links"]), quiet=quiet)
+        logger.log("Number of bytes not downloaded: {}".format(self.statistics["saved_bytes"]), quiet=quiet)
+        if self.analysis_config["relevance_filter"]:
+            logger.log("Number of irrelevant articles dropped: {}".format(
+                self.statistics["filtered_articles"]), quiet=quiet)
+            logger.log("Number of characters trimmed from payload: {}".format(
+                self.statistics["filtered_chars"]), quiet=quiet)
+        logger.log("Page encodings found by method (session): {}".format(
+            ", ".join("{} {}".format(method, count) for method, count in encoding_detector.statistics.most_common())),
+            quiet=quiet)
+        for url, exception in self.statistics["failed_links"]:
+            logger.log("{}: {}".format(url, exception), quiet=quiet)
+        try:
+            negative_cache.save()
+            extraction_stats.save()
+        except OSError as exception:
+            logger.log("Failed to save the statistics of the crawled links: {}".format(exception), "error", False)
@@ -0,0 +1,191 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from constants import *
+from logger import logger
+
+# Status codes with which a host tells us to slow down
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """
+        :param rate: number of tokens added to the bucket per second
+        :param capacity: maximum number of tokens in the bucket, i.e. the size of a burst
+        :param clock: function that returns the current time in seconds, the one given to try_take
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        """
+        Take a token if one is available.
+        :return: 0 if a token was taken, otherwise the number of seconds until the next token
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class HostLimiter:
+    """
+    Limits the request rate and the number of concurrent requests to a single host.
+    Both limits are cut in half whenever the host signals that it is overloaded and
+    are then raised again gradually as requests succeed (AIMD).
+    """
+    def __init__(self, host, rate, burst, max_concurrency, clock=time.monotonic):
+        self.host = host
+        self.clock = clock
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.active = 0
+        self.successes = 0
+        self.throttles = 0
+        self.paused_until = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = self.clock()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                    continue
+                if self.active >= self.concurrency:
+                    self.condition.wait()
+                    continue
+                delay = self.bucket.try_take(now)
+                if delay == 0:
+                    self.active += 1
+                    return
+                self.condition.wait(delay)
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.throttles = 0
+            self.successes += 1
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 10)
+            if self.successes % RATE_LIMIT_RECOVERY_STEPS == 0 and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self.condition.notify_all()
+
+    def on_throttled(self):
+        with self.condition:
+            self.successes = 0
+            self.throttles += 1
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            self.bucket.tokens = 0
+            self.concurrency = max(1, self.concurrency // 2)
+            backoff = min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BACKOFF * 2 ** (self.throttles - 1))
+            self.paused_until = self.clock() + backoff
+        logger.log("Host {} is throttling requests, backing off for {}s (rate: {:.2f}/s, concurrency: {})"
+                   .format(self.host, backoff, self.bucket.rate, self.concurrency), "warning")
+        return backoff
+
+
+class RequestScheduler:
+    """
+    Schedules the HTTP requests of all the components so that the number of requests
+    per second and the number of concurrent requests to each host stay within limits.
+    """
+    def __init__(self, host_limits, default_limit):
+        """
+        :param host_limits: a dictionary that maps host names to tuples (rate, burst, max_concurrency)
+        :param default_limit: the tuple (rate, burst, max_concurrency) for hosts that are not listed
+        """
+        self.host_limits = host_limits
+        self.default_limit = default_limit
+        self.limiters = dict()
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+    def limiter(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(host, *self.host_limits.get(host, self.default_limit))
+            return self.limiters[host]
+
+    def request(self, method, url, retries=1, **kwargs):
+        """
+        Send a request once the host of the url allows for it. If the host replies that it
+        is overloaded, the request is retried after backing off. The body of a streamed
+        response (stream=True) is downloaded within the limits of the host as well: the
+        request keeps its slot until the response is closed, which the caller has to do.
+        """
+        limiter = self.limiter(url)
+        while True:
+            limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except BaseException:
+                limiter.release()
+                raise
+            throttled = response.status_code in THROTTLE_STATUS_CODES
+            if throttled and retries > 0:
+                # Closing the response returns its connection to the pool
+                response.close()
+                limiter.release()
+                limiter.on_throttled()
+                retries -= 1
+                continue
+            if kwargs.get("stream", False):
+                self._release_on_close(response, limiter)
+            else:
+                limiter.release()
+            if throttled:
+                limiter.on_throttled()
+            else:
+                limiter.on_success()
+            return response
+
+    @staticmethod
+    def _release_on_close(response, limiter):
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    limiter.release()
+
+        response.close = close_and_release
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def report_throttled(self, url):
+        """
+        Report that a host is throttling us without saying so, e.g. Google returning a page
+        without any search results.
+        """
+        self.limiter(url).on_throttled()
+
+
+scheduler = RequestScheduler(HOST_RATE_LIMITS, DEFAULT_RATE_LIMIT)
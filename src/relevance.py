@@ -0,0 +1,85 @@
+import numpy as np
+
+# Terms that indicate a piece of text discusses the stock market. Articles found by
+# searching the bare stock name often mention it in another context (e.g. a basketball
+# team sponsored by the company), so a mention of the name alone is not enough.
+FINANCE_TERMS = [
+    "股价", "股票", "股市", "A股", "港股", "个股", "涨停", "跌停", "涨幅", "跌幅", "上涨", "下跌",
+    "大涨", "大跌", "收盘", "开盘", "成交", "市值", "估值", "市盈率", "营收", "营业收入", "净利润",
+    "利润", "业绩", "财报", "年报", "季报", "同比", "环比", "毛利率", "分红", "增持", "减持", "回购",
+    "投资者", "机构", "基金", "券商", "研报", "评级", "目标价", "主力", "资金", "板块", "龙头",
+    "沪指", "深成指", "创业板", "行业", "走势"
+]
+
+# A mention of the stock itself is worth this many finance terms
+NAME_WEIGHT = 3
+
+
+class RelevanceFilter:
+    def __init__(self, min_finance_hits=2, min_paragraph_score=1):
+        """
+        :param min_finance_hits: minimum number of finance terms an article needs to contain to be kept
+        :param min_paragraph_score: minimum score of a paragraph for it to be kept in an article
+        """
+        self.min_finance_hits = min_finance_hits
+        self.min_paragraph_score = min_paragraph_score
+
+    @staticmethod
+    def get_keywords(stock_name, stock_code=None):
+        """
+        Return the terms that identify the given stock in a piece of text. Names
+        such as '五 粮 液' are padded with spaces on the website, so the name without
+        spaces is included as well.
+        """
+        keywords = {stock_name.strip(), "".join(stock_name.split())}
+        if stock_code is not None:
+            keywords.add(stock_code)
+        return [keyword for keyword in keywords if keyword]
+
+    @staticmethod
+    def count_terms(paragraphs, terms):
+        """
+        Count the total number of occurrences of the given terms in each paragraph.
+        :return: a numpy array with one count per paragraph
+        """
+        counts = np.zeros(len(paragraphs), dtype=np.int64)
+        if len(paragraphs) == 0:
+            return counts
+        array = np.array(paragraphs, dtype=str)
+        for term in terms:
+            counts += np.char.count(array, term)
+        return counts
+
+    def filter_articles(self, articles, stock_name, stock_code=None):
+        """
+        Drop articles that are not about the given stock and trim the paragraphs that
+        mention neither the stock nor any finance term from the remaining ones.
+        All paragraphs of all articles are scored in one pass.
+        :param articles: a list of articles, each of which is a list of lines with the
+        first line being the title
+        :return: a list of tuples (index of the article in the given list, kept lines)
+        """
+        paragraphs = [line for article in articles for line in article]
+        if len(paragraphs) == 0:
+            return []
+        article_ids = np.repeat(np.arange(len(articles)), [len(article) for article in articles])
+
+        name_hits = self.count_terms(paragraphs, self.get_keywords(stock_name, stock_code))
+        finance_hits = self.count_terms(paragraphs, FINANCE_TERMS)
+        paragraph_scores = NAME_WEIGHT * name_hits + finance_hits
+
+        article_name_hits = np.bincount(article_ids, weights=name_hits, minlength=len(articles))
+        article_finance_hits = np.bincount(article_ids, weights=finance_hits, minlength=len(articles))
+        relevant = (article_name_hits > 0) & (article_finance_hits >= self.min_finance_hits)
+
+        filtered = []
+        offset = 0
+        for i, article in enumerate(articles):
+            scores = paragraph_scores[offset:offset + len(article)]
+            offset += len(article)
+            if not relevant[i]:
+                continue
+            # Always keep the title
+            lines = [line for j, line in enumerate(article) if j == 0 or scores[j] >= self.min_paragraph_score]
+            filtered.append((i, lines))
+        return filtered
@@ -0,0 +1,127 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from constants import *
+from logger import logger
+
+# Terms of the local model and their polarity. Phrases such as '不及预期' are listed on their own
+# so that they are not counted as the positive term they contain.
+POSITIVE_TERMS = {
+    "上涨": 1, "大涨": 2, "涨停": 2, "暴涨": 2, "拉升": 1, "反弹": 1, "走强": 1, "新高": 2, "创新高": 2,
+    "增长": 1, "高增长": 2, "增持": 2, "回购": 1, "分红": 1, "买入": 1, "推荐": 1, "看好": 1, "利好": 2,
+    "超预期": 2, "盈利": 1, "扭亏": 2, "净流入": 1, "突破": 1, "领涨": 1, "强势": 1, "景气": 1, "复苏": 1,
+    "提价": 1, "上调": 1, "优于": 1, "稳健": 1, "受益": 1, "龙头": 1, "机遇": 1, "乐观": 1, "增长强劲": 2,
+    "业绩预增": 2, "同比增长": 1, "订单": 1, "中标": 1, "获批": 1, "加仓": 1, "估值修复": 1
+}
+NEGATIVE_TERMS = {
+    "下跌": 1, "大跌": 2, "跌停": 2, "暴跌": 2, "跳水": 2, "回落": 1, "走弱": 1, "新低": 2, "下滑": 1,
+    "下降": 1, "减持": 2, "卖出": 1, "看空": 1, "利空": 2, "不及预期": 2, "低于预期": 2, "亏损": 2,
+    "净流出": 1, "跌破": 1, "领跌": 1, "弱势": 1, "风险": 1, "泡沫": 1, "下调": 1, "处罚": 2, "违规": 2,
+    "调查": 1, "诉讼": 1, "质押": 1, "爆雷": 2, "退市": 2, "警示": 1, "回调": 1, "承压": 1, "担忧": 1,
+    "业绩预减": 2, "同比下降": 1, "商誉减值": 2, "停产": 2, "召回": 1, "减仓": 1, "抛售": 2
+}
+# Added to the total weight of the matched terms so that a single hit does not give a score of 1
+SMOOTHING = 2
+
+
+class SentimentProvider(ABC):
+    """
+    Interface of the backends that score the sentiment of texts. Scores range from -1 (negative)
+    to 1 (positive), while the magnitude, which is not bounded, measures how much emotional
+    content a text has.
+    """
+    name = None
+    # Maximum number of characters in a single text given to analyze_texts
+    max_chunk_size = SENTIMENT_CHUNK_SIZE
+
+    @property
+    def available(self):
+        return True
+
+    @abstractmethod
+    def analyze_texts(self, texts, timeout=None):
+        """
+        Score the sentiment of each of the given texts.
+        :return: a list of tuples ((score, magnitude), exception) in the same order as the texts.
+        Exactly one of the two elements is None.
+        """
+
+
+class GoogleSentimentProvider(SentimentProvider):
+    """
+    Sends every text to the natural language API, which requires an API_KEY.
+    """
+    name = "google"
+
+    def __init__(self, google_service):
+        self.google_service = google_service
+
+    @property
+    def available(self):
+        return self.google_service.client.key is not None
+
+    def analyze_texts(self, texts, timeout=None):
+        return [(None, exception) if exception is not None else
+                ((reply["documentSentiment"]["score"], reply["documentSentiment"]["magnitude"]), None)
+                for reply, exception in self.google_service.analyze_texts(texts, timeout)]
+
+
+class LexiconSentimentProvider(SentimentProvider):
+    """
+    Scores texts locally by counting terms from a financial sentiment lexicon, without an API_KEY.
+    Only the scoring is local: the articles are still found by the Google search and crawled. A whole batch
+    of texts is scored at once as a matrix of term counts multiplied with the polarities.
+    Terms are matched longest first like a dictionary-based segmenter: occurrences of a term
+    that are part of a longer term in the lexicon are not counted.
+    """
+    name = "local"
+    max_chunk_size = LOCAL_SENTIMENT_CHUNK_SIZE
+
+    def __init__(self, positive_terms=POSITIVE_TERMS, negative_terms=NEGATIVE_TERMS):
+        lexicon = dict(positive_terms)
+        lexicon.update({term: -weight for term, weight in negative_terms.items()})
+        self.terms = list(lexicon.keys())
+        self.polarities = np.array([lexicon[term] for term in self.terms], dtype=float)
+        # containment[i, j] is the number of times term j occurs inside the longer term i
+        self.containment = np.array([[longer.count(term) if len(longer) > len(term) else 0
+                                      for term in self.terms] for longer in self.terms], dtype=float)
+
+    def count_terms(self, texts):
+        """
+        :return: a matrix with one row per text and one column per term of the lexicon
+        """
+        counts = np.zeros((len(texts), len(self.terms)))
+        array = np.array(texts, dtype=str)
+        # Longer terms are counted first so that their occurrences can be taken out of the shorter ones
+        for j in sorted(range(len(self.terms)), key=lambda k: len(self.terms[k]), reverse=True):
+            counts[:, j] = np.char.count(array, self.terms[j]) - counts @ self.containment[:, j]
+        return np.maximum(counts, 0)
+
+    def analyze_texts(self, texts, timeout=None):
+        if len(texts) == 0:
+            return []
+        try:
+            counts = self.count_terms(texts)
+        except Exception as exception:
+            logger.log("Failed to score {} texts with the local sentiment model: {}".format(len(texts), exception),
+                       "error")
+            return [(None, exception) for _ in texts]
+        polarity = counts @ self.polarities
+        magnitude = counts @ np.abs(self.polarities)
+        scores = np.clip(polarity / (magnitude + SMOOTHING), -1, 1)
+        return [((float(score), float(total)), None) for score, total in zip(scores, magnitude)]
+
+
+def create_sentiment_providers(google_service, backend=None):
+    """
+    :param backend: the name of the backend that is going to be used, checked so that an unknown
+    backend is reported before any stock is analyzed
+    :raise ValueError: if the backend is not one of the providers
+    :return: a dictionary of the providers keyed by name
+    """
+    providers = [GoogleSentimentProvider(google_service), LexiconSentimentProvider()]
+    providers = {provider.name: provider for provider in providers}
+    if backend is not None and backend not in providers:
+        raise ValueError("unknown sentiment backend '{}', expected one of {}".format(backend, list(providers)))
+    return providers
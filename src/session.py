@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from fund import Fund, nav_columns
+from logger import logger
+
+
+class SessionSnapshot:
+    """
+    A snapshot of the working set of the shell in data/session.npz, so that a restarted session
+    does not fetch everything again. The historical data of every fund is kept as one numpy
+    array per column and its pages as byte arrays, under keys prefixed by the fund code, e.g.
+    '161725.net_asset_value'. Everything else is kept in a json record under the key 'meta':
+    {"saved": time, "current": code of the current fund, "analysis_config": parameters,
+     "funds": {fund_code: {"fetched": time the pages were fetched,
+                           "historical_data_fetched": time the historical data was fetched or null,
+                           "prediction": {"predicted": time, "prediction": prediction, "confidence": confidence,
+                                          "contribution": contribution of each stock} or null}}}
+    Only the record is read when the snapshot is opened. The arrays of a fund are read when it
+    is restored, and resources that are older than their maximum age are left out.
+    """
+    def __init__(self, path, max_ages=None):
+        self.path = path
+        self.max_ages = dict(pages=SESSION_PAGES_MAX_AGE, historical_data=SESSION_NAV_MAX_AGE,
+                             prediction=SESSION_PREDICTION_MAX_AGE) if max_ages is None else max_ages
+        self.arrays = None
+        self.meta = dict(funds=dict())
+        if os.path.exists(path):
+            try:
+                self.arrays = np.load(path)
+                self.meta = json.loads(self.arrays["meta"].tobytes().decode("utf-8"))
+            except (OSError, ValueError, KeyError) as exception:
+                logger.log("Failed to open the session snapshot {}: {}".format(path, exception), "error")
+                self.close()
+
+    def close(self):
+        if self.arrays is not None:
+            self.arrays.close()
+            self.arrays = None
+
+    def reset(self):
+        """
+        Forget the snapshot, e.g. when it cannot be restored. It is replaced on the next save.
+        """
+        self.close()
+        self.meta = dict(funds=dict())
+
+    def is_fresh(self, resource, fetched):
+        return fetched is not None and time.time() - fetched <= self.max_ages[resource]
+
+    def fund_codes(self):
+        """
+        :return: the codes of the funds in the snapshot whose pages are still fresh
+        """
+        return [code for code, entry in self.meta["funds"].items() if self.is_fresh("pages", entry["fetched"])]
+
+    def restore_fund(self, code):
+        """
+        Create the Fund object of the given code from the snapshot.
+        :return: the Fund object, or None if it is not in the snapshot or its pages are too old
+        """
+        entry = self.meta["funds"].get(code)
+        if entry is None or self.arrays is None or not self.is_fresh("pages", entry["fetched"]):
+            return None
+        try:
+            historical_data = None
+            if self.is_fresh("historical_data", entry["historical_data_fetched"]):
+                historical_data = pd.DataFrame({column: self.arrays["{}.{}".format(code, column)]
+                                                for column in nav_columns})
+            fund = Fund(code, self.arrays["{}.fund_data_html".format(code)].tobytes().decode("utf-8"),
+                        self.arrays["{}.stock_html".format(code)].tobytes(), historical_data)
+        except (OSError, ValueError, KeyError) as exception:
+            logger.log("Failed to restore {} from the session snapshot: {}".format(code, exception), "error")
+            return None
+        fund.fetched = entry["fetched"]
+        if historical_data is not None:
+            fund.historical_data_fetched = entry["historical_data_fetched"]
+        prediction = entry["prediction"]
+        if prediction is not None and self.is_fresh("prediction", prediction["predicted"]):
+            fund.overall_prediction = prediction["prediction"]
+            fund.overall_confidence = prediction["confidence"]
+            fund.prediction_contribution = prediction["contribution"]
+            fund.predicted = prediction["predicted"]
+        return fund
+
+    def _kept_fund(self, code):
+        """
+        Copy the arrays and the record of a fund of the snapshot as they are, without restoring
+        the fund, leaving out the historical data and the prediction if they are too old.
+        :return: a tuple (dictionary of arrays, record of the fund)
+        """
+        entry = dict(self.meta["funds"][code])
+        keys = ["{}.fund_data_html".format(code), "{}.stock_html".format(code)]
+        if self.is_fresh("historical_data", entry["historical_data_fetched"]):
+            keys += ["{}.{}".format(code, column) for column in nav_columns]
+        else:
+            entry["historical_data_fetched"] = None
+        if entry["prediction"] is not None and not self.is_fresh("prediction", entry["prediction"]["predicted"]):
+            entry["prediction"] = None
+        return {key: self.arrays[key] for key in keys}, entry
+
+    @staticmethod
+    def _fund_arrays(fund):
+        arrays = {
+            "{}.fund_data_html".format(fund.code): np.frombuffer(fund.fund_data_html.encode("utf-8"), dtype=np.uint8),
+            "{}.stock_html".format(fund.code): np.frombuffer(fund.stock_html if isinstance(fund.stock_html, bytes)
+                                                             else fund.stock_html.encode("utf-8"), dtype=np.uint8)
+        }
+        # The historical data is only saved if it has been loaded, it is not fetched for the snapshot
+        if fund.historical_data_loaded:
+            for column in nav_columns:
+                values = fund.historical_data[column].to_numpy()
+                if column == "date":
+                    values = values.astype("datetime64[ns]")
+                arrays["{}.{}".format(fund.code, column)] = values
+        return arrays
+
+    @staticmethod
+    def _fund_meta(fund):
+        return dict(
+            fetched=fund.fetched,
+            historical_data_fetched=fund.historical_data_fetched if fund.historical_data_loaded else None,
+            prediction=dict(predicted=fund.predicted, prediction=fund.overall_prediction,
+                            confidence=fund.overall_confidence, contribution=fund.prediction_contribution)
+            if fund.predicted is not None else None
+        )
+
+    def save(self, funds, current, analysis_config):
+        """
+        Replace the snapshot with the given funds. Funds of the previous snapshot that have not
+        been restored in this session are kept as long as they are fresh.
+        :param funds: a list of Fund objects
+        :param current: the code of the current fund or None
+        :param analysis_config: the parameters used for stock analysis, with json serializable values
+        """
+        arrays = dict()
+        meta = dict(saved=time.time(), current=current, analysis_config=analysis_config, funds=dict())
+        for fund in funds:
+            arrays.update(self._fund_arrays(fund))
+            meta["funds"][fund.code] = self._fund_meta(fund)
+        if self.arrays is not None:
+            for code in self.fund_codes():
+                if code not in meta["funds"]:
+                    try:
+                        fund_arrays, meta["funds"][code] = self._kept_fund(code)
+                        arrays.update(fund_arrays)
+                    except (OSError, ValueError, KeyError) as exception:
+                        logger.log("Failed to keep {} of the session snapshot: {}".format(code, exception), "error")
+                        meta["funds"].pop(code, None)
+        arrays["meta"] = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+        self.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, self.path)
+        self.arrays = np.load(self.path)
+        self.meta = meta
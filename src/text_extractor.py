@@ -1,16 +1,50 @@
+import re
+import time
+
 import html2text
-import requests
-from goose3 import Goose
-from goose3.text import StopWordsChinese
-from newspaper import Article
 
+from extraction import ExtractionEngine
 from logger import logger
+from page_encoding import encoding_detector
+from rate_limiter import scheduler
 from utils import *
 
+# The element that holds the article on most news sites, after which nothing is extracted
+article_tag_pattern = re.compile(rb"<(/?)article(?:\s[^>]*)?>", re.IGNORECASE)
+markup_pattern = re.compile(rb"<[^>]*>|\s+")
+# Number of bytes at the end of the received data that are searched again, in case a tag is split between chunks
+tag_overlap = 256
+
+
+class DownloadRejected(Exception):
+    """
+    Raised when the response is not a web page, before its body is downloaded.
+    """
+    def __init__(self, url, content_type, bytes_saved):
+        super().__init__("content type {} of {} is not a web page".format(content_type, url))
+        self.content_type = content_type
+        self.bytes_saved = bytes_saved
+
+
+class Download:
+    """
+    A page downloaded by HTMLTextExtractor.download.
+    aborted is None if the whole body was received, otherwise the reason why the download
+    was stopped: 'size cap' or 'end of article'. bytes_saved is only known when the server
+    sent a Content-Length, otherwise it is 0.
+    """
+    def __init__(self, html, received, content_length, aborted):
+        self.html = html
+        self.received = received
+        self.aborted = aborted
+        self.bytes_saved = max(0, content_length - received) if aborted is not None and content_length is not None \
+            else 0
+
+
 class HTMLTextExtractor:
     def __init__(self):
         self.converter = html2text.HTML2Text()
-        self.goose = Goose({"stopwords_class": StopWordsChinese})
+        self.engine = ExtractionEngine()
         self.converter.ignore_links = True
         self.converter.ignore_emphasis = True
         self.converter.ignore_tables = True
@@ -23,44 +57,97 @@ class HTMLTextExtractor:
         Extract all the text in an HTML page. Does not ignore insignificant information.
         """
         try:
-            request = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=3)
-            # Detect the encoding of the webpage
-            encoding = get_page_encoding(request)
-            # print(request.content.decode(encoding, errors="ignore"))
-            return self.converter.handle(request.content.decode(encoding, errors="ignore"))
+            return self.converter.handle(self.retrieve_raw_html(url))
         except Exception as exception:
             raise exception
 
-    def retrieve_raw_html(self, url):
+    @staticmethod
+    def download(url, timeout=ARTICLE_TIMEOUT, max_bytes=DOWNLOAD_MAX_BYTES, deadline=None):
+        """
+        Stream the page specified by the given url. Responses that are not web pages are
+        rejected from their headers, and the body stops being downloaded after max_bytes
+        bytes or once a top-level <article> element with at least DOWNLOAD_ARTICLE_MIN_TEXT
+        bytes of text has been received.
+        :param deadline: time.monotonic() value after which the download is given up, even if
+        every chunk arrives within the timeout
+        :raise DownloadRejected: if the Content-Type of the response is not a web page
+        :raise TimeoutError: if the deadline is reached
+        :return: a Download object
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("deadline reached before downloading {}".format(url))
+        response = scheduler.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=timeout, stream=True)
         try:
-            request = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=3)
-            # Detect the encoding of the webpage
-            encoding = get_page_encoding(request)
-            # print(request.content.decode(encoding, errors="ignore"))
-            return request.content.decode(encoding, errors="ignore")
+            content_length = response.headers.get("Content-Length", "")
+            content_length = int(content_length) if content_length.isdigit() else None
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type != "" and content_type not in DOWNLOAD_CONTENT_TYPES:
+                raise DownloadRejected(url, content_type, content_length or 0)
+            data = bytearray()
+            aborted = None
+            # Position from which tags are searched, nesting depth of <article> elements and the
+            # start of the top-level one that is open
+            position, depth, start = 0, 0, None
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("deadline reached while downloading {}".format(url))
+                data += chunk
+                if len(data) >= max_bytes:
+                    aborted = "size cap"
+                    break
+                for match in article_tag_pattern.finditer(data, position):
+                    position = match.end()
+                    if match.group(1) == b"":
+                        if depth == 0:
+                            start = match.start()
+                        depth += 1
+                    elif depth > 0:
+                        depth -= 1
+                        if depth == 0 and len(markup_pattern.sub(b"", data[start:position])) >= \
+                                DOWNLOAD_ARTICLE_MIN_TEXT:
+                            aborted = "end of article"
+                            break
+                if aborted is not None:
+                    break
+                position = max(position, len(data) - tag_overlap)
+            # Stopping after the last chunk does not save anything, which is known from the Content-Length,
+            # or for responses without one, from the connection having been read to the end. Bytes are counted
+            # as they were received, compressed or not, and chunked responses are only counted after decoding.
+            received = response.raw.tell() or len(data)
+            if aborted is not None and (received >= content_length if content_length is not None
+                                        else response.raw.closed):
+                aborted = None
+            html = encoding_detector.decode(bytes(data[:max_bytes]), response.headers.get("Content-Type"),
+                                            response.url)
+            return Download(html, received, content_length, aborted)
+        finally:
+            response.close()
+
+    def retrieve_raw_html(self, url, timeout=ARTICLE_TIMEOUT):
+        try:
+            return self.download(url, timeout).html
         except Exception as exception:
             raise exception
 
-    def extract_essential_text(self, url):
+    def extract_article(self, url, timeout=ARTICLE_TIMEOUT, deadline=None):
         """
-        Use Goose and newspaper library to extract the content of the article
-        specified by the given url.
-        :return: a list of strings that represent the content of the article
+        Use the extraction engine to extract the content of the article specified by the
+        given url, with the extractor that works best on its domain.
+        :param timeout: number of seconds to wait for the server to respond
+        :param deadline: time.monotonic() value after which the download is given up
+        :return: a tuple (list of strings that represent the content of the article, Download object)
         """
         try:
-            html = self.retrieve_raw_html(url)
-            article_goose = self.goose.extract(raw_html=html)
-            text = article_goose.cleaned_text
-            # If Goose is unable to extract the article content, try newspaper
-            if text == "":
-                article = Article(url, language="zh")
-                article.download(input_html=html)
-                article.parse()
-                # If newspaper is unable to extract the content of the article,
-                # return the title of the page
-                text = article.text if article.text != "" else article.title
+            download = self.download(url, timeout, deadline=deadline)
+            text, extractor = self.engine.extract(url, download.html)
             lines = [line.strip() for line in text.splitlines() if line.strip()]
-            logger.log("Extracted text from url {}".format(url))
-            return lines
+            logger.log("Extracted text from url {} with {}".format(url, extractor))
+            return lines, download
         except Exception as exception:
-            raise exception
\ No newline at end of file
+            raise exception
+
+    def extract_essential_text(self, url, timeout=ARTICLE_TIMEOUT):
+        """
+        :return: a list of strings that represent the content of the article
+        """
+        return self.extract_article(url, timeout)[0]
\ No newline at end of file
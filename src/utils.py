@@ -3,10 +3,13 @@ import os
 import re
 
 import chardet
+import numpy as np
 
 from constants import *
 from prettytable import PrettyTable
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 
 def get_page_encoding(request):
@@ -35,35 +38,99 @@ def get_complete_fund_code(code):
         return "sh.{}".format(code)
 
 
-def graph_historical_data(df, selected_columns):
+def lttb_downsample(x, y, threshold):
+    """
+    Downsample the series given by x and y to at most threshold points with the
+    Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape of the series.
+    :param x: a numpy array of numbers sorted in ascending order
+    :param y: a numpy array of numbers of the same length as x
+    :return: a numpy array of the indices of the points that are kept
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # The first and last points are always kept, the others are split into equally sized buckets
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    selected = np.zeros(threshold, dtype=int)
+    selected[-1] = length - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else length
+        next_x = x[next_start:next_end].mean()
+        next_y = np.nanmean(y[next_start:next_end])
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.nanargmax(areas)) if not np.all(np.isnan(areas)) else start
+        selected[i + 1] = previous
+    return selected
+
+
+def plot_historical_data(figure, df, selected_columns, max_points=None):
+    """
+    Draw the selected columns of the historical data on the given matplotlib figure.
+    :param max_points: if given, every series is downsampled to at most max_points points
+    """
+    df = df.sort_values(by="date")
     date = df["date"]
-    nav = df["net_asset_value"]
-    cumulative_value = df["cumulative_value"]
-    daily_yield = df["daily_yield"]
+    # Dates are downsampled as nanosecond timestamps
+    timestamps = date.values.astype("datetime64[ns]").astype(np.int64)
+
+    def series(column):
+        values = df[column].values
+        if max_points is None:
+            return date, values
+        indices = lttb_downsample(timestamps, values, max_points)
+        return date.values[indices], values[indices]
 
-    # Plot net asset value
-    figure = plt.figure()
     ax1 = figure.add_subplot(111)
     if "nav" in selected_columns:
-        ax1.plot(date, nav, label="Net asset value")
+        ax1.plot(*series("net_asset_value"), label="Net asset value")
     if "cnv" in selected_columns:
-        ax1.plot(date, cumulative_value, label='Cumulative net asset value')
+        ax1.plot(*series("cumulative_value"), label='Cumulative net asset value')
     if "nav" in selected_columns or "cnv" in selected_columns:
         ax1.set_ylabel("Net asset value")
         ax1.set_xlabel("Date")
-        plt.legend(loc="upper left")
+        ax1.legend(loc="upper left")
 
     # Plot daily yield
     if "dy" in selected_columns:
         ax2 = ax1.twinx() if len(selected_columns) > 1 else ax1
-        ax2.plot(date, daily_yield, 'r', label="Daily yield")
+        ax2.plot(*series("daily_yield"), 'r', label="Daily yield")
         ax2.set_ylabel("Daily yield")
-        plt.legend(loc='upper right')
+        ax2.legend(loc='upper right')
 
-    plt.title('Net Asset Values of Fund')
+    ax1.set_title('Net Asset Values of Fund')
+
+
+def graph_historical_data(df, selected_columns, max_points=PLOT_MAX_POINTS):
+    figure = plt.figure()
+    plot_historical_data(figure, df, selected_columns, max_points)
     plt.show()
 
 
+def render_historical_data(df, selected_columns, file_path, max_points=PLOT_MAX_POINTS):
+    """
+    Render the chart of the historical data to the given file without a display. The
+    format of the file (e.g. png, svg) is derived from its extension.
+    """
+    # A figure that is not managed by pyplot can be rendered from any thread or process
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    plot_historical_data(figure, df, selected_columns, max_points)
+    figure.savefig(file_path)
+    return file_path
+
+
+def has_display():
+    """
+    Return True if the charts can be shown in a window.
+    """
+    return plt.get_backend().lower() != "agg"
+
+
 def table_str(data, column_names):
     """
     Print a list of dictionaries in a table
@@ -95,6 +162,71 @@ def prepare_payload():
     dump_json_to_file(data, REQUEST_FILE)
 
 
+def split_into_chunks(texts, max_size=SENTIMENT_CHUNK_SIZE):
+    """
+    Pack the given texts into chunks of at most max_size characters. Texts are never split
+    unless a single one exceeds max_size, in which case it is split on sentence boundaries.
+    A single sentence longer than max_size is cut into pieces of max_size.
+    :return: a list of tuples (chunk, indices of the texts that are part of the chunk)
+    """
+    pieces = []
+    for i, text in enumerate(texts):
+        if len(text) <= max_size:
+            pieces.append((i, text))
+            continue
+        for sentence in re.findall(r"[^。！？!?\n]*[。！？!?\n]*", text):
+            for j in range(0, len(sentence), max_size):
+                pieces.append((i, sentence[j:j + max_size]))
+
+    chunks = []
+    current = ""
+    indices = []
+    for i, piece in pieces:
+        if not piece:
+            continue
+        if len(current) + len(piece) > max_size and current:
+            chunks.append((current, indices))
+            current = ""
+            indices = []
+        current += piece
+        if i not in indices:
+            indices.append(i)
+    if current:
+        chunks.append((current, indices))
+    return chunks
+
+
+def aggregate_sentiments(sentiments):
+    """
+    Combine the sentiments of several chunks of text into one. Each score is weighted by the
+    magnitude of its chunk, i.e. the amount of emotional content in it, so that chunks with
+    strong opinions outweigh neutral ones. Falls back to weighting by length if every chunk
+    is neutral.
+    :param sentiments: a list of tuples (score, magnitude, length of the chunk)
+    :return: a tuple (score, magnitude)
+    """
+    if len(sentiments) == 0:
+        return 0, 0
+    scores, magnitudes, lengths = (np.array(values, dtype=float) for values in zip(*sentiments))
+    weights = magnitudes if magnitudes.sum() > 0 else lengths
+    if weights.sum() == 0:
+        return float(scores.mean()), 0.0
+    return float(np.average(scores, weights=weights)), float(magnitudes.sum())
+
+
+def weighted_coverage(contributions):
+    """
+    Return the average coverage of the given prediction contributions weighted by
+    their position ratios, which serves as the confidence of the overall prediction.
+    """
+    contributions = list(contributions)
+    total_ratio = sum(contribution["position_ratio"] for contribution in contributions)
+    if total_ratio == 0:
+        return 0
+    return sum(contribution["coverage"] * contribution["position_ratio"] for contribution in contributions) \
+        / total_ratio
+
+
 def clear_payload():
     """
     Remove all content in data/data.txt.
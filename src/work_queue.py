@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from constants import *
+
+schema = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    shard INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available REAL NOT NULL DEFAULT 0,
+    lease_id TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind, shard);
+CREATE INDEX IF NOT EXISTS tasks_lease ON tasks (lease_id);
+CREATE TABLE IF NOT EXISTS results (
+    task_id TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    result TEXT,
+    completed REAL NOT NULL
+);
+"""
+
+
+def task_id(kind, key):
+    return "{}:{}".format(kind, key)
+
+
+def shard_of(key, shards=WORK_QUEUE_SHARDS):
+    """
+    Return the shard of a task, which does not depend on the process, so that workers can split
+    the tasks between them by shard.
+    """
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class WorkQueue:
+    """
+    A durable queue of tasks in a SQLite database, shared by worker processes on the same machine.
+    The database uses a rollback journal rather than WAL, which needs memory shared between the
+    processes. A database on a network filesystem (e.g. NFS) is not supported either way, since
+    SQLite relies on file locks that such filesystems often do not implement correctly.
+    A task is identified by its kind and key, e.g. ('fund', '161725'), so it is only ever queued once.
+    Workers take tasks in leases: a batch of pending tasks that belongs to the worker until the lease
+    expires. A worker renews its lease while it works, and the tasks of leases that have expired, e.g.
+    because the worker died, are returned to the queue. A result is only accepted from the worker that
+    holds the lease on the task, and only once, so that no task is completed twice.
+    Task status: pending -> leased -> done, or back to pending after a failure, to be retried after
+    retry_delay seconds, until it has been attempted max_attempts times, after which it is failed.
+    """
+    def __init__(self, path=WORK_QUEUE_FILE, max_attempts=WORK_QUEUE_MAX_ATTEMPTS, retry_delay=WORK_QUEUE_RETRY_DELAY):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        # The connection is shared with the thread that renews the lease of a worker
+        self.lock = threading.RLock()
+        # Transactions are started explicitly, and writers wait for each other instead of failing
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the statements of the block in a write transaction, which is committed when the block
+        ends and rolled back if it raises an exception.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _query(self, query, params=()):
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def enqueue(self, kind, keys, payloads=None):
+        """
+        Add tasks of the given kind to the queue. Tasks that have been queued before are left as they are.
+        :param payloads: a dictionary of json serializable data given to the task, keyed by task key
+        :return: the number of tasks added
+        """
+        now = time.time()
+        payloads = dict() if payloads is None else payloads
+        rows = [(task_id(kind, key), kind, key, json.dumps(payloads.get(key), ensure_ascii=False), shard_of(key),
+                 now, now) for key in keys]
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO tasks (id, kind, key, payload, shard, created, updated) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            return connection.total_changes - before
+
+    def _reclaim(self, connection, now):
+        """
+        Return the tasks of expired leases to the queue, or fail them once they have been attempted too often.
+        """
+        connection.execute("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                           "error = 'lease of ' || worker || ' expired', lease_id = NULL, updated = ? "
+                           "WHERE status = 'leased' AND lease_expires < ?", (self.max_attempts, now, now))
+
+    def lease(self, worker, kinds=None, shards=None, size=WORK_QUEUE_LEASE_SIZE,
+              duration=WORK_QUEUE_LEASE_DURATION):
+        """
+        Take up to size pending tasks for the given worker, the oldest first.
+        :param kinds: the kinds of tasks to take, or None for any kind
+        :param shards: the shards to take tasks from, or None for any shard
+        :return: a tuple (lease id, list of dictionaries with the keys id, kind, key, payload and attempts),
+        the list is empty if there are no pending tasks
+        """
+        now = time.time()
+        lease_id = uuid.uuid4().hex
+        conditions = ["status = 'pending'", "available <= ?"]
+        params = [now]
+        if kinds is not None:
+            conditions.append("kind IN ({})".format(", ".join("?" * len(kinds))))
+            params += list(kinds)
+        if shards is not None:
+            conditions.append("shard IN ({})".format(", ".join("?" * len(shards))))
+            params += list(shards)
+        with self._transaction() as connection:
+            self._reclaim(connection, now)
+            rows = connection.execute("SELECT id, kind, key, payload, attempts FROM tasks WHERE {} "
+                                      "ORDER BY created, id LIMIT ?".format(" AND ".join(conditions)),
+                                      params + [size]).fetchall()
+            connection.executemany("UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_id = ?, "
+                                   "worker = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                                   [(lease_id, worker, now + duration, now, row["id"]) for row in rows])
+        return lease_id, [dict(id=row["id"], kind=row["kind"], key=row["key"], payload=json.loads(row["payload"]),
+                               attempts=row["attempts"] + 1) for row in rows]
+
+    def renew(self, lease_id, duration=WORK_QUEUE_LEASE_DURATION):
+        """
+        Extend the lease on the tasks that have not been finished yet.
+        :return: the number of tasks still held by the lease, 0 if the lease has expired and been reclaimed
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            return connection.execute("UPDATE tasks SET lease_expires = ?, updated = ? "
+                                      "WHERE lease_id = ? AND status = 'leased'",
+                                      (now + duration, now, lease_id)).rowcount
+
+    def complete(self, task, lease_id, result):
+        """
+        Store the result of a task. Does nothing if the task is no longer held by the lease, e.g.
+        because the lease expired and another worker took the task, or if it has been completed before.
+        :param task: the id of the task
+        :return: whether the result was stored
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute("SELECT worker FROM tasks WHERE id = ? AND lease_id = ? AND status = 'leased'",
+                                     (task, lease_id)).fetchone()
+            if row is None:
+                return False
+            connection.execute("UPDATE tasks SET status = 'done', lease_id = NULL, error = NULL, updated = ? "
+                               "WHERE id = ?", (now, task))
+            connection.execute("INSERT OR IGNORE INTO results (task_id, worker, result, completed) VALUES (?, ?, ?, ?)",
+                               (task, row["worker"], json.dumps(result, ensure_ascii=False), now))
+            return True
+
+    def fail(self, task, lease_id, error):
+        """
+        Return a task that failed to the queue, or fail it for good once it has been attempted max_attempts times.
+        :return: whether the task was held by the lease
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            return connection.execute("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                                      "ELSE 'pending' END, error = ?, lease_id = NULL, available = ?, updated = ? "
+                                      "WHERE id = ? AND lease_id = ? AND status = 'leased'",
+                                      (self.max_attempts, str(error)[:200], now + self.retry_delay, now, task,
+                                       lease_id)).rowcount == 1
+
+    def release(self, lease_id):
+        """
+        Return the unfinished tasks of a lease to the queue without counting the attempt, e.g. when a worker stops.
+        """
+        with self._transaction() as connection:
+            return connection.execute("UPDATE tasks SET status = 'pending', attempts = attempts - 1, lease_id = NULL, "
+                                      "updated = ? WHERE lease_id = ? AND status = 'leased'",
+                                      (time.time(), lease_id)).rowcount
+
+    def retry_failed(self, kind=None):
+        """
+        Return the failed tasks to the queue with a new set of attempts.
+        :return: the number of tasks returned
+        """
+        with self._transaction() as connection:
+            return connection.execute("UPDATE tasks SET status = 'pending', attempts = 0, available = 0, updated = ? "
+                                      "WHERE status = 'failed' AND (? IS NULL OR kind = ?)",
+                                      (time.time(), kind, kind)).rowcount
+
+    def pending(self, kinds=None, shards=None):
+        """
+        :return: the number of tasks that are pending or leased, i.e. that still need to be done
+        """
+        self._reclaim_now()
+        query = "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+        params = []
+        if kinds is not None:
+            query += " AND kind IN ({})".format(", ".join("?" * len(kinds)))
+            params += list(kinds)
+        if shards is not None:
+            query += " AND shard IN ({})".format(", ".join("?" * len(shards)))
+            params += list(shards)
+        return self._query(query, params)[0][0]
+
+    def _reclaim_now(self):
+        with self._transaction() as connection:
+            self._reclaim(connection, time.time())
+
+    def status(self):
+        """
+        :return: a list of dictionaries with the keys kind, pending, leased, done and failed
+        """
+        self._reclaim_now()
+        counts = dict()
+        for row in self._query("SELECT kind, status, COUNT(*) AS count FROM tasks GROUP BY kind, status"):
+            counts.setdefault(row["kind"], dict(kind=row["kind"], pending=0, leased=0, done=0, failed=0))
+            counts[row["kind"]][row["status"]] = row["count"]
+        return list(counts.values())
+
+    def workers(self):
+        """
+        :return: a list of dictionaries with the keys worker, done and last_completed, the busiest worker first
+        """
+        return [dict(worker=row["worker"], done=row["done"],
+                     last_completed=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["last_completed"])))
+                for row in self._query("SELECT worker, COUNT(*) AS done, MAX(completed) AS last_completed "
+                                       "FROM results GROUP BY worker ORDER BY done DESC")]
+
+    def results(self, kind):
+        """
+        :return: a dictionary of the results of the tasks of the given kind, keyed by task key
+        """
+        return {row["key"]: json.loads(row["result"]) for row in self._query(
+            "SELECT tasks.key, results.result FROM results JOIN tasks ON tasks.id = results.task_id "
+            "WHERE tasks.kind = ?", (kind,))}
+
+    def failures(self):
+        """
+        :return: a list of dictionaries with the keys id, attempts and error of the tasks that failed
+        """
+        return [dict(row) for row in self._query(
+            "SELECT id, attempts, error FROM tasks WHERE status = 'failed' ORDER BY updated")]
@@ -0,0 +1,203 @@
+import argparse
+import os
+import signal
+import threading
+import time
+
+from constants import *
+from fund import Fund
+from fund_index import fund_index
+from fund_store import fund_store
+from logger import logger
+from predictor import Predictor, default_analysis_config
+from utils import table_str
+from work_queue import WorkQueue
+
+kinds = ["fund", "stock"]
+
+
+def parse_shards(text):
+    """
+    Parse a list of shards such as '0-3,8'.
+    """
+    shards = set()
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        shards.update(range(int(start), int(end if end else start) + 1))
+    if not shards.issubset(range(WORK_QUEUE_SHARDS)):
+        raise ValueError("shards must be between 0 and {}".format(WORK_QUEUE_SHARDS - 1))
+    return sorted(shards)
+
+
+class Worker:
+    """
+    Takes leases of tasks from the work queue and runs them until the queue is empty:
+    fund: syncs the pages and the historical data of a fund to the local store, and queues
+          the analysis of its stocks if the task asks for it
+    stock: analyzes the news on a stock, once for all the funds that hold it
+    Several worker processes on the same machine can share a queue. Each lease of the worker is
+    renewed in the background while its tasks run.
+    """
+    def __init__(self, queue, name, kinds=None, shards=None, lease_size=WORK_QUEUE_LEASE_SIZE,
+                 analysis_config=None):
+        self.queue = queue
+        self.name = name
+        self.kinds = kinds
+        self.shards = shards
+        self.lease_size = lease_size
+        self.analysis_config = default_analysis_config() if analysis_config is None else analysis_config
+        self.lease_id = None
+        self.stopped = threading.Event()
+        self.predictor_services = None
+        self.statistics = dict(done=0, failed=0, lost=0)
+
+    # ==================== Tasks ====================
+    def fund(self, task):
+        fund = Fund(task["key"])
+        # Raises an AttributeError if the fund does not exist
+        name = fund.data["name"]
+        if fund.historical_data is None:
+            raise ConnectionError("historical data on {} is not available".format(task["key"]))
+        fund_store.save(fund)
+        if task["payload"] is not None and task["payload"].get("stocks"):
+            self.queue.enqueue("stock", [stock["code"] for stock in fund.stocks],
+                               {stock["code"]: dict(name=stock["name"]) for stock in fund.stocks})
+        return dict(name=name, stocks=[stock["code"] for stock in fund.stocks], nav_rows=len(fund.historical_data))
+
+    def stock(self, task):
+        if self.predictor_services is None:
+            # Imported here so that workers that only sync funds do not load the analysis models
+            from google_services import GoogleServices
+            from relevance import RelevanceFilter
+            from sentiment import create_sentiment_providers
+            from text_extractor import HTMLTextExtractor
+            google_service = GoogleServices()
+            self.predictor_services = (google_service, HTMLTextExtractor(), RelevanceFilter(),
+                                       create_sentiment_providers(google_service, self.analysis_config["sentiment"]))
+        provider = self.predictor_services[3][self.analysis_config["sentiment"]]
+        if not provider.available:
+            raise RuntimeError("sentiment backend '{}' is not available".format(provider.name))
+        predictor = Predictor(self.analysis_config, *self.predictor_services, interactive=False)
+        stock = dict(code=task["key"], name=task["payload"]["name"], position_ratio=0)
+        deadline = time.monotonic() + self.analysis_config["command_timeout"]
+        score, coverage = predictor.analyze_stock(stock, True, deadline)
+        return dict(name=stock["name"], score=score, coverage=coverage, crawled=predictor.statistics["crawled_links"])
+
+    # ==================== Leases ====================
+    def renew_lease(self, lease_id, released):
+        """
+        Renew the given lease in the background until it is released. The renewals stop as soon as one
+        of them fails, since the tasks of an expired lease may have been given to another worker,
+        or if the worker has moved on to another lease.
+        """
+        while not released.wait(WORK_QUEUE_LEASE_DURATION / 3):
+            if self.lease_id != lease_id:
+                return
+            if self.queue.renew(lease_id) == 0:
+                logger.log("Lease {} of {} has expired".format(lease_id, self.name), "warning", False)
+                return
+
+    def run_task(self, task):
+        start = time.monotonic()
+        try:
+            result = getattr(self, task["kind"])(task)
+        except Exception as exception:
+            self.queue.fail(task["id"], self.lease_id, exception)
+            self.statistics["failed"] += 1
+            logger.log("Failed to run {} (attempt {}): {}".format(task["id"], task["attempts"], exception),
+                       "error", False)
+            return
+        if self.queue.complete(task["id"], self.lease_id, result):
+            self.statistics["done"] += 1
+            logger.log("Finished {} in {:.1f}s".format(task["id"], time.monotonic() - start), quiet=False)
+        else:
+            # The lease expired and the task was given to another worker, which owns the result
+            self.statistics["lost"] += 1
+            logger.log("Dropped the result of {}, its lease has expired".format(task["id"]), "warning", False)
+
+    def run(self, wait=False):
+        """
+        Run tasks until the queue is empty, or until stop is called if wait is True.
+        """
+        logger.log("Worker {} started".format(self.name), quiet=False)
+        while not self.stopped.is_set():
+            self.lease_id, tasks = self.queue.lease(self.name, self.kinds, self.shards, self.lease_size)
+            if len(tasks) == 0:
+                # Tasks leased by other workers may still come back to the queue if their lease expires
+                if not wait and self.queue.pending(self.kinds, self.shards) == 0:
+                    break
+                self.stopped.wait(WORK_QUEUE_POLL_INTERVAL)
+                continue
+            # Each lease has its own renewer, which ends with it
+            released = threading.Event()
+            threading.Thread(target=self.renew_lease, args=(self.lease_id, released), daemon=True).start()
+            try:
+                for task in tasks:
+                    if self.stopped.is_set():
+                        break
+                    self.run_task(task)
+            finally:
+                released.set()
+            self.queue.release(self.lease_id)
+        self.stopped.set()
+        logger.log("Worker {} stopped: {} tasks done, {} failed, {} lost to expired leases".format(
+            self.name, self.statistics["done"], self.statistics["failed"], self.statistics["lost"]), quiet=False)
+
+    def stop(self, *_):
+        self.stopped.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distributes the crawling of funds and the analysis of their stocks "
+                                                 "between workers through a shared work queue.")
+    parser.add_argument("--queue", default=WORK_QUEUE_FILE, help="path to the SQLite database of the queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue_parser = commands.add_parser("enqueue", help="queue funds to be crawled")
+    enqueue_parser.add_argument("codes", nargs="*", help="codes of the funds")
+    enqueue_parser.add_argument("--all", action="store_true", help="queue every fund in the index of funds")
+    enqueue_parser.add_argument("--stocks", action="store_true", help="also analyze the news on the stocks they hold")
+    run_parser = commands.add_parser("run", help="run tasks until the queue is empty")
+    run_parser.add_argument("--name", default="{}-{}".format(os.uname().nodename, os.getpid()),
+                            help="name of the worker, the host name and process id by default")
+    run_parser.add_argument("--kinds", default=",".join(kinds), help="kinds of tasks to run, separated by commas")
+    run_parser.add_argument("--shards", help="shards to take tasks from, e.g. '0-7' for one group of workers "
+                                             "and '8-15' for another. All shards by default")
+    run_parser.add_argument("--lease-size", type=int, default=WORK_QUEUE_LEASE_SIZE, help="tasks taken at once")
+    run_parser.add_argument("--sentiment", default="google", choices=["google", "local"],
+                            help="sentiment backend used to analyze stocks")
+    run_parser.add_argument("--wait", action="store_true", help="wait for new tasks when the queue is empty")
+    commands.add_parser("status", help="print the number of tasks in each state and the tasks done by each worker")
+    commands.add_parser("retry", help="queue the tasks that failed again")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.command == "enqueue":
+        codes = list(args.codes)
+        if args.all:
+            if not fund_index.load():
+                print("The index of funds could not be loaded!")
+                exit()
+            codes += [str(code) for code in fund_index.columns["code"]]
+        payload = dict(stocks=args.stocks)
+        added = queue.enqueue("fund", codes, {code: payload for code in codes})
+        print("{} of {} funds queued, the others were queued before".format(added, len(codes)))
+    elif args.command == "run":
+        if any(kind not in kinds for kind in args.kinds.split(",")):
+            print("Kinds of tasks must be among {}".format(", ".join(kinds)))
+            exit()
+        analysis_config = default_analysis_config()
+        analysis_config.update(verbose=False, sentiment=args.sentiment)
+        worker = Worker(queue, args.name, args.kinds.split(","),
+                        parse_shards(args.shards) if args.shards else None, args.lease_size, analysis_config)
+        signal.signal(signal.SIGINT, worker.stop)
+        signal.signal(signal.SIGTERM, worker.stop)
+        worker.run(args.wait)
+    elif args.command == "status":
+        print(table_str(queue.status(), ["Kind", "Pending", "Leased", "Done", "Failed"]))
+        print(table_str(queue.workers(), ["Worker", "Done", "Last completed"]))
+        failures = queue.failures()
+        if failures:
+            print(table_str(failures[:MAX_TABLE_ROWS], ["Task", "Attempts", "Error"]))
+    elif args.command == "retry":
+        print("{} failed tasks queued again".format(queue.retry_failed()))
+    queue.close()
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# The modules keep their files under ./data and ./logs relative to the working directory,
+# so the tests run in a scratch directory instead of the repository
+workdir = tempfile.mkdtemp(prefix="fund-assistant-tests-")
+for directory in ("data", "logs"):
+    os.makedirs(os.path.join(workdir, directory))
+# The article log ships with the repository
+with open(os.path.join(workdir, "logs", "articles.log.json"), "w") as file:
+    file.write("{}")
+os.chdir(workdir)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import backtest, forward_yields
+
+
+def make_yields(values):
+    """
+    :param values: a dictionary of the daily yields of each fund on consecutive trading days from 2021-03-01
+    """
+    dates = pd.bdate_range("2021-03-01", periods=len(next(iter(values.values()))))
+    return pd.DataFrame([dict(fund_code=code, date=date, daily_yield=value)
+                         for code, series in values.items() for date, value in zip(dates, series)])
+
+
+def make_predictions(rows):
+    return pd.DataFrame(rows, columns=["timestamp", "fund_code", "prediction"])
+
+
+def test_forward_yields_sum_the_following_trading_days_of_each_fund():
+    yields = make_yields({"000002": [1, 2, 3, 4], "000001": [10, 20, 30, 40]})
+
+    result = forward_yields(yields.sample(frac=1, random_state=0), horizon=2)
+
+    assert list(result["fund_code"]) == ["000001"] * 4 + ["000002"] * 4
+    np.testing.assert_array_equal(result["forward_yield"], [30, 50, 70, np.nan, 3, 5, 7, np.nan])
+
+
+def test_predictions_are_matched_with_the_next_trading_day():
+    # 2021-03-05 is a Friday, so the predictions made on it are matched with the yields of Monday
+    yields = make_yields({"000001": [1, 1, 2, -2, 3, -3], "000002": [-1, -1, -2, 2, -3, 3]})
+    predictions = make_predictions([
+        ("2021-03-01 20:00", "000001", -0.5),
+        ("2021-03-01 21:00", "000001", 0.5),
+        ("2021-03-01 21:00", "000002", -0.5),
+        ("2021-03-05 10:00", "000001", -0.2),
+        ("2021-03-05 10:00", "000002", 0.2),
+    ])
+
+    metrics, matched = backtest(predictions, yields)
+
+    # Only the last prediction of a fund on a day counts
+    assert metrics["samples"] == 4
+    assert metrics["funds"] == 2
+    assert list(matched["yield_date"].dt.strftime("%m-%d")) == ["03-02", "03-02", "03-08", "03-08"]
+    assert metrics["hit_rate"] == 1
+    assert metrics["ic"] == pytest.approx(1)
+
+
+def test_backtest_over_several_trading_days():
+    yields = make_yields({"000001": [0, 1, 1, -5], "000002": [0, -1, -1, 5]})
+    predictions = make_predictions([("2021-03-01 20:00", "000001", 0.3), ("2021-03-01 20:00", "000002", -0.3)])
+
+    next_day, _ = backtest(predictions, yields, horizon=1)
+    three_days, matched = backtest(predictions, yields, horizon=3)
+
+    assert next_day["hit_rate"] == 1
+    assert list(matched["forward_yield"]) == [-3, 3]
+    assert three_days["hit_rate"] == 0
+    assert three_days["ic"] == pytest.approx(-1)
+
+
+def test_predictions_without_realized_yields_are_left_out():
+    yields = make_yields({"000001": [1, 2]})
+    predictions = make_predictions([("2021-03-02 20:00", "000001", 0.3), ("2021-03-01 20:00", "000003", 0.3)])
+
+    metrics, matched = backtest(predictions, yields)
+
+    assert metrics["samples"] == 0
+    assert np.isnan(metrics["hit_rate"])
+    assert len(matched) == 0
@@ -0,0 +1,161 @@
+import json
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+import daemon as daemon_module
+from constants import DAEMON_RETRY_DELAY
+from daemon import Daemon, ScheduledJob, load_watchlist
+from predictor import DateRange
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now.timestamp()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, minutes):
+        self.now += minutes * 60
+
+
+class SynchronousExecutor:
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 2021-03-01 is a Monday
+    clock = FakeClock(datetime(2021, 3, 1, 8, 0))
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(clock.now, tz)
+
+    monkeypatch.setattr(daemon_module, "time", clock)
+    monkeypatch.setattr(daemon_module, "datetime", FakeDatetime)
+    return clock
+
+
+def make_daemon(tmp_path, jobs, failing=()):
+    """
+    A daemon whose tasks record the funds they run on instead of fetching them.
+    """
+    daemon = Daemon(jobs, 2, dict(sentiment="local"), state_path=str(tmp_path / "daemon_state.json"))
+    daemon.runs = []
+
+    def task(name):
+        def run(code):
+            daemon.runs.append((name, code))
+            if code in failing:
+                raise ConnectionError("{} is not available".format(code))
+        return run
+
+    daemon.sync = task("sync")
+    daemon.predict = task("predict")
+    return daemon
+
+
+def test_daily_job_runs_once_after_its_time_on_the_given_days():
+    job = ScheduledJob("close", "sync", ["161725"], at="15:30", days=[0, 1, 2, 3, 4])
+
+    assert not job.is_due(datetime(2021, 3, 1, 15, 29), None)
+    assert job.is_due(datetime(2021, 3, 1, 15, 30), None)
+    assert not job.is_due(datetime(2021, 3, 1, 18, 0), datetime(2021, 3, 1, 15, 31))
+    assert job.is_due(datetime(2021, 3, 2, 15, 30), datetime(2021, 3, 1, 15, 31))
+    # Saturday
+    assert not job.is_due(datetime(2021, 3, 6, 15, 30), None)
+
+
+def test_periodic_job_runs_every_few_minutes_within_its_hours():
+    job = ScheduledJob("intraday", "predict", ["161725"], every=30, between=["09:30", "15:00"])
+
+    assert not job.is_due(datetime(2021, 3, 1, 9, 0), None)
+    assert job.is_due(datetime(2021, 3, 1, 9, 30), None)
+    assert not job.is_due(datetime(2021, 3, 1, 9, 59), datetime(2021, 3, 1, 9, 30))
+    assert job.is_due(datetime(2021, 3, 1, 10, 0), datetime(2021, 3, 1, 9, 30))
+    assert not job.is_due(datetime(2021, 3, 1, 15, 1), datetime(2021, 3, 1, 10, 0))
+
+
+def test_jobs_need_a_known_task_and_exactly_one_schedule():
+    with pytest.raises(ValueError):
+        ScheduledJob("job", "export", ["161725"], at="15:30")
+    with pytest.raises(ValueError):
+        ScheduledJob("job", "sync", ["161725"], at="15:30", every=30)
+    with pytest.raises(ValueError):
+        ScheduledJob("job", "sync", ["161725"])
+
+
+def test_jobs_run_when_due_and_the_schedule_survives_a_restart(tmp_path, clock):
+    jobs = [ScheduledJob("close", "sync", ["161725", "110011"], at="15:30")]
+    daemon = make_daemon(tmp_path, jobs)
+
+    assert daemon.run_pending(SynchronousExecutor()) == 0
+    clock.advance(8 * 60)
+    assert daemon.run_pending(SynchronousExecutor()) == 2
+    assert daemon.runs == [("sync", "161725"), ("sync", "110011")]
+
+    with open(daemon.state_path, encoding="utf-8") as file:
+        state = json.load(file)
+    assert state["close|161725"]["succeeded"] == clock.now
+
+    restarted = make_daemon(tmp_path, jobs)
+    clock.advance(60)
+    assert restarted.run_pending(SynchronousExecutor()) == 0
+    assert restarted.status()[0]["last_success"] == "2021-03-01 16:00"
+
+
+def test_failed_jobs_are_retried_after_a_delay(tmp_path, clock):
+    jobs = [ScheduledJob("intraday", "predict", ["161725", "000000"], every=1)]
+    daemon = make_daemon(tmp_path, jobs, failing={"000000"})
+
+    daemon.run_pending(SynchronousExecutor())
+    assert daemon.state["intraday|000000"]["error"] == "000000 is not available"
+
+    clock.advance(1)
+    daemon.run_pending(SynchronousExecutor())
+    assert daemon.runs[2:] == [("predict", "161725")]
+
+    clock.now += DAEMON_RETRY_DELAY
+    daemon.run_pending(SynchronousExecutor())
+    assert daemon.runs[3:] == [("predict", "161725"), ("predict", "000000")]
+
+
+def test_running_jobs_are_not_submitted_again(tmp_path, clock):
+    class PendingExecutor:
+        def submit(self, function, *args):
+            return Future()
+
+    daemon = make_daemon(tmp_path, [ScheduledJob("intraday", "predict", ["161725"], every=1)])
+
+    assert daemon.run_pending(PendingExecutor()) == 1
+    clock.advance(5)
+    assert daemon.run_pending(PendingExecutor()) == 0
+
+
+def test_watchlist_gives_the_funds_of_jobs_and_the_analysis_parameters(tmp_path):
+    path = tmp_path / "watchlist.json"
+    path.write_text(json.dumps(dict(
+        funds=["161725", "110011"],
+        workers=3,
+        analysis=dict(date_range="d", sentiment="local"),
+        jobs=[dict(name="close", task="sync", at="15:30"),
+              dict(name="intraday", task="predict", every=60, funds=["161725"])]
+    )), encoding="utf-8")
+
+    jobs, workers, analysis_config = load_watchlist(str(path))
+
+    assert [job.funds for job in jobs] == [["161725", "110011"], ["161725"]]
+    assert workers == 3
+    assert analysis_config["date_range"] == DateRange.d
+    assert analysis_config["sentiment"] == "local"
+    assert analysis_config["verbose"] is False
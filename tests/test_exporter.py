@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import exporter
+from exporter import CsvWriter, JsonLinesWriter, ParquetWriter, export_columns, iter_funds, missing_dependency
+
+NAV = pd.DataFrame(dict(
+    fund_code=["161725", "161725", "110011"],
+    date=pd.to_datetime(["2021-03-01", "2021-03-02", "2021-03-01"]),
+    net_asset_value=[1.2, 1.25, 3.5],
+    cumulative_value=[2.2, 2.25, 4.5],
+    daily_yield=[0.5, 4.17, float("nan")]
+))
+
+
+def write_in_chunks(writer_class, path):
+    writer = writer_class(str(path), export_columns["nav"])
+    writer.write(NAV.iloc[:2])
+    writer.write(NAV.iloc[2:2])
+    writer.write(NAV.iloc[2:])
+    writer.close()
+
+
+def test_csv_round_trip(tmp_path):
+    path = tmp_path / "nav.csv"
+    write_in_chunks(CsvWriter, path)
+
+    result = pd.read_csv(path, dtype={"fund_code": str}, parse_dates=["date"])
+
+    pd.testing.assert_frame_equal(result, NAV)
+
+
+def test_json_lines_round_trip(tmp_path):
+    path = tmp_path / "nav.jsonl"
+    write_in_chunks(JsonLinesWriter, path)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    result = pd.read_json(path, lines=True, dtype={"fund_code": str}, convert_dates=["date"])
+
+    assert len(lines) == 3
+    assert json.loads(lines[0])["date"].startswith("2021-03-01")
+    pd.testing.assert_frame_equal(result, NAV, check_dtype=False)
+
+
+def test_parquet_round_trip_keeps_the_declared_types(tmp_path):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    path = tmp_path / "nav.parquet"
+    write_in_chunks(ParquetWriter, path)
+
+    table = pyarrow.parquet.read_table(str(path))
+
+    assert [(field.name, str(field.type)) for field in table.schema] == \
+        [(name, alias.replace("float64", "double")) for name, alias in export_columns["nav"]]
+    pd.testing.assert_frame_equal(table.to_pandas(), NAV, check_dtype=False)
+
+
+def test_missing_dependency_of_a_format(monkeypatch):
+    assert missing_dependency("csv") is None
+    monkeypatch.setattr(exporter.importlib.util, "find_spec", lambda name: None)
+    assert missing_dependency("parquet") == "pyarrow"
+    assert missing_dependency("jsonl") is None
+
+
+def test_funds_are_prefetched_in_order_up_to_the_number_of_workers():
+    codes = ["{:06d}".format(i) for i in range(10)]
+    funds = {code: code for code in codes}
+    started = []
+    lock = threading.Lock()
+
+    def prepare(fund):
+        with lock:
+            started.append(fund)
+        # Later funds finish first, which does not change the order they are yielded in
+        time.sleep(0.001 * (10 - int(fund)))
+        if fund == "000003":
+            raise ValueError("no data")
+        return fund + " prepared"
+
+    results = []
+    for i, (code, result) in enumerate(iter_funds(codes, funds, workers=3, prepare=prepare)):
+        time.sleep(0.01)
+        with lock:
+            assert len(started) <= i + 1 + 3
+        results.append((code, result))
+
+    assert [code for code, _ in results] == codes
+    assert isinstance(results[3][1], ValueError)
+    assert results[0][1] == "000000 prepared"
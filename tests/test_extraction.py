@@ -0,0 +1,121 @@
+import os
+
+from extraction import ExtractionEngine, ExtractionStats, extractor_names, parse_html
+from constants import EXTRACTION_MIN_CHARS
+
+ARTICLE = "<p>{}</p>".format("茅台股价上涨，" * EXTRACTION_MIN_CHARS)
+PAGE = "<html><head><title>新闻标题</title></head><body><nav><p>{}</p></nav><div>{}</div></body></html>" \
+    .format("导航" * EXTRACTION_MIN_CHARS * 2, ARTICLE)
+
+
+def make_engine(tmp_path, results):
+    """
+    An engine whose extractors return the given texts and record the documents they are given.
+    """
+    engine = ExtractionEngine(ExtractionStats(str(tmp_path / "extraction_stats.json")))
+    calls = []
+
+    def fake(name):
+        def extract(url, html, doc):
+            calls.append((name, doc))
+            return results[name]
+        return extract
+
+    engine.extractors = {name: fake(name) for name in extractor_names}
+    return engine, calls
+
+
+def test_extractors_are_tried_until_one_extracts_enough_text(tmp_path):
+    engine, calls = make_engine(tmp_path, dict(goose="", newspaper="短", density="长" * EXTRACTION_MIN_CHARS))
+
+    text, extractor = engine.extract("http://news.example.com/1", PAGE)
+
+    assert [name for name, _ in calls] == ["goose", "newspaper", "density"]
+    assert (text, extractor) == ("长" * EXTRACTION_MIN_CHARS, "density")
+
+
+def test_longest_text_is_kept_when_no_extractor_succeeds(tmp_path):
+    engine, _ = make_engine(tmp_path, dict(goose="短", newspaper="短一点", density=""))
+
+    assert engine.extract("http://news.example.com/1", PAGE) == ("短一点", "newspaper")
+
+
+def test_title_is_returned_when_nothing_is_extracted(tmp_path):
+    engine, _ = make_engine(tmp_path, dict(goose="", newspaper="", density=""))
+
+    assert engine.extract("http://news.example.com/1", PAGE) == ("新闻标题", None)
+
+
+def test_extractor_that_succeeds_on_a_domain_is_tried_first(tmp_path):
+    engine, calls = make_engine(tmp_path, dict(goose="", newspaper="", density="长" * EXTRACTION_MIN_CHARS))
+    engine.extract("http://news.example.com/1", PAGE)
+    calls.clear()
+
+    engine.extract("http://news.example.com/2", PAGE)
+
+    assert [name for name, _ in calls] == ["density"]
+    assert engine.stats.order("news.example.com")[0] == "density"
+    assert engine.stats.order("other.example.com") == extractor_names
+
+
+def test_document_is_only_copied_for_extractors_that_modify_it(tmp_path):
+    engine, calls = make_engine(tmp_path, dict(goose="", newspaper="", density=""))
+
+    engine.extract("http://news.example.com/1", PAGE)
+
+    # goose and newspaper get copies, density as the last one tried works on the parsed document itself
+    goose_doc, newspaper_doc, density_doc = [doc for _, doc in calls]
+    assert len({id(goose_doc), id(newspaper_doc), id(density_doc)}) == 3
+    assert goose_doc.getroottree() is not density_doc.getroottree()
+
+
+def test_last_extractor_tried_is_given_the_parsed_document(tmp_path):
+    engine, calls = make_engine(tmp_path, dict(goose="", newspaper="", density=""))
+    engine.stats.record("news.example.com", [("goose", False, 0), ("goose", False, 0)], False, 0)
+
+    engine.extract("http://news.example.com/1", PAGE)
+
+    assert [name for name, _ in calls] == ["newspaper", "density", "goose"]
+    # density does not modify the document, so goose can be given the same one
+    assert calls[0][1] is not calls[1][1]
+    assert calls[2][1] is calls[1][1]
+
+
+def test_density_extractor_skips_boilerplate_without_modifying_the_document():
+    doc = parse_html(PAGE)
+    before = len(list(doc.iter()))
+
+    text = ExtractionEngine.extract_density("http://news.example.com/1", PAGE, doc)
+
+    assert text.startswith("茅台股价上涨") and "导航" not in text
+    assert len(list(doc.iter())) == before
+
+
+def test_statistics_are_kept_per_domain(tmp_path):
+    path = str(tmp_path / "extraction_stats.json")
+    stats = ExtractionStats(path)
+    stats.record("a.com", [("goose", False, 0.1), ("newspaper", True, 0.2)], True, 0.4)
+    stats.record("a.com", [("newspaper", True, 0.1)], True, 0.2)
+    stats.record("b.com", [("goose", False, 0.1), ("newspaper", False, 0.1), ("density", False, 0.1)], False, 0.4)
+    stats.save()
+
+    domains = ExtractionStats(path).domains()
+
+    assert [domain["domain"] for domain in domains] == ["a.com", "b.com"]
+    assert domains[0]["articles"] == 2
+    assert domains[0]["success_rate"] == 1
+    assert domains[0]["ms_per_article"] == 300
+    assert domains[0]["preferred"] == "newspaper"
+    assert domains[0]["extractors"] == "goose 0/1, newspaper 2/2"
+    assert domains[1]["success_rate"] == 0
+
+
+def test_reset_forgets_one_domain_or_all_of_them(tmp_path):
+    stats = ExtractionStats(str(tmp_path / "extraction_stats.json"))
+    stats.record("a.com", [("density", True, 0)], True, 0)
+    stats.record("b.com", [("density", True, 0)], True, 0)
+
+    stats.reset("a.com")
+    assert [domain["domain"] for domain in stats.domains()] == ["b.com"]
+    stats.reset()
+    assert stats.domains() == []
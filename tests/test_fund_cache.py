@@ -0,0 +1,80 @@
+import time
+
+from fund_cache import FundCache
+
+
+class FakeFund:
+    def __init__(self, code, size):
+        self.code = code
+        self.size = size
+        self.historical_data_fetched = None
+        self.measured = 0
+
+    def memory_usage(self):
+        self.measured += 1
+        return self.size
+
+    def load_historical_data(self, size):
+        self.size += size
+        self.historical_data_fetched = time.time()
+
+
+def test_least_recently_used_funds_are_evicted_over_the_byte_budget():
+    cache = FundCache(max_bytes=300, ttl=3600)
+    funds = [FakeFund(code, 100) for code in ("000001", "000002", "000003")]
+    for fund in funds:
+        cache.put(fund)
+    assert cache.get("000001") is funds[0]
+
+    cache.put(FakeFund("000004", 100))
+
+    assert list(cache.funds()) == ["000003", "000001", "000004"]
+    assert cache.memory_usage() == 300
+
+
+def test_most_recently_used_fund_is_kept_even_if_it_exceeds_the_budget():
+    cache = FundCache(max_bytes=100, ttl=3600)
+    cache.put(FakeFund("000001", 50))
+    cache.put(FakeFund("000002", 500))
+
+    assert list(cache.funds()) == ["000002"]
+
+
+def test_expired_funds_are_dropped():
+    cache = FundCache(max_bytes=1000, ttl=60)
+    cache.put(FakeFund("000001", 100), created=time.time() - 61)
+    cache.put(FakeFund("000002", 100), created=time.time() - 30)
+
+    assert cache.funds().keys() == {"000002"}
+    assert cache.get("000001") is None
+    assert cache.get("000002") is not None
+    assert cache.memory_usage() == 100
+
+
+def test_fund_sizes_are_only_measured_again_when_historical_data_is_loaded():
+    cache = FundCache(max_bytes=1000, ttl=3600)
+    funds = [FakeFund(code, 100) for code in ("000001", "000002", "000003")]
+    for fund in funds:
+        cache.put(fund)
+    for _ in range(5):
+        for fund in funds:
+            cache.get(fund.code)
+    assert [fund.measured for fund in funds] == [1, 1, 1]
+
+    funds[0].load_historical_data(800)
+    cache.get("000002")
+
+    assert [fund.measured for fund in funds] == [2, 1, 1]
+    # The fund that grew is the least recently used one and pushes the cache over its budget
+    assert list(cache.funds()) == ["000003", "000002"]
+
+
+def test_putting_a_fund_again_measures_it_again():
+    cache = FundCache(max_bytes=1000, ttl=3600)
+    fund = FakeFund("000001", 100)
+    cache.put(fund)
+    fund.size = 200
+    cache.put(fund)
+
+    assert fund.measured == 2
+    assert cache.memory_usage() == 200
@@ -0,0 +1,88 @@
+import os
+import time
+
+import numpy as np
+
+from fund_index import FundIndex, NgramIndex
+
+RECORDS = [
+    ["161725", "ZSZZBJZSFJ", "招商中证白酒指数(LOF)A", "指数型-股票", "ZHAOSHANGZHONGZHENGBAIJIUZHISHU"],
+    ["110011", "YFDZXCZHH", "易方达中小盘混合", "混合型-偏股", "YIFANGDAZHONGXIAOPANHUNHE"],
+    ["005827", "YFDLCJXHH", "易方达蓝筹精选混合", "混合型-偏股", "YIFANGDALANCHOUJINGXUANHUNHE"],
+    ["012414", "ZSZZBJZSC", "招商中证白酒指数(LOF)C", "指数型-股票", "ZHAOSHANGZHONGZHENGBAIJIUZHISHU"],
+    ["000001", "HXCZHH", "华夏成长混合", "混合型-偏股", "HUAXIACHENGZHANGHUNHE"],
+]
+
+
+def make_index(tmp_path):
+    index = FundIndex(str(tmp_path / "fund_index.npz"))
+    index.build(RECORDS)
+    return index
+
+
+def codes(funds):
+    return [fund["code"] for fund in funds]
+
+
+def test_ngram_index_finds_every_string_that_contains_the_text():
+    values = np.array(["易方达中小盘混合", "易方达蓝筹精选混合", "华夏成长混合", "白酒", "酒", ""], dtype=str)
+    index = NgramIndex(values)
+
+    for text in ["混合", "易方达", "酒", "方达蓝筹精", "白", "合", "混合混合", "不存在", "达中小盘混"]:
+        expected = [i for i, value in enumerate(values) if text in value]
+        assert list(index.find(text)) == expected, text
+
+
+def test_ngram_index_checks_the_text_and_not_only_its_ngrams():
+    # Both strings hold the pairs of "ABAB" but only the second one holds the text
+    index = NgramIndex(np.array(["ABXBA", "XABABX"], dtype=str))
+
+    assert list(index.find("ABAB")) == [1]
+    assert list(index.find("")) == [0, 1]
+
+
+def test_prefix_search_of_codes_names_and_pinyin(tmp_path):
+    index = make_index(tmp_path)
+
+    assert codes(index.get(row) for row in index.prefix_search("01")) == ["012414"]
+    assert codes(index.get(row) for row in index.prefix_search("00")) == ["000001", "005827"]
+    assert codes(index.get(row) for row in index.prefix_search("易方达")) == ["110011", "005827"]
+    # Abbreviations and pinyin are matched without case
+    assert codes(index.get(row) for row in index.prefix_search("zszzbj")) == ["012414", "161725"]
+    assert codes(index.get(row) for row in index.prefix_search("yifangdazhong")) == ["110011"]
+    assert list(index.prefix_search("xyz")) == []
+
+
+def test_search_puts_prefix_matches_before_substring_matches(tmp_path):
+    index = make_index(tmp_path)
+
+    assert codes(index.search("混合")) == ["000001", "005827", "110011"]
+    assert codes(index.search("易方达")) == ["110011", "005827"]
+    assert codes(index.search("白酒")) == ["012414", "161725"]
+    assert codes(index.search("1")) == ["110011", "161725", "000001", "012414"]
+    assert codes(index.search("混合", limit=1)) == ["000001"]
+
+
+def test_index_is_loaded_back_from_the_npz_file(tmp_path):
+    built = make_index(tmp_path)
+    loaded = FundIndex(built.path, max_age=3600)
+
+    assert loaded.load()
+    for column in built.columns:
+        np.testing.assert_array_equal(loaded.columns[column], built.columns[column])
+    assert loaded.search("白酒") == built.search("白酒")
+    assert loaded.contains("005827") and not loaded.contains("005828")
+
+
+def test_stale_index_is_used_when_the_download_fails(tmp_path):
+    built = make_index(tmp_path)
+    os.utime(built.path, (time.time() - 7200, time.time() - 7200))
+    index = FundIndex(built.path, max_age=3600)
+
+    def download():
+        raise ConnectionError("offline")
+
+    index.download = download
+    assert index.load()
+    assert index.failed_at is not None
+    assert index.contains("161725")
@@ -0,0 +1,104 @@
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import google_services
+from google_services import parse_results, search
+
+
+def result(title, url):
+    return ('<div class="kCrYT"><a href="/url?q={}&amp;sa=U"><span>news</span>'
+            '<h3 class="zBAuLc"><div class="BNeawe vvjwJb">{}</div></h3></a></div>').format(url, title)
+
+
+def page(*results):
+    return "<html><body>{}</body></html>".format("".join(result(title, url) for title, url in results))
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeScheduler:
+    """
+    Serves a page of results for each start= offset, and records the requests it gets.
+    """
+    def __init__(self, pages, barrier=None):
+        self.pages = pages
+        # Requests wait for each other at the barrier, so that it breaks unless they are concurrent
+        self.barrier = barrier
+        self.lock = threading.Lock()
+        self.starts = []
+        self.throttled = []
+
+    def get(self, url, timeout=None):
+        start = int(parse_qs(urlparse(url).query).get("start", ["0"])[0])
+        with self.lock:
+            self.starts.append(start)
+        if self.barrier is not None:
+            self.barrier.wait()
+        if isinstance(self.pages[start], Exception):
+            raise self.pages[start]
+        return FakeResponse(self.pages[start])
+
+    def report_throttled(self, url):
+        self.throttled.append(url)
+
+
+def use_scheduler(monkeypatch, pages, barrier=None):
+    scheduler = FakeScheduler(pages, barrier)
+    monkeypatch.setattr(google_services, "scheduler", scheduler)
+    monkeypatch.setattr(google_services, "SEARCH_RESULTS_PER_PAGE", 2)
+    return scheduler
+
+
+def test_parse_results():
+    data = page(("茅台 &amp; 五粮液", "https://news.example.com/a%20b"), ("Image", "/images?q=1"))
+
+    assert parse_results(data) == [("茅台 & 五粮液", "https://news.example.com/a b")]
+
+
+def test_pages_are_downloaded_concurrently_and_merged_in_order(monkeypatch):
+    scheduler = use_scheduler(monkeypatch, {
+        0: page(("A", "https://a.com/1"), ("B", "https://b.com/2")),
+        2: page(("C", "https://c.com/3"), ("D", "https://d.com/4")),
+        4: page(("E", "https://e.com/5"), ("F", "https://f.com/6"))
+    }, barrier=threading.Barrier(3, timeout=5))
+
+    links = search("贵州茅台", num_results=5)
+
+    assert sorted(scheduler.starts) == [0, 2, 4]
+    assert links == [("A", "https://a.com/1"), ("B", "https://b.com/2"), ("C", "https://c.com/3"),
+                     ("D", "https://d.com/4"), ("E", "https://e.com/5")]
+    assert scheduler.throttled == []
+
+
+def test_single_page_is_downloaded_without_start(monkeypatch):
+    scheduler = use_scheduler(monkeypatch, {0: page(("A", "https://a.com/1"))})
+
+    assert search("贵州茅台", num_results=2) == [("A", "https://a.com/1")]
+    assert scheduler.starts == [0]
+
+
+def test_duplicate_urls_are_dropped(monkeypatch):
+    use_scheduler(monkeypatch, {
+        0: page(("A", "https://a.com/1"), ("B", "https://b.com/2")),
+        2: page(("B again", "https://b.com/2"), ("C", "https://c.com/3"))
+    })
+
+    assert search("贵州茅台", num_results=4) == [("A", "https://a.com/1"), ("B", "https://b.com/2"),
+                                                ("C", "https://c.com/3")]
+
+
+def test_empty_page_is_reported_as_throttled(monkeypatch):
+    scheduler = use_scheduler(monkeypatch, {0: "<html><body>unusual traffic</body></html>", 2: ""})
+
+    assert search("贵州茅台", num_results=4) == []
+    assert scheduler.throttled == ["http://www.google.com/search"]
+
+
+def test_failed_downloads_are_not_reported_as_throttled(monkeypatch):
+    scheduler = use_scheduler(monkeypatch, {0: ConnectionError("offline"), 2: ConnectionError("offline")})
+
+    assert search("贵州茅台", num_results=4) == []
+    assert scheduler.throttled == []
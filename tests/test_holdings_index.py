@@ -0,0 +1,97 @@
+import holdings_index as holdings_index_module
+from holdings_index import HoldingsIndex
+from utils import dump_json_to_file
+
+
+class FakeFund:
+    def __init__(self, code, name, stocks, date="2021-03-31"):
+        self.code = code
+        self.data = dict(name=name)
+        self.stocks = [dict(code=stock_code, name=stock_name, position_ratio=ratio)
+                       for stock_code, stock_name, ratio in stocks]
+        self.stocks_date = date
+
+
+def make_index(tmp_path):
+    index = HoldingsIndex(str(tmp_path / "holdings_index.json"))
+    index.update(FakeFund("161725", "招商中证白酒指数", [("600519", "贵州茅台", 15.2), ("000858", "五 粮 液", 14.8)]))
+    index.update(FakeFund("110011", "易方达中小盘混合", [("600519", "贵州茅台", 9.8), ("00700", "腾讯控股", 8.1)]))
+    return index
+
+
+def test_holders_are_sorted_by_position_ratio(tmp_path):
+    index = make_index(tmp_path)
+
+    holders = index.holders("600519")
+
+    assert [(holder["fund_code"], holder["position_ratio"]) for holder in holders] == \
+        [("161725", 15.2), ("110011", 9.8)]
+    assert holders[0]["name"] == "招商中证白酒指数"
+    assert holders[0]["date"] == "2021-03-31"
+    assert index.holders("601318") == []
+
+
+def test_stocks_are_found_by_code_or_name(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.find_stock_code("600519") == "600519"
+    assert index.find_stock_code("贵州茅台") == "600519"
+    # Spaces in names are ignored
+    assert index.find_stock_code("五粮液") == "000858"
+    assert index.find_stock_code("中国平安") is None
+
+
+def test_stock_is_dropped_once_no_fund_holds_it(tmp_path):
+    index = make_index(tmp_path)
+
+    index.update(FakeFund("161725", "招商中证白酒指数", [("600519", "贵州茅台", 16.0)], "2021-06-30"))
+
+    assert index.holders("000858") == []
+    assert index.find_stock_code("五粮液") is None
+    assert "五 粮 液" not in index.stock_names
+    assert [holder["position_ratio"] for holder in index.holders("600519")] == [16.0, 9.8]
+    assert index.data["funds"]["161725"]["stocks"] == ["600519"]
+
+
+def test_stock_still_held_by_another_fund_is_kept(tmp_path):
+    index = make_index(tmp_path)
+
+    index.update(FakeFund("110011", "易方达中小盘混合", [("00700", "腾讯控股", 9.0)]))
+
+    assert [holder["fund_code"] for holder in index.holders("600519")] == ["161725"]
+    assert index.find_stock_code("贵州茅台") == "600519"
+
+
+def test_index_is_saved_and_loaded_back(tmp_path):
+    index = make_index(tmp_path)
+
+    loaded = HoldingsIndex(index.path)
+
+    assert loaded.data == index.data
+    assert loaded.find_stock_code("腾讯控股") == "00700"
+
+
+def test_stocks_without_holders_saved_by_an_earlier_version_are_dropped(tmp_path):
+    path = str(tmp_path / "holdings_index.json")
+    dump_json_to_file(dict(stocks={"600519": dict()}, funds=dict(), names={"600519": "贵州茅台"}), path)
+
+    index = HoldingsIndex(path)
+
+    assert index.find_stock_code("贵州茅台") is None
+    assert index.stock_names == []
+
+
+def test_refresh_keeps_the_funds_that_could_be_fetched(monkeypatch, tmp_path):
+    index = HoldingsIndex(str(tmp_path / "holdings_index.json"))
+
+    def fund(code):
+        if code == "000000":
+            raise ConnectionError("not found")
+        return FakeFund(code, "基金" + code, [("600519", "贵州茅台", 5.0)])
+
+    monkeypatch.setattr(holdings_index_module, "Fund", fund)
+    failures = index.refresh(["161725", "000000", "110011"])
+
+    assert [code for code, _ in failures] == ["000000"]
+    assert sorted(holder["fund_code"] for holder in HoldingsIndex(index.path).holders("600519")) == \
+        ["110011", "161725"]
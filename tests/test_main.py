@@ -0,0 +1,93 @@
+import threading
+
+import pandas as pd
+
+import main
+from background import JobManager
+from main import FundAssistant
+from predictor import default_analysis_config
+
+
+class FakeFund:
+    def __init__(self, code):
+        self.code = code
+
+
+def make_shell():
+    # The services of the shell are not needed to run commands in the background
+    shell = FundAssistant.__new__(FundAssistant)
+    shell.fund_obj = FakeFund("000001")
+    shell.analysis_config = default_analysis_config()
+    shell.jobs = JobManager()
+    shell.jobs.output_captured = True
+    return shell
+
+
+def test_background_job_keeps_the_fund_and_parameters_it_was_started_with(monkeypatch):
+    started = threading.Event()
+    resume = threading.Event()
+    seen = []
+
+    def do_probe(self, arg):
+        started.set()
+        resume.wait(5)
+        seen.append((self.fund_obj.code, self.analysis_config["num_results"]))
+
+    monkeypatch.setattr(FundAssistant, "do_probe", do_probe, raising=False)
+    shell = make_shell()
+    shell.onecmd("probe &")
+    assert started.wait(5)
+
+    shell.fund_obj = FakeFund("110011")
+    shell.analysis_config["num_results"] = 20
+    resume.set()
+    job = shell.jobs.get(1)
+    assert job.wait(5)
+
+    assert job.exception is None
+    assert seen == [("000001", 10)]
+    assert shell.fund_obj.code == "110011"
+
+
+def test_commands_that_change_the_shell_are_not_run_in_the_background():
+    shell = make_shell()
+    shell.onecmd("set 110011 &")
+    shell.onecmd("param n 20 &")
+    assert shell.jobs.jobs == {}
+    assert shell.fund_obj.code == "000001"
+    assert shell.analysis_config["num_results"] == 10
+
+
+def test_backtest_horizon_is_given_with_an_option(monkeypatch):
+    calls = []
+    predictions = pd.DataFrame(dict(timestamp=[pd.Timestamp("2021-03-01")] * 2, fund_code=["110011", "161725"],
+                                    prediction=[0.1, 0.2], confidence=[1, 1]))
+    monkeypatch.setattr(main, "load_predictions", lambda: predictions)
+    monkeypatch.setattr(main, "fetch_daily_yields", lambda codes, funds: (None, []))
+    monkeypatch.setattr(main, "backtest", lambda predictions, yields, horizon: calls.append(
+        (list(predictions["fund_code"]), horizon)) or (dict(samples=0, funds=0, hit_rate=0, correlation=0,
+                                                            rank_ic=0, ic=0), None))
+    shell = make_shell()
+
+    shell.onecmd("backtest")
+    shell.onecmd("backtest -h 5")
+    # A fund code is never taken for the horizon
+    shell.onecmd("backtest 110011")
+    shell.onecmd("backtest 110011 -h 20")
+    shell.onecmd("backtest -h 0")
+    shell.onecmd("backtest 110011 20")
+
+    assert calls == [(["110011", "161725"], 1), (["110011", "161725"], 5), (["110011"], 1), (["110011"], 20)]
+
+
+def test_export_to_parquet_is_refused_without_pyarrow(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "missing_dependency", lambda file_format: "pyarrow" if file_format == "parquet" else None)
+    monkeypatch.setattr(main, "export_funds", lambda *args: calls.append(args) or (0, []))
+    monkeypatch.setattr(main, "fund_cache", type("FakeCache", (), dict(funds=lambda self: dict()))())
+    shell = make_shell()
+
+    shell.onecmd("export nav 110011 nav.parquet")
+    assert calls == []
+    shell.onecmd("export nav 110011 nav.csv")
+    assert [args[:4] for args in calls] == [("nav", ["110011"], "nav.csv", "csv")]
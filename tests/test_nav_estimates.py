@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import numpy as np
+
+from nav_estimates import NavEstimateWatcher, is_trading_time, parse_estimate
+
+REPLY = 'jsonpgz({{"fundcode":"{}","name":"招商中证白酒指数","jzrq":"2021-02-05","dwjz":"1.2345",' \
+        '"gsz":"{}","gszzl":"0.45","gztime":"2021-02-08 {}"}});'
+beijing = timezone(timedelta(hours=8))
+
+
+def test_parse_estimate():
+    estimate = parse_estimate(REPLY.format("161725", "1.2400", "14:30"))
+
+    assert estimate == dict(code="161725", name="招商中证白酒指数", nav=1.2345, nav_date="2021-02-05", estimate=1.24,
+                            change=0.45, time="2021-02-08 14:30")
+
+
+def test_parse_estimate_of_fund_without_estimate():
+    assert parse_estimate("jsonpgz();") is None
+    assert parse_estimate("") is None
+    reply = REPLY.format("161725", "1.2400", "14:30").replace('"gszzl":"0.45"', '"gszzl":""')
+    assert np.isnan(parse_estimate(reply)["change"])
+
+
+def test_trading_time_is_in_beijing_time():
+    # 2021-02-08 is a Monday
+    assert is_trading_time(datetime(2021, 2, 8, 9, 30, tzinfo=beijing))
+    assert not is_trading_time(datetime(2021, 2, 8, 9, 29, tzinfo=beijing))
+    assert not is_trading_time(datetime(2021, 2, 8, 12, 0, tzinfo=beijing))
+    assert is_trading_time(datetime(2021, 2, 8, 14, 59, tzinfo=beijing))
+    assert not is_trading_time(datetime(2021, 2, 8, 15, 0, tzinfo=beijing))
+    assert not is_trading_time(datetime(2021, 2, 6, 10, 0, tzinfo=beijing))
+    # 10:00 in Beijing is 02:00 UTC
+    assert is_trading_time(datetime(2021, 2, 8, 2, 0, tzinfo=timezone.utc))
+
+
+class StubResponse:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientError("status {}".format(self.status))
+
+    async def read(self):
+        return self.body
+
+
+class StubSession:
+    """
+    Replies with the next response of each fund and records the headers of the requests.
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None):
+        code = url.rsplit("/", 1)[-1].split(".")[0]
+        self.requests.append((code, dict(headers)))
+        return self.responses[code].pop(0)
+
+
+def test_unchanged_estimates_are_not_sent_again():
+    watcher = NavEstimateWatcher(["161725", "110011"], url="http://fundgz.example.com/js/{}.js")
+    session = StubSession({
+        "161725": [StubResponse(200, REPLY.format("161725", "1.2400", "14:30").encode("utf-8"), {"ETag": "v1"}),
+                   StubResponse(304)],
+        "110011": [StubResponse(200, REPLY.format("110011", "3.5000", "14:30").encode("utf-8"),
+                                {"Last-Modified": "Mon, 08 Feb 2021 06:30:00 GMT"}),
+                   StubResponse(200, REPLY.format("110011", "3.5100", "14:31").encode("utf-8"))]
+    })
+
+    assert sorted(asyncio.run(watcher.refresh(session))) == ["110011", "161725"]
+    assert asyncio.run(watcher.refresh(session)) == ["110011"]
+
+    second = dict(session.requests[2:])
+    assert second["161725"]["If-None-Match"] == "v1"
+    assert second["110011"]["If-Modified-Since"] == "Mon, 08 Feb 2021 06:30:00 GMT"
+    # The estimate that was not sent again is kept
+    assert watcher.estimate("161725")["estimate"] == 1.24
+    assert watcher.estimate("110011")["time"] == "2021-02-08 14:31"
+
+
+def test_failed_requests_are_recorded_and_keep_the_last_estimate():
+    watcher = NavEstimateWatcher(["161725"], url="http://fundgz.example.com/js/{}.js")
+    session = StubSession({"161725": [
+        StubResponse(200, REPLY.format("161725", "1.2400", "14:30").encode("utf-8")),
+        StubResponse(503),
+        StubResponse(200, REPLY.format("161725", "1.2400", "14:30").encode("utf-8"))
+    ]})
+
+    asyncio.run(watcher.refresh(session))
+    assert asyncio.run(watcher.refresh(session)) == []
+    assert "161725" in watcher.failures
+    assert watcher.estimate("161725")["estimate"] == 1.24
+    # The same estimate again does not count as a change
+    assert asyncio.run(watcher.refresh(session)) == []
+    assert watcher.failures == dict()
@@ -0,0 +1,113 @@
+import pytest
+
+import negative_cache as negative_cache_module
+from constants import NEGATIVE_CACHE_MAX_URL_TTL
+from negative_cache import NegativeCache
+
+HOUR = 3600
+
+
+class FakeTime:
+    def __init__(self, now=1.6e9):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(negative_cache_module, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    kwargs = dict(dict(url_ttl=HOUR, domain_ttl=100 * HOUR, max_failure_rate=0.8, min_attempts=5), **kwargs)
+    return NegativeCache(str(tmp_path / "negative_cache.json"), **kwargs)
+
+
+def test_failing_url_is_skipped_for_a_time_that_doubles(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    url = "http://a.com/1"
+
+    cache.record_failure(url, "timeout")
+    assert cache.skip_reason(url) == "failed 1 time(s) before: timeout"
+    clock.now += HOUR + 1
+    assert cache.skip_reason(url) is None
+
+    cache.record_failure(url, "timeout")
+    clock.now += HOUR + 1
+    assert cache.skip_reason(url) is not None
+    clock.now += HOUR
+    assert cache.skip_reason(url) is None
+
+
+def test_url_ttl_is_capped(tmp_path, clock):
+    cache = make_cache(tmp_path, url_ttl=10 * 24 * HOUR)
+    for _ in range(5):
+        cache.record_failure("http://a.com/1", "404")
+
+    assert cache.urls()[0]["expires"] == clock.now + NEGATIVE_CACHE_MAX_URL_TTL
+
+
+def test_success_forgets_the_failures_of_a_url(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.record_failure("http://a.com/1", "timeout")
+    cache.record_success("http://a.com/1")
+
+    assert cache.skip_reason("http://a.com/1") is None
+    cache.record_failure("http://a.com/1", "timeout")
+    assert cache.urls()[0]["expires"] == clock.now + HOUR
+
+
+def test_domain_that_fails_too_often_is_skipped(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    for i in range(4):
+        cache.record_failure("http://bad.com/{}".format(i), "403")
+    # Too few attempts to judge the domain
+    assert cache.skip_reason("http://bad.com/new") is None
+    cache.record_success("http://bad.com/4")
+    assert cache.skip_reason("http://bad.com/new") == "80% of 5 attempts on bad.com failed"
+    assert cache.skip_reason("http://good.com/1") is None
+
+    # The statistics of a domain are forgotten once they are older than domain_ttl
+    clock.now += 101 * HOUR
+    assert cache.skip_reason("http://bad.com/new") is None
+
+
+def test_results_from_reliable_domains_come_first(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.record_failure("http://bad.com/1", "403")
+    cache.record_success("http://mixed.com/1")
+    cache.record_failure("http://mixed.com/2", "403")
+    cache.record_success("http://good.com/1")
+    results = [("bad", "http://bad.com/2"), ("new", "http://new.com/1"), ("mixed", "http://mixed.com/3"),
+               ("good", "http://good.com/2")]
+
+    assert [title for title, _ in cache.order(results)] == ["new", "good", "mixed", "bad"]
+    assert [domain["domain"] for domain in cache.domains()] == ["bad.com", "mixed.com", "good.com"]
+
+
+def test_reset_forgets_a_domain_or_everything(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.record_failure("http://a.com/1", "timeout")
+    cache.record_failure("http://b.com/1", "timeout")
+
+    cache.reset("a.com")
+    assert [entry["url"] for entry in cache.urls()] == ["http://b.com/1"]
+    assert [domain["domain"] for domain in cache.domains()] == ["b.com"]
+    assert make_cache(tmp_path).data == cache.data
+
+    cache.reset()
+    assert cache.urls() == [] and cache.domains() == []
+
+
+def test_expired_urls_are_dropped_when_saved(tmp_path, clock):
+    cache = make_cache(tmp_path, domain_ttl=2 * HOUR)
+    cache.record_failure("http://a.com/1", "timeout")
+    clock.now += 4 * HOUR
+    cache.record_failure("http://a.com/2", "timeout")
+    cache.save()
+
+    assert list(make_cache(tmp_path).data["urls"]) == ["http://a.com/2"]
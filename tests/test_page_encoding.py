@@ -0,0 +1,90 @@
+import codecs
+
+import page_encoding
+from page_encoding import EncodingDetector, normalize_encoding
+
+ARTICLE = "<p>贵州茅台股价创新高，白酒板块全线上涨。</p>" * 20
+
+
+def page(encoding, meta=None, padding=0):
+    head = '<meta charset="{}">'.format(meta) if meta is not None else ""
+    return "<html><head>{}{}</head><body>{}</body></html>".format(" " * padding, head, ARTICLE).encode(encoding)
+
+
+def test_byte_order_mark_comes_first():
+    detector = EncodingDetector()
+    content = codecs.BOM_UTF8 + page("utf-8", meta="gbk")
+
+    assert detector.detect(content, "text/html; charset=gbk") == ("utf-8-sig", "bom")
+    assert detector.detect(codecs.BOM_UTF16_LE + "测试".encode("utf-16-le"))[1] == "bom"
+    assert detector.decode(content).startswith("<html>")
+
+
+def test_charset_of_the_header():
+    detector = EncodingDetector()
+
+    assert detector.detect(page("gbk", meta="utf-8"), "text/html; charset=GBK") == ("gb18030", "header")
+    assert detector.decode(page("gbk"), 'text/html; charset="gb2312"').endswith("</html>")
+
+
+def test_meta_charset_is_preferred_over_a_default_header_charset():
+    detector = EncodingDetector()
+    content = page("gbk", meta="gbk")
+
+    assert detector.detect(content, "text/html; charset=ISO-8859-1") == ("gb18030", "meta")
+    # Without a <meta> charset the default charset of the header is used
+    assert detector.detect(b"<html>caf\xe9</html>", "text/html; charset=ISO-8859-1") == ("iso8859-1", "header")
+    assert ARTICLE in detector.decode(content, "text/html; charset=ISO-8859-1")
+
+
+def test_meta_charset_is_only_looked_for_at_the_start_of_the_page():
+    detector = EncodingDetector(sniff_bytes=4096)
+
+    assert detector.detect(page("utf-8", meta="utf-8", padding=100))[1] == "meta"
+    assert detector.detect(page("utf-8", meta="utf-8", padding=5000))[1] != "meta"
+
+
+def test_unknown_charsets_are_ignored():
+    detector = EncodingDetector()
+
+    assert detector.detect(page("utf-8", meta="utf-8"), "text/html; charset=x-unknown") == ("utf-8", "meta")
+    assert normalize_encoding("x-unknown") is None
+    assert normalize_encoding(b"GB2312") == "gb18030"
+
+
+def test_detected_encoding_is_remembered_for_the_domain(monkeypatch):
+    detector = EncodingDetector()
+    calls = []
+
+    def detect(sample):
+        calls.append(len(sample))
+        return dict(encoding="GB2312")
+
+    monkeypatch.setattr(page_encoding.chardet, "detect", detect)
+    content = page("gbk")
+
+    assert detector.detect(content, "text/html", "http://News.Example.com/1") == ("gb18030", "detected")
+    assert detector.detect(content, None, "http://news.example.com/2") == ("gb18030", "domain")
+    assert detector.detect(content, None, "http://other.example.com/1") == ("gb18030", "detected")
+    assert len(calls) == 2
+    assert detector.statistics == dict(detected=2, domain=1)
+    assert ARTICLE in detector.decode(content, None, "http://news.example.com/3")
+
+
+def test_chardet_runs_on_a_sample_of_the_page(monkeypatch):
+    detector = EncodingDetector(sample_bytes=100)
+    samples = []
+    monkeypatch.setattr(page_encoding.chardet, "detect", lambda sample: samples.append(sample) or dict(encoding=None))
+
+    # chardet finding nothing falls back to utf-8
+    assert detector.detect(page("utf-8")) == ("utf-8", "detected")
+    assert len(samples[0]) == 100
+
+
+def test_chardet_detects_pages_without_any_charset():
+    detector = EncodingDetector()
+
+    encoding, source = detector.detect(page("gbk"))
+
+    assert source == "detected"
+    assert page("gbk").decode(encoding) == page("utf-8").decode("utf-8")
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio import holdings_matrix, holdings_overlap, pairwise_table, return_correlation
+
+
+def stocks(*positions):
+    return [dict(code=code, name=code, position_ratio=ratio) for code, ratio in positions]
+
+
+def test_holdings_overlap_sums_the_smaller_weights_of_the_shared_stocks():
+    codes = ["A", "B", "C"]
+    matrix, stock_codes = holdings_matrix(codes, dict(
+        A=stocks(("600519", 10), ("000858", 8), ("00700", 5)),
+        B=stocks(("600519", 4), ("000858", 12)),
+        C=stocks(("601318", 7))
+    ))
+
+    overlap = holdings_overlap(matrix).toarray()
+
+    assert stock_codes == ["000858", "00700", "600519", "601318"]
+    assert overlap[0, 1] == pytest.approx(0.04 + 0.08)
+    assert overlap[1, 0] == overlap[0, 1]
+    assert overlap[0, 0] == pytest.approx(0.23)
+    assert overlap[0, 2] == 0 and overlap[1, 2] == 0
+    assert overlap[2, 2] == pytest.approx(0.07)
+
+
+def test_funds_without_positions_have_no_overlap():
+    matrix, _ = holdings_matrix(["A", "B"], dict(A=stocks(("600519", 10))))
+
+    overlap = holdings_overlap(matrix).toarray()
+
+    assert overlap.shape == (2, 2)
+    assert overlap[1].tolist() == [0, 0]
+
+
+def test_return_correlation_uses_the_dates_both_funds_have_data_on():
+    rng = np.random.default_rng(0)
+    returns = pd.DataFrame(rng.normal(size=(60, 3)), columns=["A", "B", "C"])
+    returns["B"] = returns["A"] * 0.5 + rng.normal(size=60) * 0.1
+    returns.loc[rng.choice(60, 15, replace=False), "A"] = np.nan
+    returns.loc[rng.choice(60, 20, replace=False), "B"] = np.nan
+    returns.loc[:44, "C"] = np.nan
+
+    correlation = return_correlation(returns, min_periods=10)
+
+    expected = returns.corr(min_periods=10).to_numpy()
+    np.testing.assert_allclose(correlation, expected)
+    assert correlation[0, 1] > 0.9
+
+
+def test_return_correlation_needs_enough_common_dates():
+    returns = pd.DataFrame(dict(A=[1.0, 2, 3, 4, np.nan, np.nan], B=[np.nan, np.nan, 1.0, 3, 2, 5]))
+
+    correlation = return_correlation(returns, min_periods=3)
+
+    assert np.isnan(correlation[0, 1])
+    assert correlation[0, 0] == pytest.approx(1)
+    assert return_correlation(returns, min_periods=2)[0, 1] == pytest.approx(1)
+
+
+def test_pairwise_table_has_one_row_per_pair():
+    matrix, _ = holdings_matrix(["A", "B", "C"], dict(A=stocks(("1", 10)), B=stocks(("1", 5)), C=stocks(("2", 5))))
+    correlation = np.array([[1, 0.5, 0.1], [0.5, 1, -0.2], [0.1, -0.2, 1]])
+
+    table = pairwise_table(["A", "B", "C"], ["a", "b", "c"], holdings_overlap(matrix), correlation)
+
+    assert list(zip(table["fund_a"], table["fund_b"])) == [("A", "B"), ("A", "C"), ("B", "C")]
+    assert table["holdings_overlap"].tolist() == pytest.approx([0.05, 0, 0])
+    assert table["return_correlation"].tolist() == [0.5, 0.1, -0.2]
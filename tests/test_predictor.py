@@ -0,0 +1,121 @@
+import predictor
+from negative_cache import NegativeCache
+from prediction_cache import PredictionCache
+from predictor import Predictor, default_analysis_config
+from text_extractor import Download
+
+STOCK = dict(code="600519", name="贵州茅台", position_ratio=10)
+
+
+class FakeGoogleService:
+    def __init__(self, results):
+        self.results = results
+
+    def google_search(self, query, num_results, date_range, timeout=None):
+        return self.results
+
+
+class FakeTextExtractor:
+    def __init__(self):
+        self.fetched = []
+
+    def extract_article(self, url, timeout, deadline):
+        self.fetched.append(url)
+        return ["{} 的正文".format(url)], Download("", 0, None, None)
+
+
+class DropUrlFilter:
+    """
+    Keeps every article except the one whose text mentions the given url.
+    """
+    def __init__(self, url):
+        self.url = url
+
+    def filter_articles(self, articles, stock_name, stock_code=None):
+        return [(i, lines) for i, lines in enumerate(articles) if not any(self.url in line for line in lines)]
+
+
+class FakeSentimentProvider:
+    max_chunk_size = 10 ** 6
+
+    def analyze_texts(self, texts, timeout):
+        return [((0.5, 1.0), None) for _ in texts]
+
+
+def make_predictor(monkeypatch, tmp_path, results, irrelevant_url):
+    monkeypatch.setattr(predictor, "prediction_cache", PredictionCache(str(tmp_path / "prediction_cache.json")))
+    monkeypatch.setattr(predictor, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    config = default_analysis_config()
+    config["num_results"] = len(results)
+    config["sentiment"] = "fake"
+    extractor = FakeTextExtractor()
+    return Predictor(config, FakeGoogleService(results), extractor, DropUrlFilter(irrelevant_url),
+                     dict(fake=FakeSentimentProvider()), interactive=False), extractor
+
+
+def test_coverage_leaves_out_irrelevant_articles(monkeypatch, tmp_path):
+    results = [("title a", "http://a.com/1"), ("title b", "http://b.com/2"), ("title c", "http://c.com/3")]
+    stock_predictor, _ = make_predictor(monkeypatch, tmp_path, results, "http://c.com/3")
+
+    score, coverage = stock_predictor.analyze_stock(STOCK, quiet=True)
+
+    assert score == 0.5
+    assert coverage == 2 / 3
+    entry = predictor.prediction_cache.get(STOCK["code"], "3|w|True|fake")
+    assert entry["urls"] == ["http://a.com/1", "http://b.com/2", "http://c.com/3"]
+    assert sorted(url for chunk in entry["chunks"] for url in chunk["urls"]) == ["http://a.com/1", "http://b.com/2"]
+
+
+def test_irrelevant_articles_are_not_fetched_again(monkeypatch, tmp_path):
+    results = [("title a", "http://a.com/1"), ("title c", "http://c.com/3")]
+    stock_predictor, extractor = make_predictor(monkeypatch, tmp_path, results, "http://c.com/3")
+    stock_predictor.analyze_stock(STOCK, quiet=True)
+    assert sorted(extractor.fetched) == ["http://a.com/1", "http://c.com/3"]
+
+    stock_predictor.google_service.results = results + [("title d", "http://d.com/4")]
+    stock_predictor.analysis_config["num_results"] = 2
+    extractor.fetched.clear()
+    score, coverage = stock_predictor.analyze_stock(STOCK, quiet=True)
+
+    assert extractor.fetched == ["http://d.com/4"]
+    assert coverage == 1
+
+
+def test_unchanged_search_results_reuse_the_previous_score(monkeypatch, tmp_path):
+    results = [("title a", "http://a.com/1"), ("title b", "http://b.com/2")]
+    stock_predictor, extractor = make_predictor(monkeypatch, tmp_path, results, "http://none")
+    first = stock_predictor.analyze_stock(STOCK, quiet=True)
+    extractor.fetched.clear()
+
+    assert stock_predictor.analyze_stock(STOCK, quiet=True) == first
+    assert extractor.fetched == []
+
+
+def test_only_new_search_results_are_fetched(monkeypatch, tmp_path):
+    results = [("title a", "http://a.com/1"), ("title b", "http://b.com/2")]
+    stock_predictor, extractor = make_predictor(monkeypatch, tmp_path, results, "http://none")
+    stock_predictor.analyze_stock(STOCK, quiet=True)
+    extractor.fetched.clear()
+
+    stock_predictor.google_service.results = [results[1], ("title c", "http://c.com/3")]
+    score, coverage = stock_predictor.analyze_stock(STOCK, quiet=True)
+
+    assert extractor.fetched == ["http://c.com/3"]
+    assert coverage == 1
+    entry = predictor.prediction_cache.get(STOCK["code"], "2|w|True|fake")
+    # The chunk with the article that dropped out of the search results is kept, since it also holds a current one
+    assert entry["urls"] == ["http://b.com/2", "http://c.com/3"]
+
+
+def test_cache_files_are_only_created_when_saved(tmp_path):
+    path = str(tmp_path / "prediction_cache.json")
+    cache = PredictionCache(path)
+    negative = NegativeCache(str(tmp_path / "negative_cache.json"))
+    assert list(tmp_path.iterdir()) == []
+
+    cache.update("600519", dict(params="p", fingerprint=None, urls=[], chunks=[], score=0, coverage=0))
+    negative.record_failure("http://a.com/1", "timeout")
+    negative.save()
+
+    assert PredictionCache(path).get("600519", "p")["score"] == 0
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["negative_cache.json", "prediction_cache.json"]
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+from constants import RATE_LIMIT_BACKOFF, RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_RECOVERY_STEPS
+from rate_limiter import HostLimiter, RequestScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_refills_at_its_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+    assert [bucket.try_take(clock()) for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_take(clock()) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert bucket.try_take(clock()) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert bucket.try_take(clock()) == 0
+
+
+def test_bucket_does_not_fill_beyond_its_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=2, clock=clock)
+    clock.now += 60
+
+    assert [bucket.try_take(clock()) for _ in range(2)] == [0, 0]
+    assert bucket.try_take(clock()) > 0
+
+
+def test_throttling_halves_the_limits_and_pauses_the_host():
+    clock = FakeClock()
+    limiter = HostLimiter("news.example.com", rate=8, burst=4, max_concurrency=8, clock=clock)
+
+    assert limiter.on_throttled() == RATE_LIMIT_BACKOFF
+    assert (limiter.bucket.rate, limiter.concurrency, limiter.bucket.tokens) == (4, 4, 0)
+    assert limiter.paused_until == clock.now + RATE_LIMIT_BACKOFF
+
+    # Each throttle in a row doubles the backoff, and the rate does not drop below a sixteenth
+    backoffs = [limiter.on_throttled() for _ in range(8)]
+    assert backoffs[:3] == [RATE_LIMIT_BACKOFF * 2, RATE_LIMIT_BACKOFF * 4, RATE_LIMIT_BACKOFF * 8]
+    assert backoffs[-1] == RATE_LIMIT_MAX_BACKOFF
+    assert limiter.bucket.rate == 0.5
+    assert limiter.concurrency == 1
+
+
+def test_limits_recover_additively_after_successes():
+    clock = FakeClock()
+    limiter = HostLimiter("news.example.com", rate=10, burst=4, max_concurrency=4, clock=clock)
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert (limiter.bucket.rate, limiter.concurrency) == (2.5, 1)
+
+    for _ in range(RATE_LIMIT_RECOVERY_STEPS - 1):
+        limiter.on_success()
+    # The rate grows by a tenth of the maximum rate with every success
+    assert limiter.bucket.rate == pytest.approx(2.5 + (RATE_LIMIT_RECOVERY_STEPS - 1))
+    assert limiter.concurrency == 1
+    limiter.on_success()
+    assert limiter.concurrency == 2
+
+    for _ in range(10 * RATE_LIMIT_RECOVERY_STEPS):
+        limiter.on_success()
+    assert (limiter.bucket.rate, limiter.concurrency) == (10, 4)
+    # A success resets the backoff
+    assert limiter.on_throttled() == RATE_LIMIT_BACKOFF
+
+
+def test_acquire_takes_tokens_and_counts_active_requests():
+    clock = FakeClock()
+    limiter = HostLimiter("news.example.com", rate=1, burst=2, max_concurrency=2, clock=clock)
+
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.active == 2
+    assert limiter.bucket.tokens == 0
+    limiter.release()
+    assert limiter.active == 1
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, status_codes):
+        self.status_codes = list(status_codes)
+
+    def request(self, method, url, **kwargs):
+        return FakeResponse(self.status_codes.pop(0))
+
+
+def make_scheduler(status_codes):
+    scheduler = RequestScheduler(dict(), (1000, 1000, 2))
+    scheduler.session = FakeSession(status_codes)
+    return scheduler
+
+
+def test_throttled_request_is_retried_after_the_backoff(monkeypatch):
+    scheduler = make_scheduler([429, 200])
+    limiter = HostLimiter("news.example.com", rate=1000, burst=1000, max_concurrency=2, clock=FakeClock())
+    scheduler.limiters["news.example.com"] = limiter
+    waits = []
+
+    def wait(timeout=None):
+        # Waiting moves the fake clock to the end of the pause instead of sleeping
+        waits.append(timeout)
+        limiter.clock.now += timeout
+
+    monkeypatch.setattr(limiter.condition, "wait", wait)
+    response = scheduler.get("http://news.example.com/1")
+
+    assert response.status_code == 200
+    assert waits == [RATE_LIMIT_BACKOFF]
+    assert limiter.active == 0
+
+
+def test_streamed_response_keeps_its_slot_until_it_is_closed():
+    scheduler = make_scheduler([200, 200])
+    limiter = scheduler.limiter("http://news.example.com/1")
+
+    response = scheduler.get("http://news.example.com/1", stream=True)
+    assert limiter.active == 1
+    response.close()
+    response.close()
+    assert limiter.active == 0
+    assert response.closed
+
+
+def test_concurrency_limit_blocks_until_a_slot_is_released():
+    limiter = HostLimiter("news.example.com", rate=1000, burst=1000, max_concurrency=1)
+    limiter.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    thread.start()
+
+    assert not acquired.wait(0.05)
+    limiter.release()
+    assert acquired.wait(5)
+    thread.join()
@@ -0,0 +1,48 @@
+from relevance import RelevanceFilter
+
+relevant_article = [
+    "贵州茅台股价创新高",
+    "贵州茅台今日股价大涨，市值突破两万亿。",
+    "今天天气晴朗，适合出游。",
+    "机构认为贵州茅台业绩稳健。"
+]
+unnamed_article = [
+    "白酒板块走势分析",
+    "白酒板块今日上涨，资金持续流入，多只个股涨停。"
+]
+no_finance_article = [
+    "贵州茅台镇旅游攻略",
+    "贵州茅台镇风景优美，适合周末出游。"
+]
+
+
+def test_drops_articles_without_the_stock_or_finance_terms():
+    filtered = RelevanceFilter().filter_articles([relevant_article, unnamed_article, no_finance_article], "贵州茅台")
+    assert [i for i, _ in filtered] == [0]
+
+
+def test_trims_paragraphs_without_the_stock_or_finance_terms():
+    (_, lines), = RelevanceFilter().filter_articles([relevant_article], "贵州茅台")
+    assert lines == [relevant_article[0], relevant_article[1], relevant_article[3]]
+
+
+def test_keeps_the_title_even_if_it_scores_nothing():
+    article = ["今日要闻", "贵州茅台股价上涨，成交活跃。"]
+    assert RelevanceFilter().filter_articles([article], "贵州茅台") == [(0, article)]
+
+
+def test_matches_names_padded_with_spaces_and_codes():
+    article = ["新闻", "600519今日股价上涨，成交放量。"]
+    assert set(RelevanceFilter.get_keywords("五 粮 液")) == {"五 粮 液", "五粮液"}
+    assert RelevanceFilter().filter_articles([article], "贵州茅台", "600519") == [(0, article)]
+
+
+def test_min_finance_hits():
+    article = ["贵州茅台", "贵州茅台股价"]
+    assert RelevanceFilter(min_finance_hits=1).filter_articles([article], "贵州茅台") == [(0, article)]
+    assert RelevanceFilter(min_finance_hits=2).filter_articles([article], "贵州茅台") == []
+
+
+def test_no_articles():
+    assert RelevanceFilter().filter_articles([], "贵州茅台") == []
+    assert RelevanceFilter().filter_articles([[]], "贵州茅台") == []
@@ -0,0 +1,66 @@
+import pytest
+
+from sentiment import SMOOTHING, LexiconSentimentProvider, create_sentiment_providers
+
+
+class FakeGoogleService:
+    class client:
+        key = None
+
+
+def counts_of(provider, text):
+    counts = provider.count_terms([text])[0]
+    return {term: int(count) for term, count in zip(provider.terms, counts) if count > 0}
+
+
+def test_terms_inside_longer_terms_are_not_counted_again():
+    provider = LexiconSentimentProvider()
+
+    assert counts_of(provider, "股价创新高") == {"创新高": 1}
+    assert counts_of(provider, "业绩不及预期，股价创新高后回落，再创新高") == {"不及预期": 1, "创新高": 2, "回落": 1}
+    assert counts_of(provider, "营收增长，净利润同比增长") == {"增长": 1, "同比增长": 1}
+
+
+def test_overlapping_longer_terms_do_not_make_counts_negative():
+    provider = LexiconSentimentProvider()
+
+    # 同比增长 and 增长强劲 share the same 增长
+    assert counts_of(provider, "同比增长强劲") == {"同比增长": 1, "增长强劲": 1}
+
+
+def test_counts_of_a_custom_lexicon():
+    provider = LexiconSentimentProvider({"涨": 1, "大涨": 2, "大涨停": 2}, {"跌": 1})
+
+    assert counts_of(provider, "大涨停，大涨，涨，跌") == {"大涨停": 1, "大涨": 1, "涨": 1, "跌": 1}
+
+
+def test_scores_are_weighed_by_polarity_and_smoothed():
+    provider = LexiconSentimentProvider()
+
+    (positive, _), (negative, _), (neutral, _), (mixed, _) = provider.analyze_texts(
+        ["贵州茅台大涨，机构看好", "贵州茅台暴跌，遭到减持", "贵州茅台发布公告", "股价上涨后回落"])
+
+    assert positive[0] == pytest.approx(3 / (3 + SMOOTHING)) and positive[1] == 3
+    assert negative[0] == pytest.approx(-4 / (4 + SMOOTHING)) and negative[1] == 4
+    assert neutral == (0, 0)
+    assert mixed == (0, 2)
+
+
+def test_no_texts_give_no_scores():
+    assert LexiconSentimentProvider().analyze_texts([]) == []
+
+
+def test_providers_are_created_by_name():
+    providers = create_sentiment_providers(FakeGoogleService())
+
+    assert sorted(providers) == ["google", "local"]
+    assert not providers["google"].available
+    assert providers["local"].available
+    assert create_sentiment_providers(FakeGoogleService(), "local")["local"].name == "local"
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError) as info:
+        create_sentiment_providers(FakeGoogleService(), "bert")
+
+    assert "bert" in str(info.value)
@@ -0,0 +1,124 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from fund import Fund
+from main import FundAssistant
+from predictor import DateRange, default_analysis_config
+from session import SessionSnapshot
+
+FUND_HTML = 'var fS_name = "招商中证白酒指数";var stockCodes=["6005191"];var syl_1n="10.5";var syl_6y="5.2";' \
+            'var syl_3y="2.1";var syl_1y="-1.3";'
+MAX_AGES = dict(pages=3600, historical_data=600, prediction=1800)
+
+
+def make_fund(code="161725", historical_data=True):
+    data = pd.DataFrame(dict(
+        date=pd.to_datetime(["2021-03-01", "2021-03-02"]),
+        net_asset_value=[1.2, 1.25],
+        cumulative_value=[2.2, 2.25],
+        daily_yield=[0.5, 4.17]
+    )) if historical_data else None
+    fund = Fund(code, FUND_HTML, "<table></table>".encode("utf-8"), data)
+    fund.overall_prediction = 0.123
+    fund.overall_confidence = 0.8
+    fund.prediction_contribution = {"600519": dict(name="贵州茅台", weighted_score=1.23)}
+    fund.predicted = time.time()
+    return fund
+
+
+def save(path, funds, current="161725", config=None):
+    snapshot = SessionSnapshot(path, MAX_AGES)
+    snapshot.save(funds, current, config or dict(num_results=5, date_range="d"))
+    snapshot.close()
+
+
+def test_funds_are_restored_from_the_snapshot(tmp_path):
+    path = str(tmp_path / "session.npz")
+    fund = make_fund()
+    save(path, [fund, make_fund("110011", historical_data=False)])
+
+    snapshot = SessionSnapshot(path, MAX_AGES)
+    restored = snapshot.restore_fund("161725")
+
+    assert snapshot.meta["current"] == "161725"
+    assert snapshot.meta["analysis_config"] == dict(num_results=5, date_range="d")
+    assert sorted(snapshot.fund_codes()) == ["110011", "161725"]
+    assert restored.data["name"] == "招商中证白酒指数"
+    assert restored.stock_html == fund.stock_html
+    assert restored.fetched == fund.fetched
+    pd.testing.assert_frame_equal(restored.historical_data, fund.historical_data, check_dtype=False)
+    assert restored.overall_prediction == 0.123
+    assert restored.prediction_contribution == fund.prediction_contribution
+    assert not snapshot.restore_fund("110011").historical_data_loaded
+    assert snapshot.restore_fund("000001") is None
+
+
+def test_resources_older_than_their_maximum_age_are_left_out(tmp_path):
+    path = str(tmp_path / "session.npz")
+    stale = make_fund()
+    stale.historical_data_fetched -= 700
+    stale.predicted -= 2000
+    expired = make_fund("110011")
+    expired.fetched -= 4000
+    save(path, [stale, expired])
+
+    snapshot = SessionSnapshot(path, MAX_AGES)
+    restored = snapshot.restore_fund("161725")
+
+    assert not restored.historical_data_loaded
+    assert restored.overall_prediction is None
+    assert snapshot.fund_codes() == ["161725"]
+    assert snapshot.restore_fund("110011") is None
+
+
+def test_funds_that_were_not_restored_are_kept_while_fresh(tmp_path):
+    path = str(tmp_path / "session.npz")
+    save(path, [make_fund(), make_fund("110011")])
+
+    snapshot = SessionSnapshot(path, MAX_AGES)
+    snapshot.save([snapshot.restore_fund("161725")], "161725", dict())
+    snapshot.close()
+
+    kept = SessionSnapshot(path, MAX_AGES).restore_fund("110011")
+    assert kept.historical_data_loaded
+    assert kept.overall_confidence == 0.8
+
+
+def test_corrupt_snapshot_gives_an_empty_session(tmp_path):
+    path = tmp_path / "session.npz"
+    path.write_bytes(b"not a snapshot")
+
+    snapshot = SessionSnapshot(str(path), MAX_AGES)
+
+    assert snapshot.meta == dict(funds=dict())
+    assert snapshot.restore_fund("161725") is None
+    snapshot.save([make_fund()], "161725", dict())
+    assert SessionSnapshot(str(path), MAX_AGES).fund_codes() == ["161725"]
+
+
+def test_snapshot_missing_the_arrays_of_a_fund_is_not_restored(tmp_path):
+    path = str(tmp_path / "session.npz")
+    save(path, [make_fund()])
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files if key != "161725.fund_data_html"}
+    np.savez(path, **arrays)
+
+    assert SessionSnapshot(path, MAX_AGES).restore_fund("161725") is None
+
+
+def test_shell_starts_with_an_empty_session_if_the_snapshot_cannot_be_restored(tmp_path):
+    path = str(tmp_path / "session.npz")
+    # A date range that no longer exists, as saved by another version
+    save(path, [make_fund()], config=dict(num_results=5, date_range="z"))
+    shell = FundAssistant.__new__(FundAssistant)
+    shell.fund_obj = None
+    shell.analysis_config = default_analysis_config()
+    shell.session = SessionSnapshot(path, MAX_AGES)
+
+    shell._restore_session()
+
+    assert shell.fund_obj is None
+    assert shell.analysis_config["date_range"] == DateRange.w
+    assert shell.session.meta == dict(funds=dict())
@@ -0,0 +1,118 @@
+import pytest
+
+import text_extractor
+from text_extractor import DownloadRejected, HTMLTextExtractor
+
+
+class FakeRaw:
+    def __init__(self, response):
+        self.response = response
+
+    def tell(self):
+        return self.response.sent
+
+    @property
+    def closed(self):
+        return self.response.sent == len(self.response.body)
+
+
+class FakeResponse:
+    """
+    A streamed response that records how much of its body has been read.
+    """
+    def __init__(self, body, headers, url="http://news.example.com/1"):
+        self.body = body
+        self.headers = headers
+        self.url = url
+        self.sent = 0
+        self.chunks_read = 0
+        self.closed = False
+        self.raw = FakeRaw(self)
+
+    def iter_content(self, chunk_size):
+        while self.sent < len(self.body):
+            chunk = self.body[self.sent:self.sent + chunk_size]
+            self.sent += len(chunk)
+            self.chunks_read += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeScheduler:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def download(monkeypatch, response, **kwargs):
+    monkeypatch.setattr(text_extractor, "scheduler", FakeScheduler(response))
+    monkeypatch.setattr(text_extractor, "DOWNLOAD_CHUNK_SIZE", 1024)
+    return HTMLTextExtractor.download(response.url, **kwargs)
+
+
+def page(article_text, tail_size):
+    return ("<html><head><meta charset=\"utf-8\"></head><body><article><p>{}</p></article>{}</body></html>"
+            .format(article_text, "<p>comment</p>" * tail_size)).encode("utf-8")
+
+
+def test_response_that_is_not_a_web_page_is_rejected_from_its_headers(monkeypatch):
+    response = FakeResponse(b"%PDF" * 1000, {"Content-Type": "application/pdf", "Content-Length": "4000"})
+
+    with pytest.raises(DownloadRejected) as info:
+        download(monkeypatch, response)
+
+    assert info.value.content_type == "application/pdf"
+    assert info.value.bytes_saved == 4000
+    assert response.chunks_read == 0
+    assert response.closed
+
+
+def test_download_stops_at_the_byte_cap(monkeypatch):
+    body = page("新闻" * 100, 1000)
+    response = FakeResponse(body, {"Content-Type": "text/html", "Content-Length": str(len(body))})
+
+    result = download(monkeypatch, response, max_bytes=4096)
+
+    assert result.aborted == "size cap"
+    assert response.chunks_read == 4
+    assert result.received == 4096
+    assert result.bytes_saved == len(body) - 4096
+    assert response.closed
+
+
+def test_download_stops_at_the_end_of_the_article(monkeypatch):
+    body = page("新闻" * 1000, 2000)
+    response = FakeResponse(body, {"Content-Type": "text/html; charset=utf-8"})
+
+    result = download(monkeypatch, response)
+
+    assert result.aborted == "end of article"
+    assert "新闻" * 1000 in result.html
+    # Nothing is read past the chunk with the end of the article
+    assert response.chunks_read == body.index(b"</article>") // 1024 + 1
+    # Without a Content-Length the bytes that were saved are not known
+    assert result.bytes_saved == 0
+
+
+def test_short_article_does_not_stop_the_download(monkeypatch):
+    body = page("新闻", 200)
+    response = FakeResponse(body, {"Content-Type": "text/html"})
+
+    result = download(monkeypatch, response)
+
+    assert result.aborted is None
+    assert response.sent == len(body)
+
+
+def test_stopping_in_the_last_chunk_does_not_count_as_aborted(monkeypatch):
+    body = page("新闻" * 1000, 0)
+    response = FakeResponse(body, {"Content-Type": "text/html"})
+
+    result = download(monkeypatch, response)
+
+    assert result.aborted is None
+    assert response.chunks_read == -(-len(body) // 1024)
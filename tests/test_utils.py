@@ -0,0 +1,63 @@
+import pytest
+
+from utils import aggregate_sentiments, split_into_chunks, weighted_coverage
+
+
+def test_texts_are_packed_into_chunks_without_exceeding_the_size():
+    texts = ["a" * 40, "b" * 30, "c" * 30, "d" * 90, "e" * 5]
+
+    chunks = split_into_chunks(texts, max_size=100)
+
+    assert [(len(chunk), indices) for chunk, indices in chunks] == [(100, [0, 1, 2]), (95, [3, 4])]
+    assert "".join(chunk for chunk, _ in chunks) == "".join(texts)
+
+
+def test_oversized_text_is_split_on_sentence_boundaries():
+    sentences = ["贵州茅台股价创新高。", "白酒板块全线上涨！", "机构是否继续看好？", "后市仍需观察\n"]
+    texts = ["短文。", "".join(sentences) * 2]
+
+    chunks = split_into_chunks(texts, max_size=20)
+
+    assert all(len(chunk) <= 20 for chunk, _ in chunks)
+    assert "".join(chunk for chunk, _ in chunks) == "".join(texts)
+    # Every chunk after the first one starts at the beginning of a sentence
+    assert all(any(chunk.startswith(sentence) for sentence in sentences) for chunk, _ in chunks[1:])
+    assert chunks[0][1] == [0, 1]
+    assert all(indices == [1] for _, indices in chunks[1:])
+
+
+def test_sentence_longer_than_a_chunk_is_cut():
+    chunks = split_into_chunks(["x" * 25 + "。"], max_size=10)
+
+    assert [chunk for chunk, _ in chunks] == ["x" * 10, "x" * 10, "x" * 5 + "。"]
+
+
+def test_no_texts_give_no_chunks():
+    assert split_into_chunks([], max_size=10) == []
+    assert split_into_chunks([""], max_size=10) == []
+
+
+def test_scores_are_weighted_by_magnitude():
+    score, magnitude = aggregate_sentiments([(0.8, 3, 100), (-0.5, 1, 1000), (0.0, 0, 5000)])
+
+    assert score == pytest.approx((0.8 * 3 - 0.5 * 1) / 4)
+    assert magnitude == 4
+
+
+def test_neutral_chunks_are_weighted_by_length():
+    score, magnitude = aggregate_sentiments([(0.1, 0, 300), (-0.2, 0, 100)])
+
+    assert score == pytest.approx((0.1 * 300 - 0.2 * 100) / 400)
+    assert magnitude == 0
+
+
+def test_aggregate_of_nothing():
+    assert aggregate_sentiments([]) == (0, 0)
+    assert aggregate_sentiments([(0.5, 0, 0), (0.1, 0, 0)]) == (pytest.approx(0.3), 0)
+
+
+def test_coverage_is_weighted_by_position_ratio():
+    contributions = [dict(coverage=1, position_ratio=10), dict(coverage=0.5, position_ratio=30)]
+
+    assert weighted_coverage(contributions) == pytest.approx(0.625)
+    assert weighted_coverage([]) == 0
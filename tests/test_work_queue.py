@@ -0,0 +1,114 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from work_queue import WorkQueue, task_id  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "work_queue.db"), max_attempts=2, retry_delay=0)
+    yield queue
+    queue.close()
+
+
+def test_enqueue_ignores_queued_tasks(queue):
+    assert queue.enqueue("fund", ["161725", "110011"]) == 2
+    assert queue.enqueue("fund", ["161725", "000001"]) == 1
+    assert queue.pending() == 3
+
+
+def test_lease_takes_each_task_once(queue):
+    queue.enqueue("fund", ["1", "2", "3"])
+    lease_a, tasks_a = queue.lease("a", size=2)
+    lease_b, tasks_b = queue.lease("b", size=2)
+    _, tasks_c = queue.lease("c", size=2)
+    assert [task["key"] for task in tasks_a] == ["1", "2"]
+    assert [task["key"] for task in tasks_b] == ["3"]
+    assert tasks_c == []
+    assert all(task["attempts"] == 1 for task in tasks_a + tasks_b)
+    assert queue.complete(task_id("fund", "1"), lease_a, dict(name="a"))
+    assert not queue.complete(task_id("fund", "1"), lease_a, dict(name="a"))
+    assert queue.results("fund") == {"1": dict(name="a")}
+
+
+def test_lease_filters_kinds_and_shards(queue):
+    queue.enqueue("fund", ["1"])
+    queue.enqueue("stock", ["600519"])
+    _, tasks = queue.lease("a", kinds=["stock"])
+    assert [task["id"] for task in tasks] == ["stock:600519"]
+    _, tasks = queue.lease("a", shards=[])
+    assert tasks == []
+
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.enqueue("fund", ["1"])
+    lease_a, _ = queue.lease("a", duration=-1)
+    lease_b, tasks = queue.lease("b")
+    assert [task["key"] for task in tasks] == ["1"]
+    assert tasks[0]["attempts"] == 2
+    assert queue.renew(lease_a) == 0
+    assert queue.renew(lease_b) == 1
+
+
+def test_late_complete_is_dropped(queue):
+    queue.enqueue("fund", ["1"])
+    lease_a, _ = queue.lease("a", duration=-1)
+    lease_b, _ = queue.lease("b")
+    assert not queue.complete(task_id("fund", "1"), lease_a, "late")
+    assert queue.complete(task_id("fund", "1"), lease_b, "b")
+    assert not queue.complete(task_id("fund", "1"), lease_a, "late")
+    assert queue.results("fund") == {"1": "b"}
+    assert [worker["worker"] for worker in queue.workers()] == ["b"]
+
+
+def test_failed_task_is_retried_until_max_attempts(queue):
+    queue.enqueue("fund", ["1"])
+    for attempt in range(queue.max_attempts):
+        lease_id, tasks = queue.lease("a")
+        assert tasks[0]["attempts"] == attempt + 1
+        assert queue.fail(tasks[0]["id"], lease_id, ConnectionError("timeout"))
+    assert queue.lease("a")[1] == []
+    assert queue.pending() == 0
+    assert queue.failures() == [dict(id="fund:1", attempts=2, error="timeout")]
+    assert queue.retry_failed() == 1
+    assert queue.lease("a")[1][0]["attempts"] == 1
+
+
+def test_expired_lease_fails_task_after_max_attempts(queue):
+    queue.enqueue("fund", ["1"])
+    for _ in range(queue.max_attempts):
+        queue.lease("a", duration=-1)
+    assert queue.status() == [dict(kind="fund", pending=0, leased=0, done=0, failed=1)]
+
+
+def test_failed_task_waits_for_retry_delay(tmp_path):
+    queue = WorkQueue(str(tmp_path / "work_queue.db"), max_attempts=3, retry_delay=60)
+    queue.enqueue("fund", ["1"])
+    lease_id, tasks = queue.lease("a")
+    queue.fail(tasks[0]["id"], lease_id, "error")
+    assert queue.lease("a")[1] == []
+    assert queue.pending() == 1
+    queue.close()
+
+
+def test_release_returns_tasks_without_counting_the_attempt(queue):
+    queue.enqueue("fund", ["1", "2"])
+    lease_id, _ = queue.lease("a")
+    assert queue.complete(task_id("fund", "1"), lease_id, None)
+    assert queue.release(lease_id) == 1
+    _, tasks = queue.lease("b")
+    assert [(task["key"], task["attempts"]) for task in tasks] == [("2", 1)]
+
+
+def test_queue_is_shared_between_connections(queue):
+    other = WorkQueue(queue.path)
+    queue.enqueue("fund", ["1"])
+    lease_id, _ = other.lease("a")
+    assert queue.lease("b")[1] == []
+    assert other.complete(task_id("fund", "1"), lease_id, "a")
+    assert queue.results("fund") == {"1": "a"}
+    other.close()
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+import worker as worker_module
+from work_queue import WorkQueue
+from worker import Worker, parse_shards
+
+
+class FakeQueue:
+    """
+    Answers renewals with the given numbers of tasks still held by the lease, 1 once they run out.
+    """
+    def __init__(self, renewals=(), on_renew=None):
+        self.renewals = list(renewals)
+        self.on_renew = on_renew
+        self.renewed = []
+
+    def renew(self, lease_id):
+        self.renewed.append(lease_id)
+        if self.on_renew is not None:
+            self.on_renew()
+        return self.renewals.pop(0) if self.renewals else 1
+
+
+@pytest.fixture
+def short_leases(monkeypatch):
+    # Renewals every 10ms
+    monkeypatch.setattr(worker_module, "WORK_QUEUE_LEASE_DURATION", 0.03)
+
+
+def start_renewer(worker, lease_id):
+    worker.lease_id = lease_id
+    released = threading.Event()
+    renewer = threading.Thread(target=worker.renew_lease, args=(lease_id, released), daemon=True)
+    renewer.start()
+    return renewer, released
+
+
+def test_parse_shards():
+    assert parse_shards("0-3,8,2") == [0, 1, 2, 3, 8]
+    with pytest.raises(ValueError):
+        parse_shards("15-16")
+
+
+def test_renewals_stop_once_one_fails(short_leases):
+    queue = FakeQueue(renewals=[2, 0])
+    worker = Worker(queue, "a", analysis_config=dict())
+
+    renewer, released = start_renewer(worker, "lease-1")
+    renewer.join(1)
+
+    assert not renewer.is_alive()
+    assert not released.is_set()
+    assert queue.renewed == ["lease-1", "lease-1"]
+
+
+def test_renewals_stop_when_the_worker_moves_to_another_lease(short_leases):
+    worker = Worker(None, "a", analysis_config=dict())
+    queue = FakeQueue(on_renew=lambda: setattr(worker, "lease_id", "lease-2"))
+    worker.queue = queue
+
+    renewer, _ = start_renewer(worker, "lease-1")
+    renewer.join(1)
+
+    assert not renewer.is_alive()
+    assert queue.renewed == ["lease-1"]
+
+
+def test_renewals_stop_when_the_lease_is_released(short_leases):
+    queue = FakeQueue()
+    worker = Worker(queue, "a", analysis_config=dict())
+
+    renewer, released = start_renewer(worker, "lease-1")
+    time.sleep(0.05)
+    released.set()
+    renewer.join(1)
+    renewed = len(queue.renewed)
+    time.sleep(0.05)
+
+    assert not renewer.is_alive()
+    assert renewed > 0
+    assert len(queue.renewed) == renewed
+
+
+class SlowWorker(Worker):
+    def fund(self, task):
+        time.sleep(0.05)
+        return dict(name=task["key"])
+
+
+def test_run_renews_each_lease_only_while_it_is_held(short_leases, tmp_path):
+    queue = WorkQueue(str(tmp_path / "work_queue.db"))
+    queue.enqueue("fund", ["1", "2", "3"])
+    renewed = []
+    renew = queue.renew
+
+    def record_renewal(lease_id):
+        renewed.append(lease_id)
+        return renew(lease_id)
+
+    queue.renew = record_renewal
+    worker = SlowWorker(queue, "a", ["fund"], lease_size=2, analysis_config=dict())
+
+    worker.run()
+    renewals = len(renewed)
+    time.sleep(0.05)
+
+    assert worker.statistics == dict(done=3, failed=0, lost=0)
+    assert queue.results("fund") == {code: dict(name=code) for code in ["1", "2", "3"]}
+    assert len(set(renewed)) == 2
+    assert len(renewed) == renewals
+    queue.close()